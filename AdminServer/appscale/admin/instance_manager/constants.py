@@ -1,7 +1,6 @@
 """ Common constants for managing AppServer instances. """
 
 import os
-import urllib2
 
 from appscale.common.constants import APPSCALE_HOME
 
@@ -16,21 +15,6 @@ class BadConfigurationException(Exception):
     return repr(self.value)
 
 
-class NoRedirection(urllib2.HTTPErrorProcessor):
-  """ A url opener that does not automatically redirect. """
-  def http_response(self, request, response):
-    """ Processes HTTP responses.
-
-    Args:
-      request: An HTTP request object.
-      response: An HTTP response object.
-    Returns:
-      The HTTP response object.
-    """
-    return response
-  https_response = http_response
-
-
 # The location of the API server start script.
 API_SERVER_LOCATION = os.path.join('/', 'opt', 'appscale_api_server', 'bin',
                                    'appscale-api-server')
@@ -99,6 +83,16 @@ MAX_BACKGROUND_WORKERS = 4
 # it receives a shutdown signal.
 MAX_INSTANCE_RESPONSE_TIME = 600
 
+# Environment variables that applications can use to configure the memcache
+# near cache, mapped to the AppServer flags that set them. The near cache runs
+# in the AppServer's API server rather than in the runtime.
+MEMCACHE_NEAR_CACHE_FLAGS = {
+  'APPSCALE_MEMCACHE_NEAR_CACHE_NAMESPACES':
+    '--memcache_near_cache_namespaces',
+  'APPSCALE_MEMCACHE_NEAR_CACHE_MB': '--memcache_near_cache_mb',
+  'APPSCALE_MEMCACHE_NEAR_CACHE_LEASE': '--memcache_near_cache_lease'
+}
+
 # Patterns that match jars that should be copied to version sources.
 MODIFIED_JARS = [
   os.path.join(REPACKED_LIB_DIR, 'user', '*.jar'),
@@ -109,6 +103,9 @@ MODIFIED_JARS = [
 # A prefix added to instance entries to distinguish them from services.
 MONIT_INSTANCE_PREFIX = 'app___'
 
+# The number of seconds to wait for a single health check response.
+PROBE_TIMEOUT = 5
+
 # The script used for starting Python AppServer instances.
 PYTHON_APPSERVER = os.path.join(APPSCALE_HOME, 'AppServer',
                                 'dev_appserver.py')
@@ -7,7 +7,7 @@ from tornado.options import options
 
 from appscale.admin.constants import UNPACK_ROOT
 from appscale.admin.instance_manager.constants import (
-  PHP_CGI_LOCATION, PIDFILE_TEMPLATE, TRUSTED_APPS)
+  MEMCACHE_NEAR_CACHE_FLAGS, PHP_CGI_LOCATION, PIDFILE_TEMPLATE, TRUSTED_APPS)
 from appscale.admin.instance_manager.utils import find_web_inf
 from appscale.common import appscale_info
 from appscale.common.constants import (
@@ -138,8 +138,21 @@ def create_python_app_env(public_ip, app_name):
   return env_vars
 
 
+def memcache_near_cache_flags(env_vars):
+  """ Converts an application's memcache near cache settings to flags.
+
+  Args:
+    env_vars: A dictionary containing the version's environment variables.
+  Returns:
+    A list of AppServer flags.
+  """
+  return ['{}="{}"'.format(flag, env_vars[var])
+          for var, flag in sorted(MEMCACHE_NEAR_CACHE_FLAGS.items())
+          if var in env_vars]
+
+
 def create_python27_start_cmd(app_name, login_ip, port, pidfile, revision_key,
-                              api_server_port):
+                              api_server_port, env_vars=None):
   """ Creates the start command to run the python application server.
 
   Args:
@@ -149,6 +162,7 @@ def create_python27_start_cmd(app_name, login_ip, port, pidfile, revision_key,
     pidfile: A string specifying the pidfile location.
     revision_key: A string specifying the revision key.
     api_server_port: An integer specifying the port of the external API server.
+    env_vars: A dictionary containing the version's environment variables.
   Returns:
     A string of the start command.
   """
@@ -178,6 +192,7 @@ def create_python27_start_cmd(app_name, login_ip, port, pidfile, revision_key,
   if app_name in TRUSTED_APPS:
     cmd.append('--trusted')
 
+  cmd.extend(memcache_near_cache_flags(env_vars or {}))
   return ' '.join(cmd)
 
 
@@ -1,13 +1,13 @@
 """ Fulfills AppServer instance assignments from the scheduler. """
 import logging
-import math
 import json
 import os
 import psutil
 import signal
-import urllib2
+import time
 
 from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPError
 from tornado.ioloop import IOLoop, PeriodicCallback
 from tornado.locks import Lock as AsyncLock
 
@@ -17,7 +17,7 @@ from appscale.admin.instance_manager.constants import (
   BadConfigurationException, DASHBOARD_LOG_SIZE, DASHBOARD_PROJECT_ID,
   DEFAULT_MAX_APPSERVER_MEMORY, FETCH_PATH, GO_SDK, INSTANCE_CLASSES,
   JAVA_APPSERVER_CLASS, MAX_API_SERVER_PORT, MAX_INSTANCE_RESPONSE_TIME,
-  MONIT_INSTANCE_PREFIX, NoRedirection, PIDFILE_TEMPLATE, PYTHON_APPSERVER,
+  MONIT_INSTANCE_PREFIX, PIDFILE_TEMPLATE, PROBE_TIMEOUT, PYTHON_APPSERVER,
   START_APP_TIMEOUT, STARTING_INSTANCE_PORT, VERSION_REGISTRATION_NODE)
 from appscale.admin.instance_manager.instance import (
   create_java_app_env, create_java_start_cmd, create_python_app_env,
@@ -28,7 +28,7 @@ from appscale.admin.instance_manager.utils import setup_logrotate, \
 from appscale.common import appscale_info, monit_app_configuration
 from appscale.common.async_retrying import retry_data_watch_coroutine
 from appscale.common.constants import (
-  APPS_PATH, GO, HTTPCodes, JAVA, MonitStates, PHP, PYTHON27, VAR_DIR,
+  APPS_PATH, GO, JAVA, MonitStates, PHP, PYTHON27, VAR_DIR,
   VERSION_PATH_SEPARATOR)
 from appscale.common.monit_interface import DEFAULT_RETRIES, ProcessNotFound
 from appscale.common.retrying import retry
@@ -118,6 +118,9 @@ class InstanceManager(object):
     self._running_instances = set()
     self._login_server = None
 
+    # Instances that have been started but are not routed yet.
+    self._starting_instances = set()
+
   def start(self):
     """ Begins processes needed to fulfill instance assignments. """
 
@@ -147,6 +150,20 @@ class InstanceManager(object):
       version: A Version object.
       port: An integer specifying a port to use.
     """
+    instance = yield self._launch_instance(version, port)
+    yield self._add_routing(instance)
+
+  @gen.coroutine
+  def _launch_instance(self, version, port):
+    """ Starts a Google App Engine application on this machine without
+        waiting for it to respond.
+
+    Args:
+      version: A Version object.
+      port: An integer specifying a port to use.
+    Returns:
+      An Instance that should be passed to _add_routing.
+    """
     version_details = version.version_details
     runtime = version_details['runtime']
     env_vars = version_details.get('envVariables', {})
@@ -180,7 +197,8 @@ class InstanceManager(object):
         port,
         pidfile,
         version.revision_key,
-        api_server_port)
+        api_server_port,
+        env_vars)
       env_vars.update(create_python_app_env(self._login_server,
                                             version.project_id))
     elif runtime == JAVA:
@@ -238,7 +256,7 @@ class InstanceManager(object):
       '/'.join([VERSION_REGISTRATION_NODE, version.version_key]))
 
     instance = Instance(version.revision_key, port)
-    yield self._add_routing(instance)
+    self._starting_instances.add(instance)
 
     if version.project_id == DASHBOARD_PROJECT_ID:
       log_size = DASHBOARD_LOG_SIZE
@@ -249,6 +267,8 @@ class InstanceManager(object):
       logger.error("Error while setting up log rotation for application: {}".
                     format(version.project_id))
 
+    raise gen.Return(instance)
+
   @gen.coroutine
   def populate_api_servers(self):
     """ Find running API servers. """
@@ -379,19 +399,23 @@ class InstanceManager(object):
     Returns:
       True on success, False otherwise
     """
-    retries = math.ceil(START_APP_TIMEOUT / BACKOFF_TIME)
-
+    deadline = time.time() + START_APP_TIMEOUT
     url = "http://" + self._private_ip + ":" + str(port) + FETCH_PATH
-    while retries > 0:
+    client = AsyncHTTPClient()
+    while time.time() < deadline:
       try:
-        opener = urllib2.build_opener(NoRedirection)
-        response = opener.open(url)
-        if response.code != HTTPCodes.OK:
-          logger.warning('{} returned {}. Headers: {}'.
-                          format(url, response.code, response.headers.headers))
+        yield client.fetch(url, follow_redirects=False,
+                           connect_timeout=PROBE_TIMEOUT,
+                           request_timeout=PROBE_TIMEOUT)
         raise gen.Return(True)
+      except HTTPError as error:
+        # A code of 599 indicates that the instance did not respond.
+        if error.response is not None and error.code != 599:
+          logger.warning('{} returned {}. Headers: {}'.format(
+            url, error.code, error.response.headers))
+          raise gen.Return(True)
       except IOError:
-        retries -= 1
+        pass
 
       yield gen.sleep(BACKOFF_TIME)
 
@@ -407,7 +431,11 @@ class InstanceManager(object):
       instance: An Instance.
     """
     logger.info('Waiting for {}'.format(instance))
-    start_successful = yield self._wait_for_app(instance.port)
+    try:
+      start_successful = yield self._wait_for_app(instance.port)
+    finally:
+      self._starting_instances.discard(instance)
+
     if not start_successful:
       # In case the AppServer fails we let the AppController to detect it
       # and remove it if it still show in monit.
@@ -473,8 +501,10 @@ class InstanceManager(object):
 
     yield self._unmonitor_and_terminate(monit_watch)
 
-    project_instances = [instance_ for instance_ in self._running_instances
-                         if instance_.project_id == instance.project_id]
+    project_instances = [
+      instance_ for instance_ in
+      self._running_instances | self._starting_instances
+      if instance_.project_id == instance.project_id]
     if not project_instances:
       yield self._stop_api_server(instance.project_id)
       remove_logrotate(instance.project_id)
@@ -488,7 +518,8 @@ class InstanceManager(object):
     Returns:
       An integer specifying a free port.
     """
-    existing_ports = {instance.port for instance in self._running_instances}
+    existing_ports = {instance.port for instance in
+                      self._running_instances | self._starting_instances}
     port = STARTING_INSTANCE_PORT
     while True:
       if port in existing_ports:
@@ -501,6 +532,7 @@ class InstanceManager(object):
   def _restart_unrouted_instances(self):
     """ Restarts instances that the router considers offline. """
     with (yield self._work_lock.acquire()):
+      pending_routes = []
       failed_instances = yield self._routing_client.get_failed_instances()
       for version_key, port in failed_instances:
         try:
@@ -522,7 +554,11 @@ class InstanceManager(object):
 
         logger.warning('Restarting failed instance: {}'.format(instance))
         yield self._stop_app_instance(instance)
-        yield self._start_instance(version, instance.port)
+        new_instance = yield self._launch_instance(version, instance.port)
+        pending_routes.append(self._add_routing(new_instance))
+
+      # Wait for the new instances to come up together.
+      yield pending_routes
 
   @gen.coroutine
   def _ensure_health(self):
@@ -544,6 +580,8 @@ class InstanceManager(object):
       return
 
     with (yield self._work_lock.acquire()):
+      pending_routes = []
+
       # Stop versions that aren't assigned.
       to_stop = [instance for instance in self._running_instances
                  if instance.version_key not in self._assignments]
@@ -580,7 +618,8 @@ class InstanceManager(object):
                          if instance.version_key == version_key]
         for port in assigned_ports:
           if port != -1 and port not in running_ports:
-            yield self._start_instance(version, port)
+            instance = yield self._launch_instance(version, port)
+            pending_routes.append(self._add_routing(instance))
 
         # Start new assignments that don't have a match.
         candidates = [instance for instance in self._running_instances
@@ -588,12 +627,19 @@ class InstanceManager(object):
                       and instance.port not in assigned_ports]
         to_start = max(new_assignment_count - len(candidates), 0)
         for _ in range(to_start):
-          yield self._start_instance(version, self._get_lowest_port())
+          instance = yield self._launch_instance(version,
+                                                 self._get_lowest_port())
+          pending_routes.append(self._add_routing(instance))
+
+      # Wait for the new instances to come up together.
+      yield pending_routes
 
   @gen.coroutine
   def _enforce_instance_details(self):
     """ Ensures all running instances are configured correctly. """
     with (yield self._work_lock.acquire()):
+      pending_routes = []
+
       # Restart instances with an outdated revision or login server.
       for instance in self._running_instances:
         try:
@@ -610,7 +656,11 @@ class InstanceManager(object):
             login_server_changed):
           logger.info('Configuration changed for {}'.format(instance))
           yield self._stop_app_instance(instance)
-          yield self._start_instance(version, instance.port)
+          new_instance = yield self._launch_instance(version, instance.port)
+          pending_routes.append(self._add_routing(new_instance))
+
+      # Wait for the new instances to come up together.
+      yield pending_routes
 
   def _assignments_from_state(self, controller_state):
     """ Extracts the current machine's assignments from controller state.
@@ -0,0 +1,132 @@
+""" Measures how quickly the InstanceManager can bring up many instances.
+
+Each simulated instance is a local HTTP server that starts listening a fixed
+time after it is launched. The "sequential" mode waits for each instance to
+respond before launching the next one, which is how instance starts used to
+be handled. The "parallel" mode launches every instance and then probes them
+together. The largest delay seen by a 10ms IOLoop callback is also reported
+to show that probing does not block the loop.
+"""
+import argparse
+import threading
+import time
+
+from tornado import gen, web
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from appscale.admin.instance_manager import (
+  instance_manager as instance_manager_module)
+from appscale.admin.instance_manager import InstanceManager
+from appscale.admin.instance_manager.constants import FETCH_PATH
+
+
+class HealthCheckHandler(web.RequestHandler):
+  def get(self):
+    self.write('ok')
+
+
+class FakeInstances(object):
+  """ Runs simulated instances on a separate IOLoop. """
+  def __init__(self, boot_time):
+    self.boot_time = boot_time
+    self.servers = []
+    self.io_loop = None
+    ready = threading.Event()
+
+    def run():
+      self.io_loop = IOLoop()
+      self.io_loop.make_current()
+      ready.set()
+      self.io_loop.start()
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    ready.wait()
+
+  def launch(self, port):
+    self.io_loop.add_callback(
+      lambda: self.io_loop.call_later(self.boot_time, self._listen, port))
+
+  def stop_all(self):
+    def stop():
+      for server in self.servers:
+        server.stop()
+
+      del self.servers[:]
+
+    self.io_loop.add_callback(stop)
+
+  def _listen(self, port):
+    server = HTTPServer(web.Application([(FETCH_PATH, HealthCheckHandler)]))
+    server.listen(port, address='127.0.0.1')
+    self.servers.append(server)
+
+
+@gen.coroutine
+def measure(instance_count, fake_instances, first_port, parallel):
+  """ Returns the instances started per second and the largest loop lag. """
+  manager = InstanceManager(None, None, None, None, None, None, None, None,
+                            '127.0.0.1')
+  ports = range(first_port, first_port + instance_count)
+  lag = [0, time.time()]
+
+  def check_lag():
+    now = time.time()
+    lag[0] = max(lag[0], now - lag[1])
+    lag[1] = now
+
+  lag_checker = PeriodicCallback(check_lag, 10)
+  lag_checker.start()
+  start = time.time()
+  if parallel:
+    for port in ports:
+      fake_instances.launch(port)
+
+    results = yield [manager._wait_for_app(port) for port in ports]
+  else:
+    results = []
+    for port in ports:
+      fake_instances.launch(port)
+      result = yield manager._wait_for_app(port)
+      results.append(result)
+
+  duration = time.time() - start
+  lag_checker.stop()
+  fake_instances.stop_all()
+  assert all(results)
+  raise gen.Return((instance_count / duration, lag[0]))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--boot-time', type=float, default=0.5,
+                      help='Seconds before an instance accepts requests')
+  parser.add_argument('--backoff', type=float, default=0.1,
+                      help='Seconds to wait between probes')
+  parser.add_argument('--first-port', type=int, default=31000)
+  parser.add_argument('--instances', type=int, nargs='+',
+                      default=[1, 5, 10, 25])
+  args = parser.parse_args()
+
+  instance_manager_module.BACKOFF_TIME = args.backoff
+  fake_instances = FakeInstances(args.boot_time)
+
+  print('{:>10} {:>16} {:>16} {:>10}'.format(
+    'instances', 'sequential i/s', 'parallel i/s', 'max lag'))
+  first_port = args.first_port
+  for instance_count in args.instances:
+    results = []
+    for parallel in (False, True):
+      results.append(IOLoop.current().run_sync(lambda: measure(
+        instance_count, fake_instances, first_port, parallel)))
+      first_port += instance_count
+
+    max_lag = max(lag for _, lag in results)
+    print('{:>10} {:>16.2f} {:>16.2f} {:>9.0f}ms'.format(
+      instance_count, results[0][0], results[1][0], max_lag * 1000))
+
+
+if __name__ == '__main__':
+  main()
@@ -3,7 +3,6 @@
 import os
 import subprocess
 import unittest
-import urllib2
 
 from flexmock import flexmock
 from tornado import gen
@@ -229,6 +228,18 @@ class TestInstanceManager(AsyncTestCase):
     assert 'appscale' in env_vars['APPSCALE_HOME']
     assert 0 < int(env_vars['GOMAXPROCS'])
 
+  def test_create_python27_start_cmd(self):
+    env_vars = {'APPSCALE_MEMCACHE_NEAR_CACHE_NAMESPACES': ',hot',
+                'APPSCALE_MEMCACHE_NEAR_CACHE_MB': '32',
+                'OTHER': 'value'}
+    cmd = instance.create_python27_start_cmd(
+      'testapp', '127.0.0.1', 20000, 'testpid', 'testapp_default_v1', 19999,
+      env_vars)
+    assert '--memcache_near_cache_namespaces=",hot"' in cmd
+    assert '--memcache_near_cache_mb="32"' in cmd
+    assert '--memcache_near_cache_lease' not in cmd
+    assert 'OTHER' not in cmd
+
   def test_create_java_app_env(self):
     deployment_config = flexmock(get_config=lambda x: {})
     env_vars = instance.create_java_app_env(deployment_config)
@@ -310,9 +321,11 @@ class TestInstanceManager(AsyncTestCase):
     port = 20000
     ip = '127.0.0.1'
     testing.disable_logging()
-    fake_opener = flexmock(
-      open=lambda opener: flexmock(code=200, headers=flexmock(headers=[])))
-    flexmock(urllib2).should_receive('build_opener').and_return(fake_opener)
+    response = Future()
+    response.set_result(flexmock(code=200))
+    fake_client = flexmock(fetch=lambda url, **kwargs: response)
+    flexmock(instance_manager_module).should_receive('AsyncHTTPClient').\
+      and_return(fake_client)
     flexmock(appscale_info).should_receive('get_private_ip').and_return(ip)
 
     instance_manager = InstanceManager(
@@ -321,12 +334,34 @@ class TestInstanceManager(AsyncTestCase):
     instance_started = yield instance_manager._wait_for_app(port)
     self.assertEqual(True, instance_started)
 
-    response = Future()
-    response.set_result(None)
-    flexmock(gen).should_receive('sleep').and_return(response)
-    fake_opener.should_receive('open').and_raise(IOError)
+    # Any HTTP response means that the instance is up.
+    fake_client.should_receive('fetch').\
+      and_raise(HTTPError(500, response=flexmock(headers={})))
+    instance_started = yield instance_manager._wait_for_app(port)
+    self.assertEqual(True, instance_started)
+
+    sleep_response = Future()
+    sleep_response.set_result(None)
+    flexmock(gen).should_receive('sleep').and_return(sleep_response)
+    flexmock(instance_manager_module, START_APP_TIMEOUT=0.1)
+    fake_client.should_receive('fetch').and_raise(HTTPError(599))
     instance_started = yield instance_manager._wait_for_app(port)
     self.assertEqual(False, instance_started)
 
+    fake_client.should_receive('fetch').and_raise(IOError)
+    instance_started = yield instance_manager._wait_for_app(port)
+    self.assertEqual(False, instance_started)
+
+  def test_get_lowest_port(self):
+    instance_manager = InstanceManager(
+      None, None, None, None, None, None, None, None, None)
+    instance_manager._running_instances = {
+      instance.Instance('test_default_v1_revid', 20000)}
+    instance_manager._starting_instances = {
+      instance.Instance('test_default_v1_revid', 20001)}
+
+    # Ports of instances that are still starting are not reused.
+    self.assertEqual(instance_manager._get_lowest_port(), 20002)
+
 if __name__ == "__main__":
   unittest.main()
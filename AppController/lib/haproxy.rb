@@ -169,6 +169,13 @@ module HAProxy
       config << "\n  timeout server #{ALB_SERVER_TIMEOUT}\n"
     end
 
+    # API clients keep their connections to these services alive. Closing
+    # the server side after each response keeps every request balanced and
+    # counted against the server's maxconn.
+    if [TaskQueue::NAME, DatastoreServer::NAME].include?(name)
+      config << "\n  option http-server-close\n"
+    end
+
     # Let's overwrite configuration for 'name' only if anything changed.
     current = ''
     current = File.read(config_path) if File.exists?(config_path)
@@ -4,7 +4,9 @@
  Cassandra Interface for AppScale
 """
 import datetime
+import itertools
 import logging
+import operator
 import struct
 import sys
 import time
@@ -19,7 +21,6 @@ from cassandra.cluster import Cluster
 from cassandra.query import BatchStatement
 from cassandra.query import ConsistencyLevel
 from cassandra.query import SimpleStatement
-from cassandra.query import ValueSequence
 from tornado import gen
 
 from appscale.datastore import dbconstants
@@ -48,9 +49,15 @@ from google.appengine.datastore import entity_pb
 # The directory Cassandra is installed to.
 CASSANDRA_INSTALL_DIR = '/opt/cassandra'
 
-# The maximum amount of entities to fetch concurrently.
+# The maximum amount of entities to fetch in a single request.
 ENTITY_FETCH_THRESHOLD = 100
 
+# The default number of entity fetch requests to keep in flight at once.
+FETCH_CONCURRENCY = 10
+
+# The default number of keys to fetch per page when iterating over a range.
+RANGE_PAGE_SIZE = 1000
+
 # Full path for the nodetool binary.
 NODE_TOOL = '{}/cassandra/bin/nodetool'.format(CASSANDRA_INSTALL_DIR)
 
@@ -123,10 +130,20 @@ class DatastoreProxy(AppDBInterface):
   """
     Cassandra implementation of the AppDBInterface
   """
-  def __init__(self, log_level=logging.INFO, hosts=None):
+  def __init__(self, log_level=logging.INFO, hosts=None,
+               fetch_concurrency=FETCH_CONCURRENCY):
     """
     Constructor.
+
+    Args:
+      log_level: The logging level to use.
+      hosts: A list of Cassandra hosts to connect to.
+      fetch_concurrency: An integer specifying the maximum number of entity
+        fetch requests to keep in flight for a single batch_get_entity call.
     """
+    if fetch_concurrency < 1:
+      raise ValueError('fetch_concurrency must be at least 1')
+
     class_name = self.__class__.__name__
     self.logger = logging.getLogger(class_name)
     self.logger.setLevel(log_level)
@@ -153,6 +170,9 @@ class DatastoreProxy(AppDBInterface):
 
     self.session.default_consistency_level = ConsistencyLevel.QUORUM
     self.prepared_statements = {}
+    self.statement_cache_hits = 0
+    self.statement_cache_misses = 0
+    self.fetch_concurrency = fetch_concurrency
 
     # Provide synchronous version of some async methods
     self.batch_get_entity_sync = tornado_synchronous(self.batch_get_entity)
@@ -191,42 +211,40 @@ class DatastoreProxy(AppDBInterface):
 
     row_keys_bytes = [bytearray(row_key) for row_key in row_keys]
 
-    statement = 'SELECT * FROM "{table}" '\
-                'WHERE {key} IN %s and {column} IN %s'.format(
-                  table=table_name,
-                  key=ThriftColumn.KEY,
-                  column=ThriftColumn.COLUMN_NAME,
-                )
-    query = SimpleStatement(statement, retry_policy=BASIC_RETRIES)
+    query = self.prepare_select(table_name)
 
-    results = []
     # Split the rows up into chunks to reduce the likelihood of timeouts.
-    chunk_indexes = [
-      (n, n + ENTITY_FETCH_THRESHOLD)
-      for n in xrange(0, len(row_keys_bytes), ENTITY_FETCH_THRESHOLD)]
-
-    # TODO: This can be made more efficient by maintaining a constant number
-    # of concurrent requests rather than waiting for each batch to complete.
-    for start, end in chunk_indexes:
-      parameters = (ValueSequence(row_keys_bytes[start:end]),
-                    ValueSequence(column_names))
-      try:
-        batch_results = yield self.tornado_cassandra.execute(
-          query, parameters=parameters)
-      except dbconstants.TRANSIENT_CASSANDRA_ERRORS:
-        message = 'Exception during batch_get_entity'
-        logger.exception(message)
-        raise AppScaleDBConnectionError(message)
-
-      results.extend(list(batch_results))
+    chunks = iter([
+      row_keys_bytes[n:n + ENTITY_FETCH_THRESHOLD]
+      for n in xrange(0, len(row_keys_bytes), ENTITY_FETCH_THRESHOLD)])
+    chunk_count = ((len(row_keys_bytes) + ENTITY_FETCH_THRESHOLD - 1) /
+                   ENTITY_FETCH_THRESHOLD)
+    worker_count = min(self.fetch_concurrency, chunk_count)
 
     results_dict = {row_key: {} for row_key in row_keys}
-    for (key, column, value) in results:
-      if key not in results_dict:
-        results_dict[key] = {}
-
-      results_dict[key][column] = value
 
+    @gen.coroutine
+    def fetch_chunks():
+      """ Fetches chunks until none remain, keeping one request in flight. """
+      # Each worker pulls from the shared iterator, so at most worker_count
+      # requests are pending at any time.
+      for chunk in chunks:
+        parameters = (chunk, column_names)
+        try:
+          batch_results = yield self.tornado_cassandra.execute(
+            query, parameters=parameters)
+        except dbconstants.TRANSIENT_CASSANDRA_ERRORS:
+          message = 'Exception during batch_get_entity'
+          logger.exception(message)
+          raise AppScaleDBConnectionError(message)
+
+        for (key, column, value) in batch_results:
+          if key not in results_dict:
+            results_dict[key] = {}
+
+          results_dict[key][column] = value
+
+    yield [fetch_chunks() for _ in xrange(worker_count)]
     raise gen.Return(results_dict)
 
   @gen.coroutine
@@ -257,18 +275,7 @@ class DatastoreProxy(AppDBInterface):
     if not isinstance(cell_values, dict):
       raise TypeError("Expected a dict")
 
-    insert_str = (
-      'INSERT INTO "{table}" ({key}, {column}, {value}) '
-      'VALUES (?, ?, ?)'
-    ).format(table=table_name,
-               key=ThriftColumn.KEY,
-               column=ThriftColumn.COLUMN_NAME,
-               value=ThriftColumn.VALUE)
-
-    if ttl is not None:
-      insert_str += 'USING TTL {}'.format(ttl)
-
-    statement = self.session.prepare(insert_str)
+    statement = self.prepare_put(table_name, ttl)
 
     statements_and_params = []
     for row_key in row_keys:
@@ -287,6 +294,136 @@ class DatastoreProxy(AppDBInterface):
       logger.exception(message)
       raise AppScaleDBConnectionError(message)
 
+  def prepare_statement(self, statement):
+    """ Fetch a prepared statement, preparing it on first use.
+
+    Args:
+      statement: A string containing a CQL statement.
+    Returns:
+      A PreparedStatement object.
+    """
+    try:
+      prepared = self.prepared_statements[statement]
+    except KeyError:
+      self.statement_cache_misses += 1
+      prepared = self.session.prepare(statement)
+      self.prepared_statements[statement] = prepared
+      return prepared
+
+    self.statement_cache_hits += 1
+    return prepared
+
+  def statement_cache_stats(self):
+    """ Summarize how well the prepared statement cache is performing.
+
+    Returns:
+      A dictionary containing statement cache hits, misses, and size.
+    """
+    return {'hits': self.statement_cache_hits,
+            'misses': self.statement_cache_misses,
+            'statements': len(self.prepared_statements)}
+
+  def clear_statement_cache_stats(self):
+    """ Reset the prepared statement cache counters. """
+    self.statement_cache_hits = 0
+    self.statement_cache_misses = 0
+
+  def prepare_select(self, table):
+    """ Prepare a statement that fetches columns for a list of keys.
+
+    Args:
+      table: A string containing the table name.
+    Returns:
+      A PreparedStatement object.
+    """
+    statement = (
+      'SELECT * FROM "{table}" '
+      'WHERE {key} IN ? and {column} IN ?'
+    ).format(table=table,
+             key=ThriftColumn.KEY,
+             column=ThriftColumn.COLUMN_NAME)
+
+    return self.prepare_statement(statement)
+
+  def prepare_range(self, table, start_inclusive, end_inclusive, limited):
+    """ Prepare a statement that fetches a range of keys.
+
+    Args:
+      table: A string containing the table name.
+      start_inclusive: A boolean specifying that the start key is included.
+      end_inclusive: A boolean specifying that the end key is included.
+      limited: A boolean specifying that the statement takes a limit.
+    Returns:
+      A PreparedStatement object.
+    """
+    statement = (
+      'SELECT * FROM "{table}" WHERE '
+      'token({key}) {gt_compare} ? AND '
+      'token({key}) {lt_compare} ? AND '
+      '{column} IN ? '
+      '{limit}'
+      'ALLOW FILTERING'
+    ).format(table=table,
+             key=ThriftColumn.KEY,
+             gt_compare='>=' if start_inclusive else '>',
+             lt_compare='<=' if end_inclusive else '<',
+             column=ThriftColumn.COLUMN_NAME,
+             limit='LIMIT ? ' if limited else '')
+
+    return self.prepare_statement(statement)
+
+  def prepare_put(self, table, ttl=None):
+    """ Prepare an insert statement that uses the current time.
+
+    Args:
+      table: A string containing the table name.
+      ttl: The number of seconds to keep the row.
+    Returns:
+      A PreparedStatement object.
+    """
+    statement = (
+      'INSERT INTO "{table}" ({key}, {column}, {value}) '
+      'VALUES (?, ?, ?)'
+    ).format(table=table,
+             key=ThriftColumn.KEY,
+             column=ThriftColumn.COLUMN_NAME,
+             value=ThriftColumn.VALUE)
+
+    if ttl is not None:
+      statement += ' USING TTL {}'.format(ttl)
+
+    return self.prepare_statement(statement)
+
+  def prepare_group_update(self):
+    """ Prepare a statement that records the latest update to a group.
+
+    Returns:
+      A PreparedStatement object.
+    """
+    return self.prepare_statement(
+      'INSERT INTO group_updates (group, last_update) '
+      'VALUES (?, ?) '
+      'USING TIMESTAMP ?'
+    )
+
+  def prepare_transaction_insert(self, columns):
+    """ Prepare a statement that adds a row to the transactions table.
+
+    Args:
+      columns: A tuple of strings specifying the columns to populate.
+    Returns:
+      A PreparedStatement object.
+    """
+    statement = (
+      'INSERT INTO transactions ({columns}) '
+      'VALUES ({markers}) '
+      'USING TTL {ttl}'
+    ).format(columns=', '.join(columns),
+             markers=', '.join('?' for _ in columns),
+             ttl=dbconstants.MAX_TX_DURATION * 2)
+
+    return self.prepare_statement(statement)
+
   def prepare_insert(self, table):
     """ Prepare an insert statement.
 
@@ -304,10 +441,7 @@ class DatastoreProxy(AppDBInterface):
                column=ThriftColumn.COLUMN_NAME,
                value=ThriftColumn.VALUE)
 
-    if statement not in self.prepared_statements:
-      self.prepared_statements[statement] = self.session.prepare(statement)
-
-    return self.prepared_statements[statement]
+    return self.prepare_statement(statement)
 
   def prepare_delete(self, table):
     """ Prepare a delete statement.
@@ -323,10 +457,7 @@ class DatastoreProxy(AppDBInterface):
       'WHERE {key} = ?'
     ).format(table=table, key=ThriftColumn.KEY)
 
-    if statement not in self.prepared_statements:
-      self.prepared_statements[statement] = self.session.prepare(statement)
-
-    return self.prepared_statements[statement]
+    return self.prepare_statement(statement)
 
   @gen.coroutine
   def normal_batch(self, mutations, txid):
@@ -344,15 +475,9 @@ class DatastoreProxy(AppDBInterface):
       table = mutation['table']
 
       if table == 'group_updates':
-        key = mutation['key']
-        insert = (
-          'INSERT INTO group_updates (group, last_update) '
-          'VALUES (%(group)s, %(last_update)s) '
-          'USING TIMESTAMP %(timestamp)s'
-        )
-        parameters = {'group': key, 'last_update': mutation['last_update'],
-                      'timestamp': get_write_time(txid)}
-        batch.add(insert, parameters)
+        parameters = (bytearray(mutation['key']), mutation['last_update'],
+                      get_write_time(txid))
+        batch.add(self.prepare_group_update(), parameters)
         continue
 
       if mutation['operation'] == Operations.PUT:
@@ -395,15 +520,10 @@ class DatastoreProxy(AppDBInterface):
       table = mutation['table']
 
       if table == 'group_updates':
-        key = mutation['key']
-        insert = (
-          'INSERT INTO group_updates (group, last_update) '
-          'VALUES (%(group)s, %(last_update)s) '
-          'USING TIMESTAMP %(timestamp)s'
-        )
-        parameters = {'group': key, 'last_update': mutation['last_update'],
-                      'timestamp': get_write_time(txid)}
-        statements_and_params.append((SimpleStatement(insert), parameters))
+        parameters = (bytearray(mutation['key']), mutation['last_update'],
+                      get_write_time(txid))
+        statements_and_params.append(
+          (self.prepare_group_update(), parameters))
         continue
 
       if mutation['operation'] == Operations.PUT:
@@ -464,7 +584,7 @@ class DatastoreProxy(AppDBInterface):
       '                     path, old_value, new_value) '
       'VALUES (?, ?, ?, ?, ?, ?)'
     )
-    insert_statement = self.session.prepare(insert_item)
+    insert_statement = self.prepare_statement(insert_item)
 
     statements_and_params = []
     for entity_change in entity_changes:
@@ -545,13 +665,13 @@ class DatastoreProxy(AppDBInterface):
 
     row_keys_bytes = [bytearray(row_key) for row_key in row_keys]
 
-    statement = 'DELETE FROM "{table}" WHERE {key} IN %s'.\
+    statement = 'DELETE FROM "{table}" WHERE {key} IN ?'.\
       format(
         table=table_name,
         key=ThriftColumn.KEY
       )
-    query = SimpleStatement(statement, retry_policy=BASIC_RETRIES)
-    parameters = (ValueSequence(row_keys_bytes),)
+    query = self.prepare_statement(statement)
+    parameters = (row_keys_bytes,)
 
     try:
       yield self.tornado_cassandra.execute(query, parameters=parameters)
@@ -675,37 +795,11 @@ class DatastoreProxy(AppDBInterface):
     if not isinstance(offset, (int, long)):
       raise TypeError('offset must be int or long')
 
-    if start_inclusive:
-      gt_compare = '>='
-    else:
-      gt_compare = '>'
-
-    if end_inclusive:
-      lt_compare = '<='
-    else:
-      lt_compare = '<'
-
-    query_limit = ''
+    query = self.prepare_range(table_name, start_inclusive, end_inclusive,
+                               limited=limit is not None)
+    parameters = (bytearray(start_key), bytearray(end_key), column_names)
     if limit is not None:
-      query_limit = 'LIMIT {}'.format(len(column_names) * limit)
-
-    statement = (
-      'SELECT * FROM "{table}" WHERE '
-      'token({key}) {gt_compare} %s AND '
-      'token({key}) {lt_compare} %s AND '
-      '{column} IN %s '
-      '{limit} '
-      'ALLOW FILTERING'
-    ).format(table=table_name,
-             key=ThriftColumn.KEY,
-             gt_compare=gt_compare,
-             lt_compare=lt_compare,
-             column=ThriftColumn.COLUMN_NAME,
-             limit=query_limit)
-
-    query = SimpleStatement(statement, retry_policy=BASIC_RETRIES)
-    parameters = (bytearray(start_key), bytearray(end_key),
-                  ValueSequence(column_names))
+      parameters += (len(column_names) * limit,)
 
     try:
       results = yield self.tornado_cassandra.execute(
@@ -734,6 +828,87 @@ class DatastoreProxy(AppDBInterface):
       logger.exception(message)
       raise AppScaleDBConnectionError(message)
 
+  def range_query_iter(self, table_name, column_names, start_key, end_key,
+                       offset=0, limit=None, start_inclusive=True,
+                       end_inclusive=True, keys_only=False,
+                       page_size=RANGE_PAGE_SIZE):
+    """ Iterates over a range of keys without holding the range in memory.
+
+    Results are fetched a page at a time using the driver's paging state, and
+    rows are grouped by key as they arrive. Offset keys are skipped as they
+    are read rather than collected and sliced off.
+
+    Args:
+      table_name: Name of table to access
+      column_names: Columns which get returned within the key range
+      start_key: String for which the query starts at
+      end_key: String for which the query ends at
+      offset: The number of keys to skip
+      limit: Maximum number of keys to yield
+      start_inclusive: Boolean if results should include the start_key
+      end_inclusive: Boolean if results should include the end_key
+      keys_only: Boolean if to only yield keys and not values
+      page_size: The number of keys to request per page
+    Yields:
+      Dictionaries of key=>columns/values in key order, or keys if keys_only
+      is set.
+    Raises:
+      TypeError: If an argument passed in was not of the expected type.
+      AppScaleDBConnectionError: If a page could not be fetched due to an
+        error with Cassandra.
+    """
+    if not isinstance(table_name, str):
+      raise TypeError('table_name must be a string')
+    if not isinstance(column_names, list):
+      raise TypeError('column_names must be a list')
+    if not isinstance(start_key, str):
+      raise TypeError('start_key must be a string')
+    if not isinstance(end_key, str):
+      raise TypeError('end_key must be a string')
+    if not isinstance(limit, (int, long)) and limit is not None:
+      raise TypeError('limit must be int, long, or NoneType')
+    if not isinstance(offset, (int, long)):
+      raise TypeError('offset must be int or long')
+
+    query = self.prepare_range(table_name, start_inclusive, end_inclusive,
+                               limited=False)
+    statement = query.bind(
+      (bytearray(start_key), bytearray(end_key), column_names))
+    statement.fetch_size = page_size * len(column_names)
+
+    def fetch_rows():
+      """ Yields rows from each page, fetching the next page on demand. """
+      paging_state = None
+      while True:
+        try:
+          results = self.session.execute(statement, paging_state=paging_state)
+        except dbconstants.TRANSIENT_CASSANDRA_ERRORS:
+          message = 'Exception during range_query_iter'
+          logger.exception(message)
+          raise AppScaleDBConnectionError(message)
+
+        for row in results.current_rows:
+          yield row
+
+        paging_state = results.paging_state
+        if paging_state is None:
+          return
+
+    keys_read = 0
+    for key, rows in itertools.groupby(fetch_rows(),
+                                       key=operator.itemgetter(0)):
+      keys_read += 1
+      if keys_read <= offset:
+        continue
+
+      if keys_only:
+        yield key
+      else:
+        yield {key: {column: value for _, column, value in rows}}
+
+      if limit is not None and keys_read - offset >= limit:
+        return
+
   @gen.coroutine
   def get_metadata(self, key):
     """ Retrieve a value from the datastore metadata table.
@@ -830,7 +1005,8 @@ class DatastoreProxy(AppDBInterface):
     Returns:
       A set of integers specifying transaction IDs.
     """
-    query = 'SELECT * FROM group_updates WHERE group=%s'
+    query = self.prepare_statement(
+      'SELECT * FROM group_updates WHERE group = ?')
     results = yield [
       self.tornado_cassandra.execute(query, [bytearray(group)])
       for group in groups
@@ -838,6 +1014,33 @@ class DatastoreProxy(AppDBInterface):
     updates = set(rows[0].last_update for rows in results if rows)
     raise gen.Return(updates)
 
+  @gen.coroutine
+  def group_versions(self, groups):
+    """ Fetch the latest transaction ID for each group.
+
+    Args:
+      groups: An interable containing encoded Reference objects.
+    Returns:
+      A dictionary mapping encoded groups to transaction IDs. Groups that
+      have never been written are omitted.
+    """
+    groups = list(groups)
+    if not groups:
+      raise gen.Return({})
+
+    query = self.prepare_statement(
+      'SELECT group, last_update FROM group_updates WHERE group IN ?')
+    parameters = ([bytearray(group) for group in groups],)
+    try:
+      results = yield self.tornado_cassandra.execute(
+        query, parameters=parameters)
+    except dbconstants.TRANSIENT_CASSANDRA_ERRORS:
+      message = 'Exception while fetching group versions'
+      logger.exception(message)
+      raise AppScaleDBConnectionError(message)
+
+    raise gen.Return({str(row.group): row.last_update for row in results})
+
   @gen.coroutine
   def start_transaction(self, app, txid, is_xg, in_progress):
     """ Persist transaction metadata.
@@ -887,11 +1090,8 @@ class DatastoreProxy(AppDBInterface):
     """
     batch = BatchStatement(consistency_level=ConsistencyLevel.QUORUM,
                            retry_policy=BASIC_RETRIES)
-    insert = self.session.prepare("""
-      INSERT INTO transactions (txid_hash, operation, namespace, path, entity)
-      VALUES (?, ?, ?, ?, ?)
-      USING TTL {ttl}
-    """.format(ttl=dbconstants.MAX_TX_DURATION * 2))
+    insert = self.prepare_transaction_insert(
+      ('txid_hash', 'operation', 'namespace', 'path', 'entity'))
 
     for entity in entities:
       args = (tx_partition(app, txid),
@@ -919,11 +1119,8 @@ class DatastoreProxy(AppDBInterface):
     """
     batch = BatchStatement(consistency_level=ConsistencyLevel.QUORUM,
                            retry_policy=BASIC_RETRIES)
-    insert = self.session.prepare("""
-      INSERT INTO transactions (txid_hash, operation, namespace, path, entity)
-      VALUES (?, ?, ?, ?, ?)
-      USING TTL {ttl}
-    """.format(ttl=dbconstants.MAX_TX_DURATION * 2))
+    insert = self.prepare_transaction_insert(
+      ('txid_hash', 'operation', 'namespace', 'path', 'entity'))
 
     for key in entity_keys:
       # The None value overwrites previous puts.
@@ -979,12 +1176,8 @@ class DatastoreProxy(AppDBInterface):
     """
     batch = BatchStatement(consistency_level=ConsistencyLevel.QUORUM,
                            retry_policy=BASIC_RETRIES)
-    query_str = (
-      'INSERT INTO transactions (txid_hash, operation, namespace, path, task) '
-      'VALUES (?, ?, ?, ?, ?) '
-      'USING TTL {ttl}'
-    ).format(ttl=dbconstants.MAX_TX_DURATION * 2)
-    insert = self.session.prepare(query_str)
+    insert = self.prepare_transaction_insert(
+      ('txid_hash', 'operation', 'namespace', 'path', 'task'))
 
     for task in tasks:
       task.clear_transaction()
@@ -1018,11 +1211,8 @@ class DatastoreProxy(AppDBInterface):
     """
     batch = BatchStatement(consistency_level=ConsistencyLevel.QUORUM,
                            retry_policy=BASIC_RETRIES)
-    insert = self.session.prepare("""
-      INSERT INTO transactions (txid_hash, operation, namespace, path)
-      VALUES (?, ?, ?, ?)
-      USING TTL {ttl}
-    """.format(ttl=dbconstants.MAX_TX_DURATION * 2))
+    insert = self.prepare_transaction_insert(
+      ('txid_hash', 'operation', 'namespace', 'path'))
 
     for group_key in group_keys:
       if not isinstance(group_key, entity_pb.Reference):
@@ -4,13 +4,11 @@ from .. import helper_functions
 from ..dbconstants import Operations
 from ..utils import (
   clean_app_id,
-  encode_index_pb,
-  get_composite_index_keys,
   get_composite_indexes_rows,
-  get_entity_key,
   get_entity_kind,
   get_index_kv_from_tuple,
-  get_kind_key
+  get_kind_key,
+  IndexValueMemo
 )
 
 
@@ -24,29 +22,31 @@ def deletions_for_entity(entity, composite_indices=()):
     A list of dictionaries representing mutation operations.
   """
   deletions = []
+  memo = IndexValueMemo()
   app_id = clean_app_id(entity.key().app())
   namespace = entity.key().name_space()
   prefix = dbconstants.KEY_DELIMITER.join([app_id, namespace])
 
-  asc_rows = get_index_kv_from_tuple([(prefix, entity)])
+  asc_rows = get_index_kv_from_tuple([(prefix, entity)], memo=memo)
   for entry in asc_rows:
     deletions.append({'table': dbconstants.ASC_PROPERTY_TABLE,
                       'key': entry[0],
                       'operation': Operations.DELETE})
 
   dsc_rows = get_index_kv_from_tuple(
-    [(prefix, entity)], reverse=True)
+    [(prefix, entity)], reverse=True, memo=memo)
   for entry in dsc_rows:
     deletions.append({'table': dbconstants.DSC_PROPERTY_TABLE,
                       'key': entry[0],
                       'operation': Operations.DELETE})
 
-  for key in get_composite_indexes_rows([entity], composite_indices):
+  for key in get_composite_indexes_rows([entity], composite_indices, memo):
     deletions.append({'table': dbconstants.COMPOSITE_TABLE,
                       'key': key,
                       'operation': Operations.DELETE})
 
-  entity_key = get_entity_key(prefix, entity.key().path())
+  entity_key = dbconstants.KEY_DELIMITER.join(
+    [prefix, memo.encode(entity.key().path())])
   deletions.append({'table': dbconstants.APP_ENTITY_TABLE,
                     'key': entity_key,
                     'operation': Operations.DELETE})
@@ -59,55 +59,73 @@ def deletions_for_entity(entity, composite_indices=()):
   return deletions
 
 
-def index_deletions(old_entity, new_entity, composite_indices=()):
-  """ Get a list of index deletions needed for updating an entity. For changing
-  an existing entity, this involves examining the property list of both
-  entities to see which index entries need to be removed.
+def _property_index_keys(entity, memo):
+  """ Builds the single-property index keys for an entity.
+
+  Args:
+    entity: An entity object.
+    memo: An IndexValueMemo.
+  Returns:
+    A list of (prop_name, key, reverse_key) tuples for each property.
+  """
+  app_id = clean_app_id(entity.key().app())
+  namespace = entity.key().name_space()
+  kind = get_entity_kind(entity.key())
+  entity_key = memo.encode(entity.key().path())
+
+  keys = []
+  for prop in entity.property_list():
+    value = memo.encode(prop.value())
+    key = dbconstants.KEY_DELIMITER.join(
+      [app_id, namespace, kind, prop.name(), value, entity_key])
+    reverse_key = dbconstants.KEY_DELIMITER.join(
+      [app_id, namespace, kind, prop.name(),
+       helper_functions.reverse_lex(value), entity_key])
+    keys.append((prop.name(), key, reverse_key))
+
+  return keys
+
+
+def index_changes(old_entity, new_entity, composite_indices=(), memo=None):
+  """ Get the index rows that differ between two versions of an entity.
 
   Args:
     old_entity: An entity object.
     new_entity: An entity object.
     composite_indices: A list or tuple of composite indices.
+    memo: An IndexValueMemo to reuse encoded values from.
   Returns:
-    A list of dictionaries representing mutation operations.
+    A tuple containing a list of rows to delete and a list of rows to add.
+    Each row is a (table, key) tuple.
   """
-  deletions = []
-  app_id = clean_app_id(old_entity.key().app())
-  namespace = old_entity.key().name_space()
-  kind = get_entity_kind(old_entity.key())
-  entity_key = str(encode_index_pb(old_entity.key().path()))
+  if memo is None:
+    memo = IndexValueMemo()
 
-  new_props = {}
-  for prop in new_entity.property_list():
-    if prop.name() not in new_props:
-      new_props[prop.name()] = []
-    new_props[prop.name()].append(prop)
+  old_keys = _property_index_keys(old_entity, memo)
+  new_keys = _property_index_keys(new_entity, memo)
+  old_key_set = set(key for _, key, _ in old_keys)
+  new_key_set = set(key for _, key, _ in new_keys)
 
-  changed_props = {}
-  for prop in old_entity.property_list():
-    if prop.name() in new_props and prop in new_props[prop.name()]:
+  deletions = []
+  additions = []
+  changed_prop_names = set()
+  for prop_name, key, reverse_key in old_keys:
+    if key in new_key_set:
       continue
 
-    if prop.name() not in changed_props:
-      changed_props[prop.name()] = []
-    changed_props[prop.name()].append(prop)
-
-    value = str(encode_index_pb(prop.value()))
+    changed_prop_names.add(prop_name)
+    deletions.append((dbconstants.ASC_PROPERTY_TABLE, key))
+    deletions.append((dbconstants.DSC_PROPERTY_TABLE, reverse_key))
 
-    key = dbconstants.KEY_DELIMITER.join(
-      [app_id, namespace, kind, prop.name(), value, entity_key])
-    deletions.append({'table': dbconstants.ASC_PROPERTY_TABLE,
-                      'key': key,
-                      'operation': Operations.DELETE})
+  for prop_name, key, reverse_key in new_keys:
+    if key in old_key_set:
+      continue
 
-    reverse_key = dbconstants.KEY_DELIMITER.join(
-      [app_id, namespace, kind, prop.name(),
-       helper_functions.reverse_lex(value), entity_key])
-    deletions.append({'table': dbconstants.DSC_PROPERTY_TABLE,
-                      'key': reverse_key,
-                      'operation': Operations.DELETE})
+    changed_prop_names.add(prop_name)
+    additions.append((dbconstants.ASC_PROPERTY_TABLE, key))
+    additions.append((dbconstants.DSC_PROPERTY_TABLE, reverse_key))
 
-  changed_prop_names = set(changed_props.keys())
+  kind = get_entity_kind(old_entity.key())
   for index in composite_indices:
     if index.definition().entity_type() != kind:
       continue
@@ -117,20 +135,42 @@ def index_deletions(old_entity, new_entity, composite_indices=()):
     if index_props.isdisjoint(changed_prop_names):
       continue
 
-    old_entries = set(get_composite_index_keys(index, old_entity))
-    new_entries = set(get_composite_index_keys(index, new_entity))
-    for entry in (old_entries - new_entries):
-      deletions.append({'table': dbconstants.COMPOSITE_TABLE,
-                        'key': entry,
-                        'operation': Operations.DELETE})
+    old_entries = get_composite_indexes_rows([old_entity], [index], memo)
+    new_entries = get_composite_indexes_rows([new_entity], [index], memo)
+    old_entry_set = set(old_entries)
+    new_entry_set = set(new_entries)
+    deletions.extend((dbconstants.COMPOSITE_TABLE, entry)
+                     for entry in old_entries if entry not in new_entry_set)
+    additions.extend((dbconstants.COMPOSITE_TABLE, entry)
+                     for entry in new_entries if entry not in old_entry_set)
 
-  return deletions
+  return deletions, additions
+
+
+def index_deletions(old_entity, new_entity, composite_indices=()):
+  """ Get a list of index deletions needed for updating an entity. For changing
+  an existing entity, this involves examining the property list of both
+  entities to see which index entries need to be removed.
+
+  Args:
+    old_entity: An entity object.
+    new_entity: An entity object.
+    composite_indices: A list or tuple of composite indices.
+  Returns:
+    A list of dictionaries representing mutation operations.
+  """
+  deletions, _ = index_changes(old_entity, new_entity, composite_indices)
+  return [{'table': table, 'key': key, 'operation': Operations.DELETE}
+          for table, key in deletions]
 
 
 def mutations_for_entity(entity, txn, current_value=None,
                          composite_indices=()):
   """ Get a list of mutations needed across tables for an entity change.
 
+  When the entity already exists, only the index rows that differ between
+  the two versions are deleted or added.
+
   Args:
     entity: An entity object.
     txn: A transaction ID handler.
@@ -140,13 +180,17 @@ def mutations_for_entity(entity, txn, current_value=None,
     A list of dictionaries representing mutations.
   """
   mutations = []
+  memo = IndexValueMemo()
   if current_value is not None:
-    mutations.extend(
-      index_deletions(current_value, entity, composite_indices))
+    deletions, additions = index_changes(current_value, entity,
+                                         composite_indices, memo)
+    mutations.extend({'table': table, 'key': key,
+                      'operation': Operations.DELETE}
+                     for table, key in deletions)
 
   app_id = clean_app_id(entity.key().app())
   namespace = entity.key().name_space()
-  encoded_path = str(encode_index_pb(entity.key().path()))
+  encoded_path = memo.encode(entity.key().path())
   prefix = dbconstants.KEY_DELIMITER.join([app_id, namespace])
   entity_key = dbconstants.KEY_DELIMITER.join([prefix, encoded_path])
   entity_value = {dbconstants.APP_ENTITY_SCHEMA[0]: entity.Encode(),
@@ -158,27 +202,37 @@ def mutations_for_entity(entity, txn, current_value=None,
 
   reference_value = {'reference': entity_key}
 
+  # The kind row and unchanged index rows are already in place for an
+  # existing entity.
+  if current_value is not None:
+    mutations.extend({'table': table, 'key': key,
+                      'operation': Operations.PUT,
+                      'values': reference_value}
+                     for table, key in additions)
+    return mutations
+
   kind_key = get_kind_key(prefix, entity.key().path())
   mutations.append({'table': dbconstants.APP_KIND_TABLE,
                     'key': kind_key,
                     'operation': Operations.PUT,
                     'values': reference_value})
 
-  asc_rows = get_index_kv_from_tuple([(prefix, entity)])
+  asc_rows = get_index_kv_from_tuple([(prefix, entity)], memo=memo)
   for entry in asc_rows:
     mutations.append({'table': dbconstants.ASC_PROPERTY_TABLE,
                       'key': entry[0],
                       'operation': Operations.PUT,
                       'values': reference_value})
 
-  dsc_rows = get_index_kv_from_tuple([(prefix, entity)], reverse=True)
+  dsc_rows = get_index_kv_from_tuple([(prefix, entity)], reverse=True,
+                                     memo=memo)
   for entry in dsc_rows:
     mutations.append({'table': dbconstants.DSC_PROPERTY_TABLE,
                       'key': entry[0],
                       'operation': Operations.PUT,
                       'values': reference_value})
 
-  for key in get_composite_indexes_rows([entity], composite_indices):
+  for key in get_composite_indexes_rows([entity], composite_indices, memo):
     mutations.append({'table': dbconstants.COMPOSITE_TABLE,
                       'key': key,
                       'operation': Operations.PUT,
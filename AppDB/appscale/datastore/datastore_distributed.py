@@ -26,6 +26,7 @@ from appscale.datastore.cassandra_env.large_batch import BatchNotApplied
 from appscale.datastore.cassandra_env.utils import deletions_for_entity
 from appscale.datastore.cassandra_env.utils import mutations_for_entity
 from appscale.datastore.index_manager import IndexInaccessible
+from appscale.datastore.query_continuations import QueryPlan
 from appscale.datastore.taskqueue_client import EnqueueError, TaskQueueClient
 from appscale.datastore.utils import _FindIndexToUse
 from appscale.datastore.utils import clean_app_id
@@ -39,6 +40,7 @@ from appscale.datastore.utils import get_entity_kind
 from appscale.datastore.utils import get_index_key_from_params
 from appscale.datastore.utils import get_kind_key
 from appscale.datastore.utils import group_for_key
+from appscale.datastore.utils import IndexValueMemo
 from appscale.datastore.utils import kind_from_encoded_key
 from appscale.datastore.utils import reference_property_to_reference
 from appscale.datastore.utils import UnprocessedQueryCursor
@@ -117,14 +119,21 @@ class DatastoreDistributed():
   # The number of entities to fetch at a time when updating indices.
   BATCH_SIZE = 100
 
+  # The maximum number of entity groups to commit at once for a single put.
+  MAX_CONCURRENT_GROUP_COMMITS = 10
+
   def __init__(self, datastore_batch, transaction_manager, zookeeper=None,
-               log_level=logging.INFO, taskqueue_locations=()):
+               log_level=logging.INFO, taskqueue_locations=(),
+               entity_cache=None, query_continuations=None):
     """
        Constructor.
 
      Args:
        datastore_batch: A reference to the batch datastore interface.
        zookeeper: A reference to the zookeeper interface.
+       entity_cache: An EntityCache used for non-transactional gets.
+       query_continuations: A QueryContinuations table used to resume
+         queries without planning them again.
     """
     class_name = self.__class__.__name__
     self.logger = logging.getLogger(class_name)
@@ -149,6 +158,8 @@ class DatastoreDistributed():
     self.taskqueue_client = TaskQueueClient(taskqueue_locations)
     self.transaction_manager = transaction_manager
     self.index_manager = None
+    self.entity_cache = entity_cache
+    self.query_continuations = query_continuations
     self.zookeeper.handle.add_listener(self._zk_state_listener)
 
   def get_limit(self, query):
@@ -348,6 +359,7 @@ class DatastoreDistributed():
       return
     row_keys = []
     row_values = {}
+    memo = IndexValueMemo()
     # Create default composite index for all entities. Here we take each
     # of the properties in one
     for ent in entities:
@@ -375,11 +387,11 @@ class DatastoreDistributed():
           continue
 
         # Get the composite index key.
-        composite_index_keys = get_composite_index_keys(index_def, ent)
+        composite_index_keys = get_composite_index_keys(index_def, ent, memo)
         row_keys.extend(composite_index_keys)
 
         # Get the reference value for the composite table.
-        entity_key = str(encode_index_pb(ent.key().path()))
+        entity_key = memo.encode(ent.key().path())
         prefix = self.get_table_prefix(ent.key())
         reference = "{0}{1}{2}".format(prefix, self._SEPARATOR,  entity_key)
         for composite_key in composite_index_keys:
@@ -555,81 +567,151 @@ class DatastoreDistributed():
         by_group[group_key] = []
       by_group[group_key].append(entity)
 
-    for encoded_group_key, entity_list in by_group.iteritems():
-      group_key = entity_pb.Reference(encoded_group_key)
-
-      txid = self.transaction_manager.create_transaction_id(app, xg=False)
-      self.transaction_manager.set_groups(app, txid, [group_key])
+    groups = iter(by_group.items())
+    failed = []
 
-      # Allow the lock to stick around if there is an issue applying the batch.
-      lock = entity_lock.EntityLock(self.zookeeper.handle, [group_key], txid)
-      try:
-        yield lock.acquire()
-      except entity_lock.LockTimeout:
-        raise Timeout('Unable to acquire entity group lock')
+    @gen.coroutine
+    def commit_groups():
+      """ Commits groups until none remain or another group has failed. """
+      for encoded_group_key, entity_list in groups:
+        # Like a serial commit, stop taking new groups after a failure.
+        if failed:
+          return
 
-      try:
-        entity_keys = [
-          get_entity_key(self.get_table_prefix(entity), entity.key().path())
-          for entity in entity_list]
         try:
-          current_values = yield self.datastore_batch.batch_get_entity(
-            dbconstants.APP_ENTITY_TABLE, entity_keys, APP_ENTITY_SCHEMA)
-        except dbconstants.AppScaleDBConnectionError:
-          lock.release()
-          self.transaction_manager.delete_transaction_id(app, txid)
+          yield self.put_group(app, encoded_group_key, entity_list,
+                               composite_indexes)
+        except Exception:
+          failed.append(encoded_group_key)
           raise
 
-        batch = []
-        entity_changes = []
-        for entity in entity_list:
-          prefix = self.get_table_prefix(entity)
-          entity_key = get_entity_key(prefix, entity.key().path())
+    worker_count = min(self.MAX_CONCURRENT_GROUP_COMMITS, len(by_group))
+    yield [commit_groups() for _ in xrange(worker_count)]
 
-          current_value = None
-          if current_values[entity_key]:
-            current_value = entity_pb.EntityProto(
-              current_values[entity_key][APP_ENTITY_SCHEMA[0]])
+  @gen.coroutine
+  def newer_group_txid(self, app, group_key, txid, lock):
+    """ Makes sure a reserved transaction ID is newer than the group's last
+    write.
 
-          batch.extend(mutations_for_entity(entity, txid, current_value,
-                                            composite_indexes))
+    Write timestamps are derived from transaction IDs, and Cassandra keeps
+    the write with the highest timestamp. A leased ID can be lower than one
+    that another server has already used for the group, so it is replaced
+    with a new ID in that case. The lock's contender node is updated as well
+    so that the groomer can still remove it if the write fails.
 
-          batch.append({'table': 'group_updates',
-                        'key': bytearray(encoded_group_key),
-                        'last_update': txid})
+    Args:
+      app: A string containing the application ID.
+      group_key: An entity group Reference object.
+      txid: An integer specifying the reserved transaction ID.
+      lock: The acquired EntityLock for the group.
+    Returns:
+      An integer specifying the transaction ID to use for the write.
+    Raises:
+      AppScaleDBConnectionError if unable to fetch the group's version.
+    """
+    if not self.transaction_manager.lease_size:
+      raise gen.Return(txid)
 
-          entity_changes.append(
-            {'key': entity.key(), 'old': current_value, 'new': entity})
+    encoded_group = group_key.Encode()
+    versions = yield self.datastore_batch.group_versions([encoded_group])
+    if txid > versions.get(encoded_group, 0):
+      raise gen.Return(txid)
 
-        if batch_size(batch) > LARGE_BATCH_THRESHOLD:
-          try:
-            yield self.datastore_batch.large_batch(app, batch, entity_changes,
-                                                   txid)
-          except BatchNotApplied as error:
-            # If the "applied" switch has not been flipped, the lock can be
-            # released. The transaction ID is kept so that the groomer can
-            # clean up the batch tables.
-            lock.release()
-            raise dbconstants.AppScaleDBConnectionError(str(error))
-        else:
-          try:
-            yield self.datastore_batch.normal_batch(batch, txid)
-          except dbconstants.AppScaleDBConnectionError:
-            # Since normal batches are guaranteed to be atomic, the lock can
-            # be released.
-            lock.release()
-            self.transaction_manager.delete_transaction_id(app, txid)
-            raise
+    new_txid = self.transaction_manager.create_transaction_id(app, xg=False)
+    self.transaction_manager.set_groups(app, new_txid, [group_key])
+    lock.update_txid(new_txid)
+    self.transaction_manager.delete_transaction_id(app, txid)
+    raise gen.Return(new_txid)
+
+  @gen.coroutine
+  def put_group(self, app, encoded_group_key, entity_list, composite_indexes):
+    """ Updates indexes and inserts entities that belong to a single group.
+
+    Args:
+      app: A string containing the application ID.
+      encoded_group_key: A string containing an encoded group Reference.
+      entity_list: A list of entities in the group.
+      composite_indexes: A list or tuple of CompositeIndex objects.
+    """
+    group_key = entity_pb.Reference(encoded_group_key)
+
+    txid = self.transaction_manager.reserve_transaction_id(app)
+    self.transaction_manager.set_groups(app, txid, [group_key])
+
+    # Allow the lock to stick around if there is an issue applying the batch.
+    lock = entity_lock.EntityLock(self.zookeeper.handle, [group_key], txid)
+    try:
+      yield lock.acquire()
+    except entity_lock.LockTimeout:
+      raise Timeout('Unable to acquire entity group lock')
 
+    try:
+      entity_keys = [
+        get_entity_key(self.get_table_prefix(entity), entity.key().path())
+        for entity in entity_list]
+      try:
+        txid = yield self.newer_group_txid(app, group_key, txid, lock)
+        current_values = yield self.datastore_batch.batch_get_entity(
+          dbconstants.APP_ENTITY_TABLE, entity_keys, APP_ENTITY_SCHEMA)
+      except dbconstants.AppScaleDBConnectionError:
         lock.release()
+        self.transaction_manager.delete_transaction_id(app, txid)
+        raise
+
+      batch = []
+      entity_changes = []
+      committed_rows = {}
+      for entity in entity_list:
+        prefix = self.get_table_prefix(entity)
+        entity_key = get_entity_key(prefix, entity.key().path())
+
+        current_value = None
+        if current_values[entity_key]:
+          current_value = entity_pb.EntityProto(
+            current_values[entity_key][APP_ENTITY_SCHEMA[0]])
 
-      finally:
-        # In case of failure entity group lock should stay acquired
-        # as transaction groomer will handle it later.
-        # But tornado lock must be released.
-        lock.ensure_release_tornado_lock()
+        batch.extend(mutations_for_entity(entity, txid, current_value,
+                                          composite_indexes))
+        committed_rows[entity_key] = {APP_ENTITY_SCHEMA[0]: entity.Encode(),
+                                      APP_ENTITY_SCHEMA[1]: str(txid)}
 
-      self.transaction_manager.delete_transaction_id(app, txid)
+        batch.append({'table': 'group_updates',
+                      'key': bytearray(encoded_group_key),
+                      'last_update': txid})
+
+        entity_changes.append(
+          {'key': entity.key(), 'old': current_value, 'new': entity})
+
+      if batch_size(batch) > LARGE_BATCH_THRESHOLD:
+        try:
+          yield self.datastore_batch.large_batch(app, batch, entity_changes,
+                                                 txid)
+        except BatchNotApplied as error:
+          # If the "applied" switch has not been flipped, the lock can be
+          # released. The transaction ID is kept so that the groomer can
+          # clean up the batch tables.
+          lock.release()
+          raise dbconstants.AppScaleDBConnectionError(str(error))
+      else:
+        try:
+          yield self.datastore_batch.normal_batch(batch, txid)
+        except dbconstants.AppScaleDBConnectionError:
+          # Since normal batches are guaranteed to be atomic, the lock can
+          # be released.
+          lock.release()
+          self.transaction_manager.delete_transaction_id(app, txid)
+          raise
+
+      lock.release()
+
+    finally:
+      # In case of failure entity group lock should stay acquired
+      # as transaction groomer will handle it later.
+      # But tornado lock must be released.
+      lock.ensure_release_tornado_lock()
+
+    self.cache_committed_entities(app, txid, committed_rows)
+    self.transaction_manager.delete_transaction_id(app, txid)
 
   @gen.coroutine
   def delete_entities(self, group, txid, keys, composite_indexes=()):
@@ -650,6 +732,7 @@ class DatastoreDistributed():
     current_values = yield self.datastore_batch.batch_get_entity(
       dbconstants.APP_ENTITY_TABLE, entity_keys, APP_ENTITY_SCHEMA)
 
+    deleted_keys = []
     for key in entity_keys:
       if not current_values[key]:
         continue
@@ -663,6 +746,10 @@ class DatastoreDistributed():
                     'last_update': txid})
 
       yield self.datastore_batch.normal_batch(batch, txid)
+      deleted_keys.append(key)
+
+    self.cache_committed_entities(
+      group.app(), txid, {key: {} for key in deleted_keys})
 
   @gen.coroutine
   def dynamic_put(self, app_id, put_request, put_response):
@@ -858,6 +945,93 @@ class DatastoreDistributed():
       dbconstants.APP_ENTITY_TABLE, row_keys, APP_ENTITY_SCHEMA)
     raise gen.Return((result, row_keys))
 
+  @gen.coroutine
+  def fetch_cached_keys(self, app_id, key_list):
+    """ Given a list of keys fetch the entities, using the entity cache for
+    entries whose groups have not been modified.
+
+    Args:
+      app_id: A string specifying the project ID.
+      key_list: A list of keys to fetch.
+    Returns:
+      A tuple of entities from the datastore and key list.
+    """
+    if self.entity_cache is None:
+      fetched = yield self.fetch_keys(key_list)
+      raise gen.Return(fetched)
+
+    row_keys = []
+    groups = {}
+    for key in key_list:
+      self.validate_app_id(key.app())
+      row_key = encode_entity_table_key(key)
+      row_keys.append(row_key)
+      groups[row_key] = group_for_key(key).Encode()
+
+    # The versions must be read before the entities. Otherwise, an entity
+    # could be cached alongside a version that is newer than it is.
+    versions = yield self.datastore_batch.group_versions(
+      set(groups.itervalues()))
+
+    project_cache = self.entity_cache[app_id]
+    result = {}
+    missing = []
+    for row_key in row_keys:
+      columns = project_cache.get(row_key, versions.get(groups[row_key]))
+      if columns is None:
+        missing.append(row_key)
+      else:
+        result[row_key] = columns
+
+    if missing:
+      fetched = yield self.datastore_batch.batch_get_entity(
+        dbconstants.APP_ENTITY_TABLE, missing, APP_ENTITY_SCHEMA)
+      for row_key in missing:
+        result[row_key] = fetched[row_key]
+        version = versions.get(groups[row_key])
+        if self.row_is_current(fetched[row_key], version):
+          project_cache.put(row_key, version, fetched[row_key])
+
+    raise gen.Return((result, row_keys))
+
+  @staticmethod
+  def row_is_current(columns, version):
+    """ Checks if a fetched row is known to include its group's last write.
+
+    Batches are not isolated, so a read can see a group's new version before
+    the rows that the same batch writes. A row can only be cached from a read
+    if it was written by the version's commit or if the group has never been
+    written. Other rows are cached when they are committed.
+
+    Args:
+      columns: A dictionary of entity table columns.
+      version: An integer specifying the group_updates transaction ID that
+        was read before the row was fetched or None if there was none.
+    Returns:
+      A boolean indicating whether or not the row can be cached.
+    """
+    if version is None:
+      return True
+
+    return str(columns.get(APP_ENTITY_SCHEMA[1])) == str(version)
+
+  def cache_committed_entities(self, app_id, txid, rows):
+    """ Stores the rows that a commit has applied in the entity cache.
+
+    Args:
+      app_id: A string specifying the project ID.
+      txid: An integer specifying the transaction ID that the commit wrote to
+        each of the rows' groups.
+      rows: A dictionary mapping entity table keys to their new columns. An
+        empty dictionary indicates that the entity was deleted.
+    """
+    if self.entity_cache is None:
+      return
+
+    project_cache = self.entity_cache[app_id]
+    for row_key, columns in rows.iteritems():
+      project_cache.put(row_key, txid, columns)
+
   @gen.coroutine
   def dynamic_get(self, app_id, get_request, get_response):
     """ Fetch keys from the datastore.
@@ -881,7 +1055,7 @@ class DatastoreDistributed():
       yield self.datastore_batch.record_reads(
         app_id, get_request.transaction().handle(), fetched_groups)
     else:
-      results, row_keys = yield self.fetch_keys(keys)
+      results, row_keys = yield self.fetch_cached_keys(app_id, keys)
 
     result_count = 0
     for r in row_keys:
@@ -927,7 +1101,7 @@ class DatastoreDistributed():
       for encoded_group_key, key_list in by_group.iteritems():
         group_key = entity_pb.Reference(encoded_group_key)
 
-        txid = self.transaction_manager.create_transaction_id(app_id, xg=False)
+        txid = self.transaction_manager.reserve_transaction_id(app_id)
         self.transaction_manager.set_groups(app_id, txid, [group_key])
 
         # Allow the lock to stick around if there is an issue applying the batch.
@@ -938,6 +1112,13 @@ class DatastoreDistributed():
           raise Timeout('Unable to acquire entity group lock')
 
         try:
+          try:
+            txid = yield self.newer_group_txid(app_id, group_key, txid, lock)
+          except dbconstants.AppScaleDBConnectionError:
+            lock.release()
+            self.transaction_manager.delete_transaction_id(app_id, txid)
+            raise
+
           yield self.delete_entities(
             group_key,
             txid,
@@ -2129,6 +2310,10 @@ class DatastoreDistributed():
     min_common_path = ranges[0].get_cursor()
     entries_exhausted = False
     while True:
+      # Fetch the next chunks of any ranges that need them at the same time
+      # rather than waiting for each range to reach the end of its cache.
+      yield [range_.fill() for range_ in ranges]
+
       common_keys = []
       entry = None
       for range_ in ranges:
@@ -2845,8 +3030,16 @@ class DatastoreDistributed():
     Args:
       query: A datastore_pb.Query protocol buffer.
     Returns:
-      Result set.
+      A tuple containing the result set and the QueryPlan that was used.
     """
+    plan = None
+    if self.query_continuations is not None:
+      plan = self.query_continuations.pop(query)
+
+    if plan is not None:
+      results = yield self.__apply_query_plan(query, plan)
+      raise gen.Return((results, plan))
+
     if query.has_transaction() and not query.has_ancestor():
       raise apiproxy_errors.ApplicationError(
           datastore_pb.Error.BAD_REQUEST,
@@ -2876,17 +3069,38 @@ class DatastoreDistributed():
 
     index_to_use = _FindIndexToUse(query, self.get_indexes(app_id))
     if index_to_use is not None:
-      result = yield self.composite_v2(query, filter_info, index_to_use)
-      raise gen.Return(result)
+      plan = QueryPlan(filter_info, order_info, None, index_to_use)
+      result = yield self.__apply_query_plan(query, plan)
+      raise gen.Return((result, plan))
 
     for strategy in DatastoreDistributed._QUERY_STRATEGIES:
       results = yield strategy(self, query, filter_info, order_info)
       if results or results == []:
-        raise gen.Return(results)
+        raise gen.Return(
+          (results, QueryPlan(filter_info, order_info, strategy, None)))
 
     raise dbconstants.NeedsIndex(
       'An additional index is required to satisfy the query')
 
+  @gen.coroutine
+  def __apply_query_plan(self, query, plan):
+    """ Fetches a batch of results using a query plan.
+
+    Args:
+      query: A datastore_pb.Query protocol buffer.
+      plan: A QueryPlan.
+    Returns:
+      Result set.
+    """
+    if plan.composite_index is not None:
+      results = yield self.composite_v2(query, plan.filter_info,
+                                        plan.composite_index)
+    else:
+      results = yield plan.strategy(self, query, plan.filter_info,
+                                    plan.order_info)
+
+    raise gen.Return(results)
+
   @gen.coroutine
   def _dynamic_run_query(self, query, query_result):
     """Populates the query result and use that query result to
@@ -2896,7 +3110,7 @@ class DatastoreDistributed():
       query: The query to run.
       query_result: The response given to the application server.
     """
-    result = yield self.__get_query_results(query)
+    result, plan = yield self.__get_query_results(query)
     last_entity = None
     count = 0
     offset = query.offset()
@@ -2918,6 +3132,12 @@ class DatastoreDistributed():
     if count < self.get_limit(query):
       query_result.set_more_results(False)
 
+    # Keep the plan around in case the AppServer asks for the next batch.
+    if (self.query_continuations is not None and
+        query_result.more_results() and query_result.has_compiled_cursor()):
+      self.query_continuations.put(query, query_result.compiled_cursor(),
+                                   plan)
+
     # If there were no results then we copy the last cursor so future queries
     # can start off from the same place.
     if query.has_compiled_cursor() and not query_result.has_compiled_cursor():
@@ -3068,6 +3288,8 @@ class DatastoreDistributed():
 
       batch = []
       entity_changes = []
+      committed_rows = {encode_entity_table_key(key): {}
+                        for key in metadata['deletes']}
       for encoded_key, encoded_entity in metadata['puts'].iteritems():
         key = entity_pb.Reference(encoded_key)
         entity_table_key = encode_entity_table_key(key)
@@ -3080,6 +3302,9 @@ class DatastoreDistributed():
         mutations = mutations_for_entity(entity, txn, current_value,
                                          composite_indices)
         batch.extend(mutations)
+        committed_rows[entity_table_key] = {
+          APP_ENTITY_SCHEMA[0]: encoded_entity,
+          APP_ENTITY_SCHEMA[1]: str(txn)}
 
         entity_changes.append({'key': key, 'old': current_value,
                                'new': entity})
@@ -3130,6 +3355,7 @@ class DatastoreDistributed():
       # But tornado lock must be released.
       lock.ensure_release_tornado_lock()
 
+    self.cache_committed_entities(app, txn, committed_rows)
     self.transaction_manager.delete_transaction_id(app, txn)
 
     # Process transactional tasks.
@@ -0,0 +1,147 @@
+""" A bounded in-memory cache of entity table rows.
+
+Entries are tagged with a group_updates transaction ID that they are known
+to be current for. Every commit writes a new transaction ID for each group
+that it mutates, so an entry is only served if its group's version is
+unchanged. This keeps entries valid across datastore servers without any
+cross-process invalidation.
+"""
+import collections
+
+# The approximate number of bytes an entry takes beyond its key and values.
+ENTRY_OVERHEAD = 200
+
+
+class ProjectEntityCache(object):
+  """ A least-recently-used cache of entity rows for a single project. """
+  def __init__(self, max_bytes):
+    """ Creates a new ProjectEntityCache.
+
+    Args:
+      max_bytes: An integer specifying the memory budget for the project.
+    """
+    self.max_bytes = max_bytes
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+    # Maps entity table keys to (version, columns, size) tuples.
+    self._entries = collections.OrderedDict()
+
+  def get(self, key, version):
+    """ Retrieves the entity row for a key if it is still current.
+
+    Args:
+      key: A string specifying an entity table key.
+      version: An integer specifying the current group_updates transaction
+        ID for the key's group or None if the group has not been written.
+    Returns:
+      A dictionary of entity table columns (empty if the entity does not
+      exist) or None if there is no valid entry.
+    """
+    entry = self._entries.pop(key, None)
+    if entry is None:
+      self.misses += 1
+      return None
+
+    entry_version, columns, entry_size = entry
+    if entry_version != version:
+      self.size -= entry_size
+      self.misses += 1
+      return None
+
+    # Reinserting the entry marks it as the most recently used.
+    self._entries[key] = entry
+    self.hits += 1
+    return columns
+
+  def put(self, key, version, columns):
+    """ Stores an entity row.
+
+    Args:
+      key: A string specifying an entity table key.
+      version: An integer specifying the group_updates transaction ID that
+        the row is current for.
+      columns: A dictionary of entity table columns.
+    """
+    self.discard([key])
+    entry_size = (len(key) + ENTRY_OVERHEAD +
+                  sum(len(str(value)) for value in columns.itervalues()))
+    if entry_size > self.max_bytes:
+      return
+
+    while self.size + entry_size > self.max_bytes:
+      _, (_, _, evicted_size) = self._entries.popitem(last=False)
+      self.size -= evicted_size
+      self.evictions += 1
+
+    self._entries[key] = (version, columns, entry_size)
+    self.size += entry_size
+
+  def discard(self, keys):
+    """ Removes entries if they exist.
+
+    Args:
+      keys: An iterable containing entity table keys.
+    """
+    for key in keys:
+      entry = self._entries.pop(key, None)
+      if entry is not None:
+        self.size -= entry[2]
+
+  def stats(self):
+    """ Summarizes cache usage.
+
+    Returns:
+      A dictionary containing cache metrics.
+    """
+    return {'hits': self.hits, 'misses': self.misses,
+            'evictions': self.evictions, 'entries': len(self._entries),
+            'bytes': self.size}
+
+  def clear_stats(self):
+    """ Resets the hit, miss, and eviction counters. """
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+
+class EntityCache(object):
+  """ Keeps a separately budgeted entity cache for each project. """
+  def __init__(self, project_budget):
+    """ Creates a new EntityCache.
+
+    Args:
+      project_budget: An integer specifying the number of bytes each project
+        is allowed to use.
+    """
+    self.project_budget = project_budget
+    self.projects = {}
+
+  def __getitem__(self, project_id):
+    """ Fetches the cache for a project, creating it if necessary.
+
+    Args:
+      project_id: A string specifying a project ID.
+    Returns:
+      A ProjectEntityCache object.
+    """
+    if project_id not in self.projects:
+      self.projects[project_id] = ProjectEntityCache(self.project_budget)
+
+    return self.projects[project_id]
+
+  def stats(self):
+    """ Summarizes cache usage for each project.
+
+    Returns:
+      A dictionary mapping project IDs to cache metrics.
+    """
+    return {project_id: project_cache.stats()
+            for project_id, project_cache in self.projects.iteritems()}
+
+  def clear_stats(self):
+    """ Resets the counters for every project. """
+    for project_cache in self.projects.itervalues():
+      project_cache.clear_stats()
@@ -171,17 +171,18 @@ class DatastoreGroomer(threading.Thread):
     """
     return self.zoo_keeper.get_lock_with_path(zk.DS_GROOM_LOCK_PATH)
 
-  def get_entity_batch(self, last_key):
-    """ Gets a batch of entites to operate on.
+  def get_entity_batches(self, last_key):
+    """ Streams batches of entites to operate on.
 
     Args:
       last_key: The last key from a previous query.
     Returns:
-      A list of entities.
+      A generator of lists of entities.
     """
-    return self.db_access.range_query_sync(
+    entities = self.db_access.range_query_iter(
       dbconstants.APP_ENTITY_TABLE, dbconstants.APP_ENTITY_SCHEMA,
-      last_key, "", self.BATCH_SIZE, start_inclusive=False)
+      last_key, "", start_inclusive=False, page_size=self.BATCH_SIZE)
+    return helper_functions.batches(entities, self.BATCH_SIZE)
 
   def reset_statistics(self):
     """ Reinitializes statistics. """
@@ -480,18 +481,16 @@ class DatastoreGroomer(threading.Thread):
         cassandra_interface.INDEX_STATE_KEY,
         cassandra_interface.IndexStates.SCRUB_IN_PROGRESS)
 
-    while True:
-      references = self.db_access.range_query_sync(
-        table_name=table_name,
-        column_names=dbconstants.PROPERTY_SCHEMA,
-        start_key=start_key,
-        end_key=end_key,
-        limit=self.BATCH_SIZE,
-        start_inclusive=False,
-      )
-      if len(references) == 0:
-        break
-
+    all_references = self.db_access.range_query_iter(
+      table_name=table_name,
+      column_names=dbconstants.PROPERTY_SCHEMA,
+      start_key=start_key,
+      end_key=end_key,
+      start_inclusive=False,
+      page_size=self.BATCH_SIZE,
+    )
+    for references in helper_functions.batches(all_references,
+                                               self.BATCH_SIZE):
       self.index_entries_checked += len(references)
       if time.time() > self.last_logged + self.LOG_PROGRESS_FREQUENCY:
         logger.info('Checked {} index entries'
@@ -501,12 +500,7 @@ class DatastoreGroomer(threading.Thread):
       logger.debug('Fetched {} total refs, starting with {}, direction: {}'
         .format(self.index_entries_checked, [first_ref], direction))
 
-      last_start_key = start_key
       start_key = references[-1].keys()[0]
-      if start_key == last_start_key:
-        raise dbconstants.AppScaleDBError(
-          'An infinite loop was detected while fetching references.')
-
       entities = self.fetch_entity_dict_for_references(references)
 
       # Group invalid references by entity key so we can minimize locks.
@@ -538,18 +532,16 @@ class DatastoreGroomer(threading.Thread):
     if len(self.groomer_state) > 1:
       start_key = self.groomer_state[1]
 
-    while True:
-      references = self.db_access.range_query_sync(
-        table_name=table_name,
-        column_names=dbconstants.APP_KIND_SCHEMA,
-        start_key=start_key,
-        end_key=end_key,
-        limit=self.BATCH_SIZE,
-        start_inclusive=False,
-      )
-      if len(references) == 0:
-        break
-
+    all_references = self.db_access.range_query_iter(
+      table_name=table_name,
+      column_names=dbconstants.APP_KIND_SCHEMA,
+      start_key=start_key,
+      end_key=end_key,
+      start_inclusive=False,
+      page_size=self.BATCH_SIZE,
+    )
+    for references in helper_functions.batches(all_references,
+                                               self.BATCH_SIZE):
       self.index_entries_checked += len(references)
       if time.time() > self.last_logged + self.LOG_PROGRESS_FREQUENCY:
         logger.info('Checked {} index entries'.
@@ -559,12 +551,7 @@ class DatastoreGroomer(threading.Thread):
       logger.debug('Fetched {} kind indices, starting with {}'.
         format(len(references), [first_ref]))
 
-      last_start_key = start_key
       start_key = references[-1].keys()[0]
-      if start_key == last_start_key:
-        raise dbconstants.AppScaleDBError(
-          'An infinite loop was detected while fetching references.')
-
       entities = self.fetch_entity_dict_for_references(references)
 
       for reference in references:
@@ -840,21 +827,17 @@ class DatastoreGroomer(threading.Thread):
       last_key = ""
     while True:
       try:
-        logger.debug('Fetching {} entities'.format(self.BATCH_SIZE))
-        entities = self.get_entity_batch(last_key)
-
-        if not entities:
-          break
-
-        for entity in entities:
-          self.process_entity(entity)
-
-        last_key = entities[-1].keys()[0]
-        self.entities_checked += len(entities)
-        if time.time() > self.last_logged + self.LOG_PROGRESS_FREQUENCY:
-          logger.info('Checked {} entities'.format(self.entities_checked))
-          self.last_logged = time.time()
-        self.update_groomer_state([self.CLEAN_ENTITIES_TASK, last_key])
+        for entities in self.get_entity_batches(last_key):
+          for entity in entities:
+            self.process_entity(entity)
+
+          last_key = entities[-1].keys()[0]
+          self.entities_checked += len(entities)
+          if time.time() > self.last_logged + self.LOG_PROGRESS_FREQUENCY:
+            logger.info('Checked {} entities'.format(self.entities_checked))
+            self.last_logged = time.time()
+          self.update_groomer_state([self.CLEAN_ENTITIES_TASK, last_key])
+        break
       except datastore_errors.Error, error:
         logger.error("Error getting a batch: {0}".format(error))
         time.sleep(self.DB_ERROR_PERIOD)
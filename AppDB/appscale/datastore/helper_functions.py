@@ -3,6 +3,7 @@ Helpful functions and classes which are used by AppDB
 """
 import hashlib
 import inspect
+import itertools
 import random
 
 
@@ -73,3 +74,21 @@ def str_to_hex(string):
     A string in hex format.
   """
   return ":".join(x.encode('hex') for x in string)
+
+
+def batches(iterable, size):
+  """ Groups items from an iterable into lists as they are consumed.
+
+  Args:
+    iterable: An iterable of items.
+    size: The maximum number of items in each list.
+  Yields:
+    Lists of at most size items.
+  """
+  iterator = iter(iterable)
+  while True:
+    batch = list(itertools.islice(iterator, size))
+    if not batch:
+      return
+
+    yield batch
@@ -0,0 +1,130 @@
+""" Parses multipart/form-data bodies as they arrive. """
+from tornado.httputil import HTTPHeaders
+
+# The largest header block a part can have.
+MAX_HEADER_SIZE = 64 * 1024
+
+# Parser states.
+PREAMBLE = 'preamble'
+AFTER_DELIMITER = 'after_delimiter'
+HEADERS = 'headers'
+BODY = 'body'
+DONE = 'done'
+
+
+class MultipartError(Exception):
+  """ Indicates that a multipart body is malformed. """
+  pass
+
+
+class MultipartParser(object):
+  """ Splits a multipart body into parts without buffering part contents.
+
+  The delegate is notified as the body is fed in. It must implement:
+    start_part(headers): Called with an HTTPHeaders object for each part.
+    part_data(data): Called with each piece of the current part's contents.
+    finish_part(): Called when the current part is complete.
+  """
+  def __init__(self, boundary, delegate):
+    """ Creates a new MultipartParser.
+
+    Args:
+      boundary: A string specifying the multipart boundary.
+      delegate: An object that handles parts as they are parsed.
+    """
+    self._delimiter = '\r\n--' + boundary
+    self._delegate = delegate
+    self._state = PREAMBLE
+
+    # The first boundary does not need to be preceded by a line break.
+    self._buffer = '\r\n'
+
+  @property
+  def done(self):
+    """ Indicates whether or not the closing boundary has been parsed. """
+    return self._state == DONE
+
+  def feed(self, data):
+    """ Parses the next piece of the body.
+
+    Args:
+      data: A string containing the next bytes of the body.
+    Raises:
+      MultipartError if the body is malformed.
+    """
+    if self._state == DONE:
+      return
+
+    self._buffer += data
+    while self._advance():
+      pass
+
+  def _advance(self):
+    """ Consumes as much of the buffer as the current state allows.
+
+    Returns:
+      A boolean indicating whether or not the parser changed state.
+    """
+    if self._state == PREAMBLE:
+      index = self._buffer.find(self._delimiter)
+      if index == -1:
+        self._buffer = self._buffer[-len(self._delimiter):]
+        return False
+
+      self._buffer = self._buffer[index + len(self._delimiter):]
+      self._state = AFTER_DELIMITER
+      return True
+
+    if self._state == AFTER_DELIMITER:
+      line_end = self._buffer.find('\r\n')
+      if self._buffer.startswith('--'):
+        self._buffer = ''
+        self._state = DONE
+        return False
+
+      if line_end == -1:
+        if len(self._buffer) > MAX_HEADER_SIZE:
+          raise MultipartError('Invalid multipart boundary line')
+        return False
+
+      # Anything after the boundary on the same line is transport padding.
+      self._buffer = self._buffer[line_end + 2:]
+      self._state = HEADERS
+      return True
+
+    if self._state == HEADERS:
+      if self._buffer.startswith('\r\n'):
+        header_end, header_block = 0, ''
+      else:
+        header_end = self._buffer.find('\r\n\r\n')
+        if header_end == -1:
+          if len(self._buffer) > MAX_HEADER_SIZE:
+            raise MultipartError('Multipart headers are too large')
+          return False
+
+        header_block = self._buffer[:header_end]
+        header_end += 2
+
+      self._buffer = self._buffer[header_end + 2:]
+      self._delegate.start_part(HTTPHeaders.parse(header_block))
+      self._state = BODY
+      return True
+
+    if self._state == BODY:
+      index = self._buffer.find(self._delimiter)
+      if index == -1:
+        # Hold back enough bytes to detect a delimiter split across feeds.
+        safe_length = len(self._buffer) - len(self._delimiter) + 1
+        if safe_length > 0:
+          self._delegate.part_data(self._buffer[:safe_length])
+          self._buffer = self._buffer[safe_length:]
+        return False
+
+      if index > 0:
+        self._delegate.part_data(self._buffer[:index])
+      self._delegate.finish_part()
+      self._buffer = self._buffer[index + len(self._delimiter):]
+      self._state = AFTER_DELIMITER
+      return True
+
+    return False
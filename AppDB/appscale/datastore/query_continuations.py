@@ -0,0 +1,132 @@
+""" A short-lived table of planned queries that are expected to continue.
+
+When a query batch leaves more results, the AppServer sends the same query
+again with the compiled cursor from the previous response. Entries are keyed
+by the query and that cursor so that the next batch can reuse the plan
+without normalizing filters or trying each strategy again. An entry that
+expires or was stored by a different datastore server is simply missing, and
+the query is planned from its cursor as usual.
+"""
+import collections
+import sys
+import time
+
+from appscale.common.unpackaged import APPSCALE_PYTHON_APPSERVER
+
+sys.path.append(APPSCALE_PYTHON_APPSERVER)
+from google.appengine.datastore import datastore_pb
+
+# The number of seconds a continuation is kept.
+DEFAULT_TTL = 30
+
+# The details needed to fetch another batch for a query.
+QueryPlan = collections.namedtuple(
+  'QueryPlan', ['filter_info', 'order_info', 'strategy', 'composite_index'])
+
+
+def continuation_key(query, compiled_cursor):
+  """ Builds the key for a query that will resume from a cursor.
+
+  Fields that the AppServer changes between batches are left out.
+
+  Args:
+    query: A datastore_pb.Query object.
+    compiled_cursor: A datastore_pb.CompiledCursor object.
+  Returns:
+    A string that identifies the continuation.
+  """
+  plan_query = datastore_pb.Query()
+  plan_query.CopyFrom(query)
+  plan_query.clear_compiled_cursor()
+  plan_query.clear_offset()
+  plan_query.clear_count()
+  plan_query.clear_compile()
+  plan_query.clear_transaction()
+  encoded_cursor = compiled_cursor.Encode()
+  return ''.join([str(len(encoded_cursor)), ':', encoded_cursor,
+                  plan_query.Encode()])
+
+
+class QueryContinuations(object):
+  """ A bounded table of query plans waiting for their next batch. """
+  def __init__(self, max_entries, ttl=DEFAULT_TTL):
+    """ Creates a new QueryContinuations table.
+
+    Args:
+      max_entries: An integer specifying how many continuations to keep.
+      ttl: A number specifying how many seconds a continuation is kept.
+    """
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+    # Maps continuation keys to (expiration, plan) tuples.
+    self._entries = collections.OrderedDict()
+
+  def pop(self, query):
+    """ Removes and returns the plan stored for a query's cursor.
+
+    Args:
+      query: A datastore_pb.Query object.
+    Returns:
+      A QueryPlan or None if there is no valid continuation.
+    """
+    if not (query.has_compiled_cursor() and
+            query.compiled_cursor().position_size()):
+      return None
+
+    self._expire()
+    key = continuation_key(query, query.compiled_cursor())
+    entry = self._entries.pop(key, None)
+    if entry is None:
+      self.misses += 1
+      return None
+
+    self.hits += 1
+    return entry[1]
+
+  def put(self, query, compiled_cursor, plan):
+    """ Stores the plan for the batch that follows a cursor.
+
+    Args:
+      query: A datastore_pb.Query object.
+      compiled_cursor: A datastore_pb.CompiledCursor object.
+      plan: A QueryPlan.
+    """
+    if not compiled_cursor.position_size():
+      return
+
+    key = continuation_key(query, compiled_cursor)
+    self._entries.pop(key, None)
+    while len(self._entries) >= self.max_entries:
+      self._entries.popitem(last=False)
+      self.evictions += 1
+
+    self._entries[key] = (time.time() + self.ttl, plan)
+
+  def _expire(self):
+    """ Removes continuations that have expired. """
+    now = time.time()
+    while self._entries:
+      key, (expiration, _) = next(self._entries.iteritems())
+      if expiration > now:
+        break
+
+      del self._entries[key]
+
+  def stats(self):
+    """ Summarizes table usage.
+
+    Returns:
+      A dictionary containing continuation metrics.
+    """
+    return {'hits': self.hits, 'misses': self.misses,
+            'evictions': self.evictions, 'entries': len(self._entries)}
+
+  def clear_stats(self):
+    """ Resets the hit, miss, and eviction counters. """
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
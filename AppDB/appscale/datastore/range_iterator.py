@@ -44,8 +44,14 @@ class RangeIterator(object):
 
   This was designed for merge join queries. The range can only be narrowed.
   """
+  # The number of entries to fetch initially. Chunks grow while entries are
+  # consumed in order and shrink when most entries are skipped by seeks.
   CHUNK_SIZE = 1000
 
+  # The bounds for adaptive chunk sizes.
+  MIN_CHUNK_SIZE = 100
+  MAX_CHUNK_SIZE = 10000
+
   def __init__(self, db, project_id, namespace, kind, prop_name, value):
     """ Creates a new RangeIterator.
 
@@ -71,6 +77,14 @@ class RangeIterator(object):
     self._cache = []
     self._index_exhausted = False
 
+    self.chunk_size = self.CHUNK_SIZE
+
+    # The position in the cache to start searching for the cursor from.
+    self._position = 0
+
+    # The number of entries from the cache that have been returned.
+    self._served = 0
+
   @property
   def prefix(self):
     """ The encoded reference without the path element. """
@@ -87,30 +101,42 @@ class RangeIterator(object):
     Raises:
       RangeExhausted when there are no more entries in the range.
     """
+    yield self.fill()
     try:
-      # First check if the request can be fulfilled with the cache.
       entry = self._next_from_cache()
-      self._cursor = Cursor(entry.key, inclusive=False)
-      raise gen.Return(entry)
     except ValueError:
       # If the cache and index have been exhausted, there are no more entries.
-      if self._index_exhausted:
-        raise RangeExhausted()
+      raise RangeExhausted()
+
+    self._cursor = Cursor(entry.key, inclusive=False)
+    self._served += 1
+    raise gen.Return(entry)
+
+  @gen.coroutine
+  def fill(self):
+    """ Fetches the next chunk of the range if the cache cannot provide the
+    entry at the cursor. This is a no-op when the cache can provide it, so
+    callers can fill several ranges concurrently before advancing them. """
+    if self._index_exhausted:
+      return
+
+    try:
+      self._next_from_cache()
+      return
+    except ValueError:
+      pass
 
+    self._adjust_chunk_size()
+    chunk_size = self.chunk_size
     self._cache = yield self._db.range_query(
       ASC_PROPERTY_TABLE, PROPERTY_SCHEMA, self._cursor.key, self._range[-1],
-      self.CHUNK_SIZE, start_inclusive=self._cursor.inclusive)
+      chunk_size, start_inclusive=self._cursor.inclusive)
+    self._position = 0
+    self._served = 0
 
-    if len(self._cache) < self.CHUNK_SIZE:
+    if len(self._cache) < chunk_size:
       self._index_exhausted = True
 
-    if not self._cache:
-      raise RangeExhausted()
-
-    entry = self.entry_from_result(self._cache[0])
-    self._cursor = Cursor(entry.key, inclusive=False)
-    raise gen.Return(entry)
-
   @classmethod
   def from_filter(cls, db, project_id, namespace, kind, pb_filter):
     """ Creates a new RangeIterator from a filter.
@@ -217,9 +243,18 @@ class RangeIterator(object):
     Raises:
       ValueError if the cache does not contain a suitable entry.
     """
-    lo = 0
+    # Since the cursor only moves forward, gallop from the last position to
+    # find an interval that contains the cursor.
+    lo = self._position
     hi = len(self._cache)
-    # Bisect the cache to find the smallest key that is >= the cursor.
+    step = 1
+    while (lo + step < hi and
+           self._cache[lo + step].keys()[0] < self._cursor.key):
+      lo += step
+      step *= 2
+
+    hi = min(lo + step, hi)
+    # Bisect the interval to find the smallest key that is >= the cursor.
     while lo < hi:
       mid = (lo + hi) // 2
       if self._cache[mid].keys()[0] < self._cursor.key:
@@ -227,6 +262,7 @@ class RangeIterator(object):
       else:
         hi = mid
 
+    self._position = lo
     try:
       entry = self.entry_from_result(self._cache[lo])
     except IndexError:
@@ -240,3 +276,19 @@ class RangeIterator(object):
         raise ValueError
 
     return entry
+
+  def _adjust_chunk_size(self):
+    """ Sizes the next chunk based on how the last one was used.
+
+    If any entries from the last chunk were used, a larger chunk saves round
+    trips. If a seek skipped the whole chunk, the range is much denser than
+    the merge result, and a smaller chunk avoids reading entries that would
+    be skipped anyway.
+    """
+    if not self._cache:
+      return
+
+    if self._served > 0:
+      self.chunk_size = min(self.chunk_size * 2, self.MAX_CHUNK_SIZE)
+    else:
+      self.chunk_size = max(self.chunk_size // 2, self.MIN_CHUNK_SIZE)
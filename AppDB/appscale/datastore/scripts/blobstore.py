@@ -9,14 +9,9 @@ http://blog.doughellmann.com/2009/07/pymotw-urllib2-library-for-opening-urls.htm
 import argparse
 import base64
 import cgi
-import cStringIO
 import datetime
-import gzip
 import hashlib
-import itertools
 import logging
-import math
-import mimetools
 import os 
 import os.path
 import requests
@@ -27,22 +22,30 @@ import tornado.web
 import urllib
 import urllib2
 
+from concurrent.futures import ThreadPoolExecutor
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpclient import HTTPError
+from tornado.httpclient import HTTPRequest
+
 from appscale.appcontroller_client import AppControllerClient
 from appscale.common import appscale_info
 from appscale.common.constants import LOG_FORMAT
 from appscale.common.deployment_config import DeploymentConfig
 from appscale.common.deployment_config import ConfigInaccessible
 from appscale.common.unpackaged import APPSCALE_PYTHON_APPSERVER
+from appscale.datastore.multipart import MultipartError
+from appscale.datastore.multipart import MultipartParser
 from kazoo.client import KazooClient
-from StringIO import StringIO
 
 sys.path.append(APPSCALE_PYTHON_APPSERVER)
 from google.appengine.api import apiproxy_stub_map
 from google.appengine.api import datastore_errors
 from google.appengine.api import datastore_distributed
 from google.appengine.api import datastore
+from google.appengine.api import datastore_types
 from google.appengine.api.blobstore import blobstore
-from google.appengine.api.blobstore import datastore_blob_storage
+from google.appengine.datastore import datastore_pb
 from google.appengine.tools import dev_appserver_upload
 
 # The URL path used for uploading blobs
@@ -58,6 +61,7 @@ _BLOB_CHUNK_KIND_ = "__BlobChunk__"
 STRIPPED_HEADERS = frozenset(('content-length',
                               'content-md5',
                               'content-type',
+                              'transfer-encoding',
                              ))
 
 UPLOAD_ERROR = 'There was an error with your upload. Redirect path not '\
@@ -72,100 +76,33 @@ GCS_UPLOAD_ID_HEADER = 'X-GUploader-UploadID'
 # The chunk size to use for uploading files to GCS.
 GCS_CHUNK_SIZE = 5 * 1024 * 1024  # 5MB
 
+# The number of blob chunks stored with each datastore put.
+CHUNKS_PER_PUT = 4
+
+# The largest value a non-file form field can have.
+MAX_FIELD_SIZE = 1024 * 1024  # 1MB
+
+# The number of threads used for blocking datastore and GCS calls.
+MAX_BACKGROUND_WORKERS = 8
+
+# The number of seconds to wait for the application's upload callback.
+CALLBACK_TIMEOUT = 60
+
 # Global used for setting the datastore path when registering the DB
 datastore_path = ""
 
 # A DeploymentConfig accessor.
 deployment_config = None
 
-logger = logging.getLogger(__name__)
+# Runs blocking datastore and GCS calls for uploads.
+thread_pool = None
 
+# Maps project IDs to datastore stubs.
+datastore_stubs = {}
+
+logger = logging.getLogger(__name__)
 
-class MultiPartForm(object):
-  """Accumulate the data to be used when posting a form."""
 
-  def __init__(self, boundary):
-    """ Constructor. """
-    self.form_fields = []
-    self.files = []
-    if not boundary:
-      self.boundary = mimetools.choose_boundary()
-    else:
-      self.boundary = boundary
-    return
-  
-  def get_content_type(self):
-    """ Get the content type to use. """
-    return 'multipart/form-data; boundary=%s' % self.boundary
-
-  def add_field(self, name, value):
-    """Add a simple field to the form data."""
-    self.form_fields.append((name, value))
-    return
-
-  def add_file(self, 
-               fieldname, 
-               filename,  
-               fileHandle, 
-               blob_key, 
-               access_type,
-               size,
-               creation):
-    """Add a file to be uploaded."""
-    body = fileHandle.read()
-    mimetype = 'message/external-body; blob-key="%s"; access-type="%s"' % \
-       (blob_key, access_type)
-    self.files.append((fieldname, filename, mimetype, body, size, creation))
-    return
-  
-  def __str__(self):
-    """Return a string representing the form data, including attached files."""
-    # Build a list of lists, each containing "lines" of the
-    # request.  Each part is separated by a boundary string.
-    # Once the list is built, return a string where each
-    # line is separated by '\r\n'.  
-    parts = []
-    part_boundary = '--' + self.boundary
-     
-    # Add the form fields
-    parts.extend(
-        [ part_boundary,
-          'Content-Disposition: form-data; name="%s"' % name,
-          '',
-          value,
-        ]
-        for name, value in self.form_fields
-        )
-     
-    # Add the files to upload
-    parts.extend(
-        [ part_boundary,
-          'Content-Type: %s' % content_type,
-          'MIME-Version: 1.0',
-          'Content-Disposition: form-data; name="%s"; filename="%s"' % \
-             (field_name, filename),
-          '',
-          'Content-Type: application/octet-stream',
-          'MIME-Version: 1.0',
-          'Content-Length: %d'%size,
-          'content-type: application/octet-stream',
-          'content-disposition: form-data; name="%s"; filename="%s"' % \
-             (field_name, filename),
-          blobstore.UPLOAD_INFO_CREATION_HEADER + ": %s" % creation,
-          '',
-          ''
-        ]
-        for field_name, filename, content_type, body, size, \
-            creation in self.files
-        )
-     
-    # Flatten the list and add closing boundary marker,
-    # then return CR+LF separated data
-    flattened = list(itertools.chain(*parts))
-    flattened.append('--' + self.boundary + '--')
-    flattened.append('')
-    return '\r\n'.join(flattened)
- 
 def get_blobinfo(blob_key):
   """ Get BlobInfo from the datastore given its key. 
    
@@ -202,6 +139,46 @@ def setup_env():
   os.environ['USER_NICKNAME'] = ""
   os.environ['APPLICATION_ID'] = ""
 
+def get_datastore_stub(project_id):
+  """ Fetches the datastore stub for a project, creating it if necessary.
+
+  Args:
+    project_id: A string specifying a project ID.
+  Returns:
+    A DatastoreDistributed object.
+  """
+  if project_id not in datastore_stubs:
+    datastore_stubs[project_id] = datastore_distributed.DatastoreDistributed(
+      project_id, datastore_path)
+
+  return datastore_stubs[project_id]
+
+def use_project(project_id):
+  """ Directs GAE datastore library calls to a project.
+
+  Since the registered stub is global, this must be called right before
+  making synchronous datastore calls on behalf of a request.
+
+  Args:
+    project_id: A string specifying a project ID.
+  """
+  apiproxy_stub_map.apiproxy.RegisterStub('datastore_v3',
+                                          get_datastore_stub(project_id))
+  os.environ['APPLICATION_ID'] = project_id
+
+def put_entities(stub, entities):
+  """ Stores entities without going through the global API proxy.
+
+  Args:
+    stub: The DatastoreDistributed object for the entities' project.
+    entities: A list of datastore.Entity objects.
+  """
+  request = datastore_pb.PutRequest()
+  for entity in entities:
+    request.add_entity().CopyFrom(entity._ToPb())
+
+  stub.MakeSyncCall('datastore_v3', 'Put', request, datastore_pb.PutResponse())
+
 class Application(tornado.web.Application):
   """ The tornado web application handling uploads and healthchecks. """
   def __init__(self):
@@ -243,185 +220,454 @@ class HealthCheck(tornado.web.RequestHandler):
     """ This path is called to make sure the server is up and running. """
     self.finish("Hello") 
  
-class UploadHandler(tornado.web.RequestHandler):
-  """ Tornado handler for uploads. """
-  def post(self, app_id="blob", session_id = "session"):
-    """ Handler a post request from a user uploading a blob. 
-    
+class UploadError(Exception):
+  """ Indicates that an upload could not be completed. """
+  pass
+
+class DatastoreBlobWriter(object):
+  """ Stores a blob as __BlobChunk__ entities while it is being uploaded. """
+  def __init__(self, project_id, blob_key):
+    """ Creates a new DatastoreBlobWriter.
+
     Args:
-      app_id: The application triggering the upload.
-      session_id: Authentication token to validate the upload.
+      project_id: A string specifying a project ID.
+      blob_key: A string specifying the blob key.
+    """
+    self._project_id = project_id
+    self._blob_key = blob_key
+    self._stub = get_datastore_stub(project_id)
+    self._buffer = bytearray()
+    self._chunks = []
+    self._chunk_count = 0
+
+  def write(self, data):
+    """ Adds the next piece of the blob.
+
+    Args:
+      data: A string containing blob contents.
+    Returns:
+      A Future that resolves when a batch of chunks is stored or None if
+      the data has only been buffered.
+    """
+    self._buffer.extend(data)
+    while len(self._buffer) >= blobstore.MAX_BLOB_FETCH_SIZE:
+      self._add_chunk(self._buffer[:blobstore.MAX_BLOB_FETCH_SIZE])
+      del self._buffer[:blobstore.MAX_BLOB_FETCH_SIZE]
+
+    if len(self._chunks) >= CHUNKS_PER_PUT:
+      return self._flush()
+
+    return None
+
+  def close(self):
+    """ Stores any remaining chunks.
+
+    Returns:
+      A Future that resolves when the blob is stored or None if there is
+      nothing left to store.
+    """
+    if self._buffer:
+      self._add_chunk(self._buffer)
+      self._buffer = bytearray()
+
+    return self._flush()
+
+  def _add_chunk(self, data):
+    """ Creates the entity for the next chunk.
+
+    Args:
+      data: A bytearray containing the chunk's contents.
+    """
+    name = '{}__{}'.format(self._blob_key, self._chunk_count)
+    entity = datastore.Entity(_BLOB_CHUNK_KIND_, name=name, namespace='',
+                              _app=self._project_id)
+    entity['block'] = datastore_types.Blob(str(data))
+    self._chunks.append(entity)
+    self._chunk_count += 1
+
+  def _flush(self):
+    """ Stores the pending chunks in the background.
+
+    Returns:
+      A Future that resolves when the chunks are stored or None if there are
+      no pending chunks.
+    """
+    if not self._chunks:
+      return None
+
+    chunks = self._chunks
+    self._chunks = []
+    return thread_pool.submit(put_entities, self._stub, chunks)
+
+class GCSBlobWriter(object):
+  """ Streams a blob to GCS using a resumable upload. """
+  def __init__(self, gcs_url):
+    """ Creates a new GCSBlobWriter.
+
+    Args:
+      gcs_url: A string specifying the object's URL.
+    """
+    self._gcs_url = gcs_url
+    self._upload_id = None
+    self._buffer = bytearray()
+    self._offset = 0
+    self._pending = None
+
+  def write(self, data):
+    """ Adds the next piece of the blob.
+
+    Args:
+      data: A string containing blob contents.
+    Returns:
+      A Future that resolves when a chunk is sent or None if the data has
+      only been buffered.
+    """
+    self._buffer.extend(data)
+    if len(self._buffer) < GCS_CHUNK_SIZE:
+      return None
+
+    while len(self._buffer) >= GCS_CHUNK_SIZE:
+      chunk = str(self._buffer[:GCS_CHUNK_SIZE])
+      del self._buffer[:GCS_CHUNK_SIZE]
+      self._pending = self._send(chunk, False, self._pending)
+
+    return self._pending
+
+  def close(self):
+    """ Sends the remaining data and completes the upload.
+
+    Returns:
+      A Future that resolves when the upload is complete.
+    """
+    chunk = str(self._buffer)
+    self._buffer = bytearray()
+    self._pending = self._send(chunk, True, self._pending)
+    return self._pending
+
+  @gen.coroutine
+  def _send(self, chunk, last, previous):
+    """ Sends a chunk after the previous one has been accepted.
+
+    Args:
+      chunk: A string containing the chunk's contents.
+      last: A boolean indicating whether or not this completes the upload.
+      previous: A Future for the previous chunk or None.
+    """
+    if previous is not None:
+      yield previous
+
+    if self._upload_id is None:
+      self._upload_id = yield thread_pool.submit(self._start_upload)
+
+    offset = self._offset
+    self._offset += len(chunk)
+    yield thread_pool.submit(self._put_range, chunk, offset, last)
+
+  def _start_upload(self):
+    """ Starts a resumable upload.
+
+    Returns:
+      A string specifying the upload ID.
+    Raises:
+      UploadError if GCS does not accept the upload.
+    """
+    response = requests.post(self._gcs_url,
+                             headers={'x-goog-resumable': 'start'})
+    if (response.status_code != 201 or
+        GCS_UPLOAD_ID_HEADER not in response.headers):
+      raise UploadError('Unable to start resumable GCS upload.')
+
+    return response.headers[GCS_UPLOAD_ID_HEADER]
+
+  def _put_range(self, chunk, offset, last):
+    """ Sends a chunk of the upload.
+
+    Args:
+      chunk: A string containing the chunk's contents.
+      offset: An integer specifying the chunk's position in the blob.
+      last: A boolean indicating whether or not this completes the upload.
+    Raises:
+      UploadError if GCS does not accept the chunk.
+    """
+    total = '*'
+    if last:
+      total = str(offset + len(chunk))
+
+    if chunk:
+      current_range = '{}-{}'.format(offset, offset + len(chunk) - 1)
+    else:
+      current_range = '*'
+
+    content_range = 'bytes {}/{}'.format(current_range, total)
+    response = requests.put(self._gcs_url, data=chunk,
+                            headers={'Content-Range': content_range},
+                            params={'upload_id': self._upload_id})
+    if last and response.status_code != 200:
+      raise UploadError('Unable to complete GCS upload.')
+
+    if not last and response.status_code != 308:
+      raise UploadError('Unable to continue GCS upload.')
+
+class UploadedFile(object):
+  """ Tracks a file part while it is being uploaded. """
+  def __init__(self, field, filename, content_type, blob_key, writer,
+               gs_path=''):
+    """ Creates a new UploadedFile.
+
+    Args:
+      field: A string specifying the form field name.
+      filename: A string specifying the client's filename.
+      content_type: A string specifying the file's content type.
+      blob_key: A string specifying the blob key.
+      writer: A DatastoreBlobWriter or GCSBlobWriter.
+      gs_path: A string specifying the GCS object path if applicable.
     """
-    global datastore_path
-    db = datastore_distributed.DatastoreDistributed(
-      app_id, datastore_path)
-    apiproxy_stub_map.apiproxy.RegisterStub('datastore_v3', db)
-    os.environ['APPLICATION_ID'] = app_id
+    self.field = field
+    self.filename = filename
+    self.content_type = content_type
+    self.blob_key = blob_key
+    self.writer = writer
+    self.gs_path = gs_path
+    self.size = 0
+    self.md5 = hashlib.md5()
+
+@tornado.web.stream_request_body
+class UploadHandler(tornado.web.RequestHandler):
+  """ Tornado handler for uploads.
+
+  The request body is parsed as it arrives. File contents are stored in
+  batches while the rest of the body is being received, and reading pauses
+  until each batch is stored so that the memory used by an upload stays
+  bounded.
+  """
+  def prepare(self):
+    """ Validates the upload session before the body is received. """
+    self.request.connection.set_max_body_size(MAX_REQUEST_BUFF_SIZE)
+    self._parser = None
+    self._files = []
+    self._fields = {}
+    self._current_file = None
+    self._current_field = None
+    self._pending = []
+    self._error = None
+    self._creation = datetime.datetime.now()
+
+    app_id, session_id = self.path_args
+    self._app_id = app_id
 
-    # Setup the app id in the datastore.
     # Get session info and upload success path.
-    blob_session = get_session(session_id)
-    if not blob_session:
+    use_project(app_id)
+    self._session = get_session(session_id)
+    if not self._session:
       self.finish('Session has expired. Contact the owner of the ' + \
                   'app for support.\n\n')
       return
 
-    success_path = blob_session["success_path"]
+    datastore.Delete(self._session)
 
-    server_host = success_path[:success_path.rfind("/", 3)]
-    if server_host.startswith("http://"):
-      # Strip off the beginging of the server host
-      server_host = server_host[len("http://"):]
-    server_host = server_host.split('/')[0]
+    content_type = self.request.headers.get('Content-Type', '')
+    boundary = split_content_type(content_type).get('boundary')
+    if not boundary:
+      self.send_error(400, reason='Invalid multipart/form-data request.')
+      return
 
-    blob_storage = datastore_blob_storage.DatastoreBlobStorage(app_id)
-    uploadhandler = dev_appserver_upload.UploadCGIHandler(blob_storage)
+    if boundary.startswith('"') and boundary.endswith('"'):
+      boundary = boundary[1:-1]
 
-    datastore.Delete(blob_session)
+    self._parser = MultipartParser(boundary, self)
 
-    # This request is sent to the upload handler of the app
-    # in the hope it returns a redirect to be forwarded to the user
-    urlrequest = urllib2.Request(success_path)
+  @gen.coroutine
+  def data_received(self, chunk):
+    """ Parses the next piece of the body.
 
-    # Forward all relevant headers and create data for request
-    content_type = self.request.headers["Content-Type"]
-    kv = split_content_type(content_type)
-    boundary = None
-    if "boundary" in kv:
-      boundary = kv["boundary"]
-
-    urlrequest.add_header("Content-Type",
-                          'application/x-www-form-urlencoded')
-
-    for name, value in self.request.headers.items():
-      if name.lower() not in STRIPPED_HEADERS:
-        urlrequest.add_header(name, value)
-  
-    # Get correct redirect addresses, otherwise it will redirect back
-    # to this port.
-    urlrequest.add_header("Host", server_host)
-
-    form = MultiPartForm(boundary)
-    creation = datetime.datetime.now()
-
-    # Loop on all files in the form.
-    for filekey in self.request.files.keys():
-      data = {"blob_info_metadata": {filekey: []}}
-      file = self.request.files[filekey][0] 
-      body = file["body"]
-      size = len(body)
-      filename = file["filename"]
-      file_content_type = file["content_type"]
-
-      gs_path = ''
-      if 'gcs_bucket' in blob_session:
-        gcs_config = {'scheme': 'https', 'port': 443}
-        try:
-          gcs_config.update(deployment_config.get_config('gcs'))
-        except ConfigInaccessible:
-          self.send_error('Unable to fetch GCS configuration.')
-          return
-
-        if 'host' not in gcs_config:
-          self.send_error('GCS host is not defined.')
-          return
-
-        gcs_path = '{scheme}://{host}:{port}'.format(**gcs_config)
-        gcs_bucket_name = blob_session['gcs_bucket']
-        gcs_url = '/'.join([gcs_path, gcs_bucket_name, filename])
-        response = requests.post(gcs_url,
-                                 headers={'x-goog-resumable': 'start'})
-        if (response.status_code != 201 or
-            GCS_UPLOAD_ID_HEADER not in response.headers):
-          self.send_error(reason='Unable to start resumable GCS upload.')
-          return
-        upload_id = response.headers[GCS_UPLOAD_ID_HEADER]
-
-        total_chunks = int(math.ceil(float(size) / GCS_CHUNK_SIZE))
-        for chunk_num in range(total_chunks):
-          offset = GCS_CHUNK_SIZE * chunk_num
-          current_chunk_size = min(GCS_CHUNK_SIZE, size - offset)
-          end_byte = offset + current_chunk_size
-          current_range = '{}-{}'.format(offset, end_byte - 1)
-          content_range = 'bytes {}/{}'.format(current_range, size)
-          response = requests.put(gcs_url, data=body[offset:end_byte],
-                                  headers={'Content-Range': content_range},
-                                  params={'upload_id': upload_id})
-          if chunk_num == total_chunks - 1:
-            if response.status_code != 200:
-              self.send_error(reason='Unable to complete GCS upload.')
-              return
-          else:
-            if response.status_code != 308:
-              self.send_error(reason='Unable to continue GCS upload.')
-              return
-        gs_path = '/gs/{}/{}'.format(gcs_bucket_name, filename)
-        blob_key = 'encoded_gs_key:' + base64.b64encode(gs_path)
-      else:
-        form_item = cgi.FieldStorage(
-          headers={'content-type': file_content_type})
-        form_item.file = cStringIO.StringIO(body)
-        form_item.filename = filename
-
-        blob_entity = uploadhandler.StoreBlob(form_item, creation)
-        blob_key = str(blob_entity.key().name())
-
-      if not blob_key: 
-        self.finish('Status: 500\n\n')
-        return 
-      creation_formatted = blobstore._format_creation(creation)
-      form.add_file(filekey, filename, cStringIO.StringIO(blob_key), blob_key,
-                    blobstore.BLOB_KEY_HEADER, size, creation_formatted)
-
-      md5_handler = hashlib.md5(str(body))
-      blob_info = {"filename": filename,
+    Args:
+      chunk: A string containing part of the request body.
+    """
+    if self._finished or self._parser is None or self._error is not None:
+      return
+
+    try:
+      self._parser.feed(chunk)
+      # Wait for stored data before accepting more of the body.
+      yield self._pending
+    except (MultipartError, UploadError) as error:
+      self._error = str(error)
+    except Exception:
+      logger.exception('Unable to store upload')
+      self._error = 'Unable to store upload.'
+    finally:
+      self._pending = []
+
+  def start_part(self, headers):
+    """ Prepares to receive a multipart part.
+
+    Args:
+      headers: An HTTPHeaders object containing the part's headers.
+    """
+    _, params = cgi.parse_header(headers.get('Content-Disposition', ''))
+    name = params.get('name')
+    filename = params.get('filename')
+    if filename is None:
+      self._current_field = (name, bytearray())
+      return
+
+    content_type = headers.get('Content-Type', 'application/unknown')
+    if 'gcs_bucket' in self._session:
+      gcs_config = {'scheme': 'https', 'port': 443}
+      try:
+        gcs_config.update(deployment_config.get_config('gcs'))
+      except ConfigInaccessible:
+        raise UploadError('Unable to fetch GCS configuration.')
+
+      if 'host' not in gcs_config:
+        raise UploadError('GCS host is not defined.')
+
+      gcs_path = '{scheme}://{host}:{port}'.format(**gcs_config)
+      gcs_bucket_name = self._session['gcs_bucket']
+      gcs_url = '/'.join([gcs_path, gcs_bucket_name, filename])
+      gs_path = '/gs/{}/{}'.format(gcs_bucket_name, filename)
+      blob_key = 'encoded_gs_key:' + base64.b64encode(gs_path)
+      self._current_file = UploadedFile(name, filename, content_type,
+                                        blob_key, GCSBlobWriter(gcs_url),
+                                        gs_path)
+    else:
+      use_project(self._app_id)
+      blob_key = dev_appserver_upload.GenerateBlobKey()
+      if not blob_key:
+        raise UploadError('Unable to generate a blob key.')
+
+      writer = DatastoreBlobWriter(self._app_id, blob_key)
+      self._current_file = UploadedFile(name, filename, content_type,
+                                        blob_key, writer)
+
+  def part_data(self, data):
+    """ Handles part of the current part's contents.
+
+    Args:
+      data: A string containing part contents.
+    """
+    if self._current_file is None:
+      value = self._current_field[1]
+      if len(value) + len(data) > MAX_FIELD_SIZE:
+        raise UploadError('Form field is too large.')
+      value.extend(data)
+      return
+
+    self._current_file.size += len(data)
+    self._current_file.md5.update(data)
+    stored = self._current_file.writer.write(data)
+    if stored is not None:
+      self._pending.append(stored)
+
+  def finish_part(self):
+    """ Completes the current part. """
+    if self._current_file is None:
+      name, value = self._current_field
+      self._fields.setdefault(name, str(value))
+      self._current_field = None
+      return
+
+    stored = self._current_file.writer.close()
+    if stored is not None:
+      self._pending.append(stored)
+
+    self._files.append(self._current_file)
+    self._current_file = None
+
+  @gen.coroutine
+  def post(self, app_id, session_id):
+    """ Handler a post request from a user uploading a blob.
+
+    Args:
+      app_id: The application triggering the upload.
+      session_id: Authentication token to validate the upload.
+    """
+    if self._error is not None:
+      self.send_error(reason=self._error)
+      return
+
+    if not self._parser.done:
+      self.send_error(400, reason='Incomplete multipart/form-data request.')
+      return
+
+    creation_formatted = blobstore._format_creation(self._creation)
+    blob_infos = {}
+    use_project(app_id)
+    for uploaded in self._files:
+      if not uploaded.gs_path:
+        blob_entity = datastore.Entity(blobstore.BLOB_INFO_KIND,
+                                       name=uploaded.blob_key, namespace='')
+        blob_entity['content_type'] = uploaded.content_type.decode('utf-8')
+        blob_entity['creation'] = self._creation
+        blob_entity['filename'] = uploaded.filename.decode('utf-8')
+        blob_entity['md5_hash'] = uploaded.md5.hexdigest()
+        blob_entity['size'] = uploaded.size
+        datastore.Put(blob_entity)
+
+      blob_info = {"filename": uploaded.filename,
                    "creation-date": creation_formatted,
-                   "key": blob_key,
-                   "size": str(size),
-                   "content-type": file_content_type,
-                   "md5-hash": md5_handler.hexdigest()}
-      if 'gcs_bucket' in blob_session:
-        blob_info['gs-name'] = gs_path
-      data["blob_info_metadata"][filekey].append(blob_info)
+                   "key": uploaded.blob_key,
+                   "size": str(uploaded.size),
+                   "content-type": uploaded.content_type,
+                   "md5-hash": uploaded.md5.hexdigest()}
+      if uploaded.gs_path:
+        blob_info['gs-name'] = uploaded.gs_path
+      blob_infos.setdefault(uploaded.field, []).append(blob_info)
+
+    data = {"blob_info_metadata": blob_infos}
 
     # Loop through form fields
     for fieldkey in self.request.arguments.keys():
-      form.add_field(fieldkey, self.request.arguments[fieldkey][0])
       data[fieldkey] = self.request.arguments[fieldkey][0]
+    data.update(self._fields)
 
     logger.debug("Callback data: \n{}".format(data))
-    data = urllib.urlencode(data)
-    urlrequest.add_header("Content-Length", str(len(data)))
-    urlrequest.add_data(data)
+
+    success_path = self._session["success_path"]
+    server_host = success_path[:success_path.rfind("/", 3)]
+    if server_host.startswith("http://"):
+      # Strip off the beginging of the server host
+      server_host = server_host[len("http://"):]
+    server_host = server_host.split('/')[0]
+
+    # Forward all relevant headers and create data for request
+    headers = {name: value for name, value in self.request.headers.items()
+               if name.lower() not in STRIPPED_HEADERS}
+    headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+    # Get correct redirect addresses, otherwise it will redirect back
+    # to this port.
+    headers['Host'] = server_host
+
+    # This request is sent to the upload handler of the app
+    # in the hope it returns a redirect to be forwarded to the user
+    request = HTTPRequest(success_path, method='POST', headers=headers,
+                          body=urllib.urlencode(data), follow_redirects=False,
+                          request_timeout=CALLBACK_TIMEOUT)
 
     # We are catching the redirect error here
     # and extracting the Location to post the redirect.
     try:
-      response = urllib2.urlopen(urlrequest)
-      output = response.read()
-      if response.info().get('Content-Encoding') == 'gzip':
-        buf = StringIO(output)
-        f = gzip.GzipFile(fileobj=buf)
-        data = f.read()
-        output = data
-      self.finish(output)
-    except urllib2.HTTPError, e: 
-      if "Location" in e.hdrs:
-        # Catch any errors, use the success path to 
-        # get the ip and port, use the redirect path
-        # for the path. We split redirect_path just in case
-        # its a full path.
-        redirect_path = e.hdrs["Location"]
-        self.redirect(redirect_path)
-        return
-      else:
-        self.finish(UPLOAD_ERROR + "</br>" + str(e.hdrs) + "</br>" + str(e))
+      response = yield AsyncHTTPClient().fetch(request)
+    except HTTPError as error:
+      if error.response is not None and 'Location' in error.response.headers:
+        self.redirect(error.response.headers['Location'])
         return
 
+      response_headers = {}
+      if error.response is not None:
+        response_headers = dict(error.response.headers)
+      self.finish(UPLOAD_ERROR + "</br>" + str(response_headers) + "</br>" +
+                  str(error))
+      return
+
+    self.finish(response.body)
+
 
 def main():
   global datastore_path
   global deployment_config
+  global thread_pool
 
   logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
 
@@ -433,6 +679,7 @@ def main():
   args = parser.parse_args()
 
   datastore_path = args.datastore_path
+  thread_pool = ThreadPoolExecutor(MAX_BACKGROUND_WORKERS)
   zk_ips = appscale_info.get_zk_node_ips()
   zk_client = KazooClient(hosts=','.join(zk_ips))
   zk_client.start()
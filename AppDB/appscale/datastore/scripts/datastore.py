@@ -27,7 +27,9 @@ from tornado.options import options
 from .. import dbconstants
 from ..appscale_datastore_batch import DatastoreFactory
 from ..datastore_distributed import DatastoreDistributed
+from ..entity_cache import EntityCache
 from ..index_manager import IndexManager
+from ..query_continuations import QueryContinuations
 from ..utils import (clean_app_id,
                      logger,
                      UnprocessedQueryResult)
@@ -77,6 +79,11 @@ class ClearHandler(tornado.web.RequestHandler):
     """ Handles POST requests for clearing datastore server stats. """
     global STATS
     STATS = {}
+    datastore_access.datastore_batch.clear_statement_cache_stats()
+    if datastore_access.entity_cache is not None:
+      datastore_access.entity_cache.clear_stats()
+    if datastore_access.query_continuations is not None:
+      datastore_access.query_continuations.clear_stats()
     self.write({"message": "Statistics for this server cleared."})
     self.finish()
 
@@ -125,10 +132,6 @@ class MainHandler(tornado.web.RequestHandler):
   Defines what to do when the webserver receives different types of 
   HTTP requests.
   """
-  def set_default_headers(self):
-    """ Instructs clients to close the connection after each response. """
-    self.set_header('Connection', 'close')
-
   def unknown_request(self, app_id, http_request_data, pb_type):
     """ Function which handles unknown protocol buffers.
 
@@ -180,7 +183,15 @@ class MainHandler(tornado.web.RequestHandler):
     """ Handles get request for the web server. Returns that it is currently
         up in json.
     """
-    self.write(json.dumps(STATS))
+    stats = dict(STATS)
+    stats['prepared_statements'] = \
+      datastore_access.datastore_batch.statement_cache_stats()
+    if datastore_access.entity_cache is not None:
+      stats['entity_cache'] = datastore_access.entity_cache.stats()
+    if datastore_access.query_continuations is not None:
+      stats['query_continuations'] = \
+        datastore_access.query_continuations.stats()
+    self.write(json.dumps(stats))
     self.finish()
 
   @gen.coroutine
@@ -860,6 +871,15 @@ def main():
                       help='Datastore server port')
   parser.add_argument('-v', '--verbose', action='store_true',
                       help='Output debug-level logging')
+  parser.add_argument('--entity-cache-size', type=int, default=0,
+                      help='The number of megabytes each project can use '
+                           'for cached entities (0 disables the cache)')
+  parser.add_argument('--query-continuations', type=int, default=0,
+                      help='The number of planned queries to keep for '
+                           'fetching the next batch (0 disables the table)')
+  parser.add_argument('--txid-lease-size', type=int, default=0,
+                      help='The number of transaction IDs to lease at once '
+                           'for non-transactional writes (0 disables leasing)')
   args = parser.parse_args()
 
   if args.verbose:
@@ -885,11 +905,21 @@ def main():
   zk_state_listener(zookeeper.handle.state)
   zookeeper.handle.ChildrenWatch(DATASTORE_SERVERS_NODE, update_servers_watch)
 
-  transaction_manager = TransactionManager(zookeeper.handle)
+  transaction_manager = TransactionManager(zookeeper.handle,
+                                           lease_size=args.txid_lease_size)
+  entity_cache = None
+  if args.entity_cache_size > 0:
+    entity_cache = EntityCache(args.entity_cache_size * 1024 * 1024)
+
+  query_continuations = None
+  if args.query_continuations > 0:
+    query_continuations = QueryContinuations(args.query_continuations)
+
   datastore_access = DatastoreDistributed(
     datastore_batch, transaction_manager, zookeeper=zookeeper,
     log_level=logger.getEffectiveLevel(),
-    taskqueue_locations=taskqueue_locations)
+    taskqueue_locations=taskqueue_locations, entity_cache=entity_cache,
+    query_continuations=query_continuations)
   index_manager = IndexManager(zookeeper.handle, datastore_access,
                                perform_admin=True)
   datastore_access.index_manager = index_manager
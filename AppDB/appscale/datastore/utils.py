@@ -23,6 +23,7 @@ from google.appengine.datastore import datastore_index
 from google.appengine.datastore import datastore_pb
 from google.appengine.datastore import entity_pb
 from google.appengine.datastore import sortable_pb_encoder
+from google.net.proto.ProtocolBuffer import ProtocolBufferEncodeError
 
 
 logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
@@ -219,24 +220,128 @@ def fetch_and_delete_entities(database, table, schema, first_key,
   start_inclusive = True
   while True:
     try:
-      entities = db.range_query_sync(
-        table, schema, first_key, last_key, batch_size,
-        start_inclusive=start_inclusive)
-      if not entities:
-        logger.info("No entities found for {}".format(table))
-        break
-
-      for ii in entities:
-        db.batch_delete_sync(table, ii.keys())
-      logger.info("Deleted {0} entities".format(len(entities)))
-
-      first_key = entities[-1].keys()[0]
-      start_inclusive = False
+      keys = db.range_query_iter(
+        table, schema, first_key, last_key, start_inclusive=start_inclusive,
+        keys_only=True, page_size=batch_size)
+      for batch in helper_functions.batches(keys, batch_size):
+        db.batch_delete_sync(table, batch)
+        logger.info("Deleted {0} entities".format(len(batch)))
+
+        first_key = batch[-1]
+        start_inclusive = False
+
+      logger.info("No entities left in {}".format(table))
+      break
     except AppScaleDBConnectionError:
       logger.exception('Error while deleting data')
       time.sleep(backoff_timeout)
 
 
+# The bounds of integers that sortable_pb_encoder stores in a single byte.
+_MAX_INLINE_INT = (255 - 2 * 8) // 2
+_MIN_INLINE_INT = -_MAX_INLINE_INT
+
+# The sortable encoding of each PropertyValue field tag.
+_INT64_TAG = chr(128 + 8)
+_BOOLEAN_TAG = chr(128 + 16)
+_STRING_TAG = chr(128 + 26)
+_DOUBLE_TAG = chr(128 + 33)
+
+# Flips every bit in a string when used with str.translate.
+_INVERT_BYTES = ''.join(chr(255 - byte) for byte in range(256))
+
+
+def _escape_nulls(value):
+  """ Byte stuffs a string so that it does not contain null characters.
+
+  Args:
+    value: A string.
+  Returns:
+    A string with \x01 replaced by \x01\x02 and \x00 replaced by \x01\x01.
+  """
+  if '\x00' not in value and '\x01' not in value:
+    return value
+
+  return value.replace('\x01', '\x01\x02').replace('\x00', '\x01\x01')
+
+
+def _encode_sortable_int(value):
+  """ Encodes an integer the same way as sortable_pb_encoder.
+
+  Args:
+    value: An integer within the int64 range.
+  Returns:
+    A string containing the encoded integer.
+  """
+  if _MIN_INLINE_INT <= value <= _MAX_INLINE_INT:
+    return chr(9 + value - _MIN_INLINE_INT)
+
+  negative = value < 0
+  if negative:
+    value = _MIN_INLINE_INT - value
+  else:
+    value -= _MAX_INLINE_INT
+
+  encoded = []
+  while value > 0:
+    encoded.append(chr(value & 0xff))
+    value >>= 8
+
+  encoded.reverse()
+  encoded = ''.join(encoded)
+  if negative:
+    return chr(9 - len(encoded)) + encoded.translate(_INVERT_BYTES)
+
+  return chr(9 + 2 * _MAX_INLINE_INT + len(encoded)) + encoded
+
+
+def _encode_property_value(value):
+  """ Encodes the most common kinds of property values without an Encoder.
+
+  Args:
+    value: An entity_pb.PropertyValue.
+  Returns:
+    A string containing the same bytes that encode_index_pb would return or
+    None if the value needs to be encoded by sortable_pb_encoder.
+  """
+  if (value.has_pointvalue() or value.has_uservalue() or
+      value.has_referencevalue()):
+    return None
+
+  has_int = value.has_int64value()
+  has_boolean = value.has_booleanvalue()
+  has_string = value.has_stringvalue()
+  has_double = value.has_doublevalue()
+  if has_int + has_boolean + has_string + has_double != 1:
+    return None
+
+  # The tags never need to be escaped, and the terminating null of a string
+  # always becomes \x01\x01.
+  if has_string:
+    return ''.join([_STRING_TAG,
+                    _escape_nulls(_escape_nulls(value.stringvalue())),
+                    '\x01\x01'])
+
+  if has_int:
+    int_value = value.int64value()
+    if not -0x8000000000000000 <= int_value < 0x8000000000000000:
+      return None
+
+    return _INT64_TAG + _escape_nulls(_encode_sortable_int(int_value))
+
+  if has_boolean:
+    return _BOOLEAN_TAG + _escape_nulls(chr(bool(value.booleanvalue())))
+
+  double_value = value.doublevalue()
+  encoded = struct.pack('>d', double_value)
+  if ((double_value == 0 and ord(encoded[0]) == 128) or double_value < 0):
+    encoded = encoded.translate(_INVERT_BYTES)
+  else:
+    encoded = chr(ord(encoded[0]) ^ 0x80) + encoded[1:]
+
+  return _DOUBLE_TAG + _escape_nulls(encoded)
+
+
 def encode_index_pb(pb):
   """ Returns an encoded protocol buffer.
 
@@ -265,6 +370,18 @@ def encode_index_pb(pb):
     val += dbconstants.KIND_SEPARATOR
     return val
 
+  if isinstance(pb, entity_pb.Path):
+    errors = []
+    if not pb.IsInitialized(errors):
+      raise ProtocolBufferEncodeError('\n\t'.join(errors))
+
+    return buffer(_encode_path(pb))
+
+  if isinstance(pb, entity_pb.PropertyValue):
+    value = _encode_property_value(pb)
+    if value is not None:
+      return buffer(value)
+
   if isinstance(pb, entity_pb.PropertyValue) and pb.has_uservalue():
     userval = entity_pb.PropertyValue()
     userval.mutable_uservalue().set_email(pb.uservalue().email())
@@ -285,8 +402,49 @@ def encode_index_pb(pb):
     # We strip off null strings because it is our delimiter.
     value = remove_nulls(value)
     return buffer(value)
-  elif isinstance(pb, entity_pb.Path):
-    return buffer(_encode_path(pb))
+
+
+class IndexValueMemo(object):
+  """ Remembers the encoded form of values while building index keys.
+
+  Keys for the same entity encode its path and property values many times.
+  A memo should only be kept while the protocol buffers it has seen are not
+  modified, such as while building the mutations for a single request.
+  """
+  def __init__(self):
+    """ Creates a new IndexValueMemo. """
+    # Maps object IDs to (protocol buffer, encoded string) tuples. Keeping a
+    # reference to the protocol buffer prevents its ID from being reused.
+    self._encoded = {}
+
+  def encode(self, pb):
+    """ Encodes a Path or PropertyValue.
+
+    Args:
+      pb: The protocol buffer to encode.
+    Returns:
+      A string containing the output of encode_index_pb.
+    """
+    entry = self._encoded.get(id(pb))
+    if entry is None:
+      entry = (pb, str(encode_index_pb(pb)))
+      self._encoded[id(pb)] = entry
+
+    return entry[1]
+
+
+def _encoder_for(memo):
+  """ Picks the function used to encode values for index keys.
+
+  Args:
+    memo: An IndexValueMemo or None.
+  Returns:
+    A function that returns a string for a protocol buffer.
+  """
+  if memo is not None:
+    return memo.encode
+
+  return lambda pb: str(encode_index_pb(pb))
 
 
 def get_entity_kind(key_path):
@@ -361,17 +519,22 @@ def get_scatter_prop(element_list):
   return scatter_property
 
 
-def get_index_kv_from_tuple(tuple_list, reverse=False):
+def get_index_kv_from_tuple(tuple_list, reverse=False, memo=None):
   """ Returns keys/value of indexes for a set of entities.
 
   Args:
      tuple_list: A list of tuples of prefix and pb entities
      reverse: if these keys are for the descending table
+     memo: An IndexValueMemo to reuse encoded values from.
   Returns:
      A list of keys and values of indexes
   """
+  encode = _encoder_for(memo)
   all_rows = []
   for prefix, entity in tuple_list:
+    kind = get_entity_kind(entity)
+    encoded_path = encode(entity.key().path())
+
     # Give some entities a property that makes it easy to sample keys.
     scatter_prop = get_scatter_prop(entity.key().path().element_list())
     if scatter_prop is not None:
@@ -381,21 +544,20 @@ def get_index_kv_from_tuple(tuple_list, reverse=False):
       prop_list = entity.property_list()
 
     for prop in prop_list:
-      val = str(encode_index_pb(prop.value()))
+      val = encode(prop.value())
 
       if reverse:
         val = helper_functions.reverse_lex(val)
 
       params = [prefix,
-                get_entity_kind(entity),
+                kind,
                 prop.name(),
                 val,
-                str(encode_index_pb(entity.key().path()))]
+                encoded_path]
 
       index_key = get_index_key_from_params(params)
       p_vals = [index_key,
-                buffer(prefix + dbconstants.KEY_DELIMITER) + \
-                encode_index_pb(entity.key().path())]
+                prefix + dbconstants.KEY_DELIMITER + encoded_path]
       all_rows.append(p_vals)
   return tuple(all_rows)
 
@@ -421,7 +583,7 @@ def get_ancestor_paths_from_ent_key(ent_key):
   return ancestor_list
 
 
-def get_composite_index_keys(index, entity):
+def get_composite_index_keys(index, entity, memo=None):
   """ Creates keys to the composite index table for a given entity.
 
   Keys are built as such:
@@ -439,14 +601,16 @@ def get_composite_index_keys(index, entity):
   Args:
     index: A datastore_pb.CompositeIndex.
     entity: A entity_pb.EntityProto.
+    memo: An IndexValueMemo to reuse encoded values from.
   Returns:
     A list of strings representing keys to the composite table.
   """
+  encode = _encoder_for(memo)
   composite_id = index.id()
   definition = index.definition()
   app_id = clean_app_id(entity.key().app())
   name_space = entity.key().name_space()
-  ent_key = encode_index_pb(entity.key().path())
+  ent_key = encode(entity.key().path())
   pre_comp_index_key = "{0}{1}{2}{4}{3}{4}".format(app_id,
                                                    dbconstants.KEY_DELIMITER,
                                                    name_space, composite_id,
@@ -459,7 +623,7 @@ def get_composite_index_keys(index, entity):
   for prop in entity.property_list():
     if prop.name() not in property_list_names:
       continue
-    value = str(encode_index_pb(prop.value()))
+    value = encode(prop.value())
 
     if prop.name() in multivalue_dict:
       multivalue_dict[prop.name()].append(value)
@@ -473,7 +637,7 @@ def get_composite_index_keys(index, entity):
     # The definition can also have a key as a part of the index, but this
     # is not repeated.
     if prop.name() == "__key__":
-      value = str(encode_index_pb(entity.key().path()))
+      value = ent_key
       if prop.direction() == entity_pb.Index_Property.DESCENDING:
         value = helper_functions.reverse_lex(value)
       lists_of_prop_list.append([value])
@@ -522,13 +686,14 @@ def get_composite_index_keys(index, entity):
   return all_keys
 
 
-def get_composite_indexes_rows(entities, composite_indexes):
+def get_composite_indexes_rows(entities, composite_indexes, memo=None):
   """ Get the composite indexes keys in the DB for the given entities.
 
   Args:
      entities: A list of EntityProto for which their indexes are to be
        deleted.
      compsite_indexes: A list of datastore_pb.CompositeIndex.
+     memo: An IndexValueMemo to reuse encoded values from.
   Returns:
     A list of keys.
   """
@@ -559,7 +724,7 @@ def get_composite_indexes_rows(entities, composite_indexes):
       if not has_values:
         continue
 
-      composite_index_keys = get_composite_index_keys(index_def, ent)
+      composite_index_keys = get_composite_index_keys(index_def, ent, memo)
       row_keys.extend(composite_index_keys)
 
   return row_keys
@@ -9,3 +9,7 @@ MAX_SEQUENCE_COUNTER = 2 ** 31 - 1
 
 # The name of the node used for manually setting a txid offset.
 OFFSET_NODE = 'txid_offset'
+
+# The number of seconds after which unused leased transaction IDs are
+# discarded. This keeps them well within the groomer's expiration window.
+TXID_LEASE_DURATION = 5
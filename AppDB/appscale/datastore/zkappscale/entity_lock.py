@@ -1,6 +1,7 @@
 import base64
 import uuid
 
+from concurrent.futures import ThreadPoolExecutor
 from kazoo.exceptions import (
   CancelledError,
   KazooException,
@@ -22,6 +23,9 @@ LOCK_PATH_TEMPLATE = u'/appscale/apps/{project}/locks/{namespace}/{group}'
 # The number of seconds to wait for a lock before raising a timeout error.
 LOCK_TIMEOUT = 10
 
+# The maximum number of threads that can wait for ZooKeeper locks at once.
+MAX_ACQUIRE_THREADS = 50
+
 
 def zk_group_path(key):
   """ Retrieve the ZooKeeper lock path for a given entity key.
@@ -62,9 +66,15 @@ class EntityLock(object):
   """
   _NODE_NAME = '__lock__'
 
-  # Tornado lock which allows tornado to switch to different coroutine
-  # if current one is waiting for entity group lock
-  _tornado_lock = TornadoLock()
+  # Tornado locks for each entity group path that is in use. Coroutines in
+  # this process wait on these instead of contending for the same group in
+  # ZooKeeper. Each entry is a list containing the lock and the number of
+  # EntityLocks using it.
+  _group_locks = {}
+
+  # Waits for ZooKeeper locks. Waiting on the IOLoop would prevent this
+  # process from releasing groups that other processes are waiting for.
+  _acquire_executor = ThreadPoolExecutor(MAX_ACQUIRE_THREADS)
 
   def __init__(self, client, keys, txid=None):
     """ Create an entity lock.
@@ -91,6 +101,7 @@ class EntityLock(object):
     self.create_tried = False
     self.is_acquired = False
     self.cancelled = False
+    self._held_group_locks = []
     self._retry = KazooRetry(max_tries=None,
                              sleep_func=client.handler.sleep_func)
     self._lock = client.handler.lock_object()
@@ -105,16 +116,63 @@ class EntityLock(object):
     self.cancelled = True
     self.wake_event.set()
 
+  @classmethod
+  def _reference_group_lock(cls, path):
+    """ Fetch the tornado lock for a group, creating it if necessary.
+
+    Args:
+      path: A string specifying a ZooKeeper group lock path.
+    Returns:
+      A tornado Lock.
+    """
+    if path not in cls._group_locks:
+      cls._group_locks[path] = [TornadoLock(), 0]
+
+    entry = cls._group_locks[path]
+    entry[1] += 1
+    return entry[0]
+
+  @classmethod
+  def _unreference_group_lock(cls, path):
+    """ Remove the tornado lock for a group once nothing is using it.
+
+    Args:
+      path: A string specifying a ZooKeeper group lock path.
+    """
+    entry = cls._group_locks[path]
+    entry[1] -= 1
+    if entry[1] == 0:
+      del cls._group_locks[path]
+
+  def _release_group_locks(self):
+    """ Release the tornado locks that this lock holds. """
+    while self._held_group_locks:
+      path = self._held_group_locks.pop()
+      EntityLock._group_locks[path][0].release()
+      self._unreference_group_lock(path)
+
   @gen.coroutine
   def acquire(self):
-    now = ioloop.IOLoop.current().time()
-    yield EntityLock._tornado_lock.acquire(now + LOCK_TIMEOUT)
+    # Acquiring group locks in a consistent order prevents deadlocks between
+    # cross-group transactions in this process.
+    deadline = ioloop.IOLoop.current().time() + LOCK_TIMEOUT
+    for path in sorted(set(self.paths)):
+      group_lock = self._reference_group_lock(path)
+      try:
+        yield group_lock.acquire(deadline)
+      except gen.TimeoutError:
+        self._unreference_group_lock(path)
+        self._release_group_locks()
+        raise
+
+      self._held_group_locks.append(path)
+
     try:
-      locked = self.unsafe_acquire()
+      locked = yield self._acquire_executor.submit(self.unsafe_acquire)
       raise gen.Return(locked)
     finally:
       if not self.is_acquired:
-        EntityLock._tornado_lock.release()
+        self._release_group_locks()
 
   def unsafe_acquire(self):
     """ Acquire the lock. By default blocks and waits forever.
@@ -362,16 +420,29 @@ class EntityLock(object):
       return
     finally:
       if not self.is_acquired:
-        EntityLock._tornado_lock.release()
+        self._release_group_locks()
+
+  def update_txid(self, txid):
+    """ Writes a new transaction ID to the lock's contender nodes.
+
+    The transaction groomer only removes contenders that match the ID of the
+    transaction it cleans up, so this must be called if the lock's
+    transaction ID is replaced after the lock is acquired.
+
+    Args:
+      txid: An integer specifying the transaction ID.
+    """
+    self.data = str(txid)
+    for index, node in enumerate(self.nodes):
+      self.client.retry(self.client.set,
+                        self.paths[index] + '/' + node, self.data)
 
   def ensure_release_tornado_lock(self):
-    """ Ensures that tornado lock (which is global for datastore server)
-    is released.
+    """ Ensures that the tornado locks for this lock's groups are released.
     It MUST BE CALLED any time when lock is acquired
     even if entity group lock in zookeeper left acquired after failure.
     """
-    if self.is_acquired:
-      EntityLock._tornado_lock.release()
+    self._release_group_locks()
 
   def _inner_release(self):
     """ Release the lock by removing created nodes. """
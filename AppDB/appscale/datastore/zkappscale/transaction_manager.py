@@ -1,6 +1,7 @@
 """ Generates and keeps track of transaction IDs. """
 from __future__ import division
 
+import collections
 import json
 import logging
 import time
@@ -14,6 +15,7 @@ from .constants import CONTAINER_PREFIX
 from .constants import COUNTER_NODE_PREFIX
 from .constants import MAX_SEQUENCE_COUNTER
 from .constants import OFFSET_NODE
+from .constants import TXID_LEASE_DURATION
 from .entity_lock import zk_group_path
 from ..dbconstants import BadRequest
 from ..dbconstants import InternalError
@@ -26,15 +28,23 @@ XG_PREFIX = 'xg'
 
 class ProjectTransactionManager(object):
   """ Generates and keeps track of transaction IDs for a project. """
-  def __init__(self, project_id, zk_client):
+  def __init__(self, project_id, zk_client, lease_size=0):
     """ Creates a new ProjectTransactionManager.
 
     Args:
       project_id: A string specifying a project ID.
+      zk_client: A KazooClient.
+      lease_size: An integer specifying how many transaction IDs to lease at
+        once for non-transactional operations. 0 disables leasing.
     """
     self.project_id = project_id
     self.zk_client = zk_client
 
+    # Transaction IDs that have been leased but not handed out yet, paired
+    # with the time they were leased.
+    self._lease_size = lease_size
+    self._leased_txids = collections.deque()
+
     self._project_node = '/appscale/apps/{}'.format(self.project_id)
 
     # Allows users to manually modify transaction IDs after a binary migration.
@@ -98,6 +108,43 @@ class ProjectTransactionManager(object):
     self._last_txid_created = txid
     return txid
 
+  def reserve_transaction_id(self):
+    """ Hands out a transaction ID for a non-transactional operation.
+
+    When leasing is enabled, IDs come from a block of counter nodes that are
+    created with a single ZooKeeper request. Since each ID still has its own
+    counter node, leased IDs are listed by get_open_transactions and cleaned
+    up by the transaction groomer like any other ID.
+
+    Returns:
+      An integer specifying the transaction ID.
+    Raises:
+      InternalError if unable to create a new transaction ID.
+    """
+    if not self._lease_size:
+      return self.create_transaction_id(xg=False)
+
+    expired = []
+    while True:
+      if not self._leased_txids:
+        self._lease_txids()
+        continue
+
+      txid, lease_time = self._leased_txids.popleft()
+      # Stale IDs would leave the operation less time before the groomer
+      # considers it expired.
+      if lease_time + TXID_LEASE_DURATION < time.time():
+        expired.append(txid)
+        continue
+
+      break
+
+    if expired:
+      self._delete_counters([self._txid_to_path(old) for old in expired])
+
+    self._last_txid_created = txid
+    return txid
+
   def delete_transaction_id(self, txid):
     """ Removes a transaction ID from the list of active transactions.
 
@@ -158,6 +205,68 @@ class ProjectTransactionManager(object):
       logger.exception(message)
       raise InternalError(message)
 
+  def _lease_txids(self):
+    """ Creates a block of counter nodes for later use.
+
+    Raises:
+      InternalError if unable to create the counter nodes.
+    """
+    current_time = time.time()
+    counter_path_prefix = '/'.join([self._counter_path, COUNTER_NODE_PREFIX])
+    transaction = self.zk_client.transaction()
+    for _ in range(self._lease_size):
+      transaction.create(counter_path_prefix, value=str(current_time),
+                         sequence=True)
+
+    try:
+      new_paths = transaction.commit()
+    except KazooException:
+      new_paths = None
+
+    # Failed operations are reported as exceptions in the results.
+    if not new_paths or isinstance(new_paths[0], Exception):
+      message = 'Unable to lease transaction IDs'
+      logger.error(message)
+      raise InternalError(message)
+
+    exhausted = False
+    for new_path in new_paths:
+      counter = int(new_path.split('/')[-1].lstrip(COUNTER_NODE_PREFIX))
+      if counter < 0:
+        logger.debug('Removing invalid counter')
+        self._delete_counter(new_path)
+        exhausted = True
+        continue
+
+      txid = self._txid_manual_offset + self._txid_automatic_offset + counter
+      if txid == 0:
+        self._delete_counter(new_path)
+        continue
+
+      self._leased_txids.append((txid, current_time))
+
+    if exhausted:
+      self._update_auto_offset()
+
+  def _delete_counters(self, paths):
+    """ Removes several counter nodes with a single request.
+
+    Args:
+      paths: A list of strings specifying ZooKeeper paths.
+    """
+    transaction = self.zk_client.transaction()
+    for path in paths:
+      transaction.delete(path)
+
+    try:
+      results = transaction.commit()
+    except KazooException:
+      results = None
+
+    if not results or isinstance(results[0], Exception):
+      # Let the transaction groomer clean them up.
+      logger.warning('Unable to delete {} counters'.format(len(paths)))
+
   def _delete_counter(self, path):
     """ Removes a counter node.
 
@@ -262,13 +371,16 @@ class ProjectTransactionManager(object):
 
 class TransactionManager(object):
   """ Generates and keeps track of transaction IDs. """
-  def __init__(self, zk_client):
+  def __init__(self, zk_client, lease_size=0):
     """ Creates a new TransactionManager.
 
     Args:
       zk_client: A KazooClient.
+      lease_size: An integer specifying how many transaction IDs to lease at
+        once for non-transactional operations. 0 disables leasing.
     """
     self.zk_client = zk_client
+    self.lease_size = lease_size
     self.zk_client.ensure_path('/appscale/projects')
     self.projects = {}
 
@@ -298,6 +410,24 @@ class TransactionManager(object):
 
     return project_tx_manager.create_transaction_id(xg)
 
+  def reserve_transaction_id(self, project_id):
+    """ Hands out a transaction ID for a non-transactional operation.
+
+    Args:
+      project_id: A string specifying a project ID.
+    Returns:
+      An integer specifying the transaction ID.
+    Raises:
+      BadRequest if the project does not exist.
+      InternalError if unable to create a new transaction ID.
+    """
+    try:
+      project_tx_manager = self.projects[project_id]
+    except KeyError:
+      raise BadRequest('The project {} was not found'.format(project_id))
+
+    return project_tx_manager.reserve_transaction_id()
+
   def delete_transaction_id(self, project_id, txid):
     """ Removes a transaction ID from the list of active transactions.
 
@@ -355,8 +485,8 @@ class TransactionManager(object):
     """
     for project_id in new_project_ids:
       if project_id not in self.projects:
-        self.projects[project_id] = ProjectTransactionManager(project_id,
-                                                              self.zk_client)
+        self.projects[project_id] = ProjectTransactionManager(
+          project_id, self.zk_client, self.lease_size)
 
     for project_id in self.projects.keys():
       if project_id not in new_project_ids:
@@ -12,6 +12,7 @@ setup(
   install_requires=[
     'appscale-common',
     'cassandra-driver',
+    'futures',
     'kazoo',
     'M2Crypto',
     'mmh3',
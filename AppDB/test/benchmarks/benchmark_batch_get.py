@@ -0,0 +1,56 @@
+""" Measures batch_get_entity latency as the number of keys grows. """
+import argparse
+import time
+
+from mock import patch
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from appscale.datastore.cassandra_env import cassandra_interface
+
+from fake_cassandra import FakeCluster, FakeSession
+
+
+def entity_rows(query, parameters):
+  """ Returns one row per requested key and column. """
+  keys, columns = parameters
+  return [(str(key), column, 'value') for key in keys for column in columns]
+
+
+@gen.coroutine
+def measure(db, key_count, iterations):
+  """ Returns the average latency in seconds of a batch_get_entity call. """
+  keys = ['key{}'.format(index) for index in xrange(key_count)]
+  start = time.time()
+  for _ in xrange(iterations):
+    yield db.batch_get_entity('table', keys, ['entity', 'txnID'])
+
+  raise gen.Return((time.time() - start) / iterations)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--latency', type=float, default=0.005,
+                      help='Simulated round trip time in seconds')
+  parser.add_argument('--iterations', type=int, default=5)
+  parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 10],
+                      help='Values of fetch_concurrency to compare')
+  parser.add_argument('--keys', type=int, nargs='+',
+                      default=[10, 100, 500, 1000, 5000])
+  args = parser.parse_args()
+
+  FakeCluster.session = FakeSession(entity_rows, args.latency)
+  with patch.object(cassandra_interface, 'Cluster', FakeCluster):
+    print('{:>8} {:>12} {:>12}'.format('keys', 'concurrency', 'latency ms'))
+    for concurrency in args.concurrency:
+      db = cassandra_interface.DatastoreProxy(
+        hosts=['127.0.0.1'], fetch_concurrency=concurrency)
+      for key_count in args.keys:
+        latency = IOLoop.current().run_sync(
+          lambda: measure(db, key_count, args.iterations))
+        print('{:>8} {:>12} {:>12.1f}'.format(
+          key_count, concurrency, latency * 1000))
+
+
+if __name__ == '__main__':
+  main()
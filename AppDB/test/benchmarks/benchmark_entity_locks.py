@@ -0,0 +1,92 @@
+""" Measures write throughput to distinct entity groups as writers increase.
+
+Each writer repeatedly acquires an EntityLock for its own group, waits for a
+simulated batch write, and releases the lock. The "global" mode wraps every
+write in one process-wide tornado lock, which is how EntityLock used to
+behave.
+"""
+import argparse
+import sys
+import time
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.locks import Lock
+
+from appscale.common.unpackaged import APPSCALE_PYTHON_APPSERVER
+from appscale.datastore.zkappscale.entity_lock import EntityLock
+
+from fake_zookeeper import FakeZooKeeper
+
+sys.path.append(APPSCALE_PYTHON_APPSERVER)
+from google.appengine.datastore import entity_pb
+
+
+def group_key(index):
+  key = entity_pb.Reference()
+  key.set_app('guestbook')
+  element = key.mutable_path().add_element()
+  element.set_type('Greeting')
+  element.set_id(index + 1)
+  return key
+
+
+@gen.coroutine
+def measure(writer_count, zk_latency, write_latency, duration, global_lock):
+  """ Returns the number of writes per second across all writers. """
+  client = FakeZooKeeper(zk_latency)
+  process_lock = Lock()
+  writes = [0]
+  deadline = time.time() + duration
+
+  @gen.coroutine
+  def write(group):
+    lock = EntityLock(client, [group], writes[0])
+    yield lock.acquire()
+    try:
+      yield gen.sleep(write_latency)
+      lock.release()
+    finally:
+      lock.ensure_release_tornado_lock()
+
+  @gen.coroutine
+  def writer(index):
+    group = group_key(index)
+    while time.time() < deadline:
+      if global_lock:
+        with (yield process_lock.acquire()):
+          yield write(group)
+      else:
+        yield write(group)
+
+      writes[0] += 1
+
+  start = time.time()
+  yield [writer(index) for index in xrange(writer_count)]
+  raise gen.Return(writes[0] / (time.time() - start))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--zk-latency', type=float, default=0.0002,
+                      help='Simulated ZooKeeper round trip in seconds')
+  parser.add_argument('--write-latency', type=float, default=0.01,
+                      help='Simulated batch write time in seconds')
+  parser.add_argument('--duration', type=float, default=2)
+  parser.add_argument('--writers', type=int, nargs='+',
+                      default=[1, 2, 5, 10, 25])
+  args = parser.parse_args()
+
+  print('{:>8} {:>14} {:>14}'.format('writers', 'global w/s',
+                                      'per-group w/s'))
+  for writer_count in args.writers:
+    rates = [
+      IOLoop.current().run_sync(lambda: measure(
+        writer_count, args.zk_latency, args.write_latency, args.duration,
+        global_lock))
+      for global_lock in (True, False)]
+    print('{:>8} {:>14.0f} {:>14.0f}'.format(writer_count, *rates))
+
+
+if __name__ == '__main__':
+  main()
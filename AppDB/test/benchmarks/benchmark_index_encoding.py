@@ -0,0 +1,124 @@
+""" Times index key encoding over a corpus of typical entities.
+
+The "generic" column encodes every value with sortable_pb_encoder, which is
+how encode_index_pb used to work. The "fast" column uses encode_index_pb.
+The last two columns build the ascending and descending index rows for each
+entity with and without an IndexValueMemo.
+"""
+import argparse
+import random
+import sys
+import time
+
+from appscale.common.unpackaged import APPSCALE_PYTHON_APPSERVER
+from appscale.datastore.utils import (
+  encode_index_pb, get_index_kv_from_tuple, IndexValueMemo)
+
+sys.path.append(APPSCALE_PYTHON_APPSERVER)
+from google.appengine.datastore import entity_pb
+from google.appengine.datastore import sortable_pb_encoder
+
+
+def generic_encoding(value):
+  encoder = sortable_pb_encoder.Encoder()
+  value.Output(encoder)
+  return encoder.buffer().tostring().replace('\x01', '\x01\x02').\
+    replace('\x00', '\x01\x01')
+
+
+def build_corpus(entity_count, seed):
+  """ Builds entities that resemble a guestbook with user profiles. """
+  rand = random.Random(seed)
+  entities = []
+  for entity_id in xrange(1, entity_count + 1):
+    entity = entity_pb.EntityProto()
+    key = entity.mutable_key()
+    key.set_app('guestbook')
+    path = key.mutable_path()
+    element = path.add_element()
+    element.set_type('Guestbook')
+    element.set_name('book{}'.format(rand.randint(1, 20)))
+    element = path.add_element()
+    element.set_type('Greeting')
+    element.set_id(entity_id)
+    entity.mutable_entity_group().add_element().CopyFrom(path.element(0))
+
+    def add(name, multiple=False):
+      prop = entity.add_property()
+      prop.set_name(name)
+      prop.set_multiple(multiple)
+      return prop.mutable_value()
+
+    add('author').set_stringvalue('user{}@example.com'.format(
+      rand.randint(1, 1000)))
+    add('content').set_stringvalue(' '.join(
+      'word{}'.format(rand.randint(1, 5000))
+      for _ in xrange(rand.randint(3, 20))))
+    add('date').set_int64value(1500000000000000 + rand.randint(0, 10 ** 12))
+    add('votes').set_int64value(rand.randint(-50, 5000))
+    add('rating').set_doublevalue(rand.uniform(0, 5))
+    add('published').set_booleanvalue(rand.random() < 0.8)
+    for _ in xrange(rand.randint(0, 4)):
+      add('tags', multiple=True).set_stringvalue(
+        'tag{}'.format(rand.randint(1, 50)))
+
+    entities.append(entity)
+
+  return entities
+
+
+def time_call(function, iterations):
+  start = time.time()
+  for _ in xrange(iterations):
+    function()
+
+  return time.time() - start
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--entities', type=int, default=2000)
+  parser.add_argument('--iterations', type=int, default=5)
+  parser.add_argument('--seed', type=int, default=1)
+  args = parser.parse_args()
+
+  entities = build_corpus(args.entities, args.seed)
+  values = [prop.value() for entity in entities
+            for prop in entity.property_list()]
+  for value in values:
+    assert str(encode_index_pb(value)) == generic_encoding(value)
+
+  def generic():
+    for value in values:
+      generic_encoding(value)
+
+  def fast():
+    for value in values:
+      encode_index_pb(value)
+
+  def rows_without_memo():
+    for entity in entities:
+      get_index_kv_from_tuple([('guestbook\x00', entity)])
+      get_index_kv_from_tuple([('guestbook\x00', entity)], reverse=True)
+
+  def rows_with_memo():
+    for entity in entities:
+      memo = IndexValueMemo()
+      get_index_kv_from_tuple([('guestbook\x00', entity)], memo=memo)
+      get_index_kv_from_tuple([('guestbook\x00', entity)], reverse=True,
+                              memo=memo)
+
+  print('{} entities, {} property values'.format(len(entities), len(values)))
+  print('{:>14} {:>14} {:>14} {:>14}'.format(
+    'generic us/v', 'fast us/v', 'rows us/e', 'memo us/e'))
+  value_scale = 1e6 / (len(values) * args.iterations)
+  entity_scale = 1e6 / (len(entities) * args.iterations)
+  print('{:>14.2f} {:>14.2f} {:>14.2f} {:>14.2f}'.format(
+    time_call(generic, args.iterations) * value_scale,
+    time_call(fast, args.iterations) * value_scale,
+    time_call(rows_without_memo, args.iterations) * entity_scale,
+    time_call(rows_with_memo, args.iterations) * entity_scale))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,110 @@
+""" Reports the mutations and batch bytes needed for partial entity updates.
+
+The "rewrite" columns count what the datastore used to write for an update:
+deletions for every changed property followed by every index row for the new
+entity. The "diff" columns count the rows written by mutations_for_entity,
+which only includes index rows that changed.
+"""
+import argparse
+import sys
+
+from appscale.common.unpackaged import APPSCALE_PYTHON_APPSERVER
+from appscale.datastore.cassandra_env.cassandra_interface import (
+  batch_size, LARGE_BATCH_THRESHOLD)
+from appscale.datastore.cassandra_env.utils import (
+  index_deletions, mutations_for_entity)
+
+sys.path.append(APPSCALE_PYTHON_APPSERVER)
+from google.appengine.datastore import entity_pb
+
+
+def build_entity(property_count, version=0, changed=0):
+  """ Builds a Greeting entity with a mix of property types.
+
+  Args:
+    property_count: The number of properties to add.
+    version: An integer that is stored in changed properties.
+    changed: The number of properties that contain the version.
+  """
+  entity = entity_pb.EntityProto()
+  key = entity.mutable_key()
+  key.set_app('guestbook')
+  element = key.mutable_path().add_element()
+  element.set_type('Greeting')
+  element.set_id(42)
+  entity.mutable_entity_group().MergeFrom(key.path())
+
+  for index in xrange(property_count):
+    prop = entity.add_property()
+    prop.set_name('prop{}'.format(index))
+    prop.set_multiple(False)
+    suffix = version if index < changed else 0
+    if index % 3 == 0:
+      prop.mutable_value().set_int64value(index * 1000 + suffix)
+    elif index % 3 == 1:
+      prop.mutable_value().set_stringvalue(
+        'value {} for greeting {}'.format(index, suffix))
+    else:
+      prop.mutable_value().set_booleanvalue(bool((index + suffix) % 2))
+
+  return entity
+
+
+def build_composite_indexes(count):
+  indexes = []
+  for index_id in xrange(count):
+    index = entity_pb.CompositeIndex()
+    index.set_id(index_id + 1)
+    index.set_app_id('guestbook')
+    definition = index.mutable_definition()
+    definition.set_entity_type('Greeting')
+    definition.set_ancestor(False)
+    for prop_index in (index_id, index_id + 1):
+      prop = definition.add_property()
+      prop.set_name('prop{}'.format(prop_index))
+      prop.set_direction(entity_pb.Index_Property.ASCENDING)
+
+    indexes.append(index)
+
+  return indexes
+
+
+def measure(property_count, changed, composite_count):
+  old_entity = build_entity(property_count)
+  new_entity = build_entity(property_count, version=1, changed=changed)
+  indexes = build_composite_indexes(composite_count)
+
+  rewrite = (index_deletions(old_entity, new_entity, indexes) +
+             mutations_for_entity(new_entity, 1, composite_indices=indexes))
+  diff = mutations_for_entity(new_entity, 1, old_entity, indexes)
+  return len(rewrite), batch_size(rewrite), len(diff), batch_size(diff)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--properties', type=int, nargs='+',
+                      default=[10, 50, 200])
+  parser.add_argument('--changed', type=int, nargs='+', default=[1, 5])
+  parser.add_argument('--composite-indexes', type=int, default=5)
+  args = parser.parse_args()
+
+  print('Batches over {} bytes are marked with *'.format(
+    LARGE_BATCH_THRESHOLD))
+  print('{:>6} {:>8} {:>10} {:>13} {:>10} {:>13}'.format(
+    'props', 'changed', 'rewrite', 'rewrite bytes', 'diff', 'diff bytes'))
+  for property_count in args.properties:
+    for changed in args.changed:
+      if changed > property_count:
+        continue
+
+      old_count, old_bytes, new_count, new_bytes = measure(
+        property_count, changed, args.composite_indexes)
+      print('{:>6} {:>8} {:>10} {:>12}{} {:>10} {:>12}{}'.format(
+        property_count, changed, old_count, old_bytes,
+        '*' if old_bytes > LARGE_BATCH_THRESHOLD else ' ',
+        new_count, new_bytes,
+        '*' if new_bytes > LARGE_BATCH_THRESHOLD else ' '))
+
+
+if __name__ == '__main__':
+  main()
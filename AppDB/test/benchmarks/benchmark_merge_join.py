@@ -0,0 +1,102 @@
+""" Reports index round trips per merge join query as selectivity varies. """
+import argparse
+import bisect
+import sys
+import time
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from appscale.common.unpackaged import APPSCALE_PYTHON_APPSERVER
+from appscale.datastore.datastore_distributed import DatastoreDistributed
+from appscale.datastore.range_iterator import RangeIterator
+from appscale.datastore.utils import encode_index_pb
+
+sys.path.append(APPSCALE_PYTHON_APPSERVER)
+from google.appengine.datastore import entity_pb
+
+
+class FakeIndex(object):
+  """ Serves range queries from sorted index keys after a fixed latency. """
+  def __init__(self, latency):
+    self.latency = latency
+    self.keys = []
+    self.requests = 0
+
+  def add_range(self, range_, entity_ids):
+    for entity_id in entity_ids:
+      path = entity_pb.Path()
+      element = path.add_element()
+      element.set_type('Greeting')
+      element.set_id(entity_id)
+      self.keys.append(range_.prefix + str(encode_index_pb(path)))
+
+    self.keys.sort()
+
+  @gen.coroutine
+  def range_query(self, table, schema, start, end, limit,
+                  start_inclusive=True):
+    self.requests += 1
+    yield gen.sleep(self.latency)
+    if start_inclusive:
+      index = bisect.bisect_left(self.keys, start)
+    else:
+      index = bisect.bisect_right(self.keys, start)
+
+    keys = [key for key in self.keys[index:index + limit] if key <= end]
+    raise gen.Return([{key: {'reference': key}} for key in keys])
+
+
+@gen.coroutine
+def measure(entity_count, strides, limit, latency, adaptive):
+  """ Runs one merge join across ranges that contain every nth entity.
+
+  Returns:
+    A tuple containing the number of round trips, the number of results,
+    and the elapsed time in seconds.
+  """
+  index = FakeIndex(latency)
+  ranges = []
+  for position, stride in enumerate(strides):
+    value = entity_pb.PropertyValue()
+    value.set_stringvalue('value')
+    range_ = RangeIterator(index, 'guestbook', '', 'Greeting',
+                           'prop{}'.format(position), value)
+    if not adaptive:
+      range_.MIN_CHUNK_SIZE = range_.MAX_CHUNK_SIZE = range_.CHUNK_SIZE
+
+    index.add_range(range_, xrange(0, entity_count, stride))
+    ranges.append(range_)
+
+  start = time.time()
+  references = yield DatastoreDistributed._common_refs_from_ranges(ranges,
+                                                                   limit)
+  raise gen.Return((index.requests, len(references), time.time() - start))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--entities', type=int, default=30000)
+  parser.add_argument('--limit', type=int, default=500)
+  parser.add_argument('--latency', type=float, default=0.002,
+                      help='Simulated round trip time in seconds')
+  args = parser.parse_args()
+
+  # Each case lists how often the filtered value occurs in each range.
+  cases = [(1, 2), (1, 7), (3, 7), (1, 50), (2, 3, 5)]
+  print('{:>12} {:>10} {:>12} {:>10} {:>12} {:>10}'.format(
+    'strides', 'results', 'fixed trips', 'fixed ms', 'adapt trips',
+    'adapt ms'))
+  for strides in cases:
+    io_loop = IOLoop.current()
+    fixed = io_loop.run_sync(lambda: measure(
+      args.entities, strides, args.limit, args.latency, adaptive=False))
+    adaptive = io_loop.run_sync(lambda: measure(
+      args.entities, strides, args.limit, args.latency, adaptive=True))
+    print('{:>12} {:>10} {:>12} {:>10.1f} {:>12} {:>10.1f}'.format(
+      ','.join(str(stride) for stride in strides), adaptive[1], fixed[0],
+      fixed[2] * 1000, adaptive[0], adaptive[2] * 1000))
+
+
+if __name__ == '__main__':
+  main()
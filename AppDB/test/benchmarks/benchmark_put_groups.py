@@ -0,0 +1,135 @@
+""" Measures put_entities latency as the number of entity groups grows. """
+import argparse
+import sys
+import time
+
+from mock import patch
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from appscale.common.unpackaged import APPSCALE_PYTHON_APPSERVER
+from appscale.datastore.datastore_distributed import DatastoreDistributed
+from appscale.datastore.zkappscale.entity_lock import EntityLock
+
+sys.path.append(APPSCALE_PYTHON_APPSERVER)
+from google.appengine.datastore import entity_pb
+
+
+class StubZooKeeper(object):
+  """ Provides the handle attributes DatastoreDistributed expects. """
+  class Handle(object):
+    def add_listener(self, listener):
+      pass
+
+  handle = Handle()
+
+
+class StubTransactionManager(object):
+  """ Hands out transaction IDs without contacting ZooKeeper. """
+  def __init__(self):
+    self.last_txid = 0
+    self.lease_size = 0
+
+  def create_transaction_id(self, project_id, xg):
+    self.last_txid += 1
+    return self.last_txid
+
+  def reserve_transaction_id(self, project_id):
+    return self.create_transaction_id(project_id, xg=False)
+
+  def set_groups(self, project_id, txid, groups):
+    pass
+
+  def delete_transaction_id(self, project_id, txid):
+    pass
+
+
+class StubDatastoreBatch(object):
+  """ Simulates Cassandra round trips with a fixed delay. """
+  def __init__(self, latency):
+    self.latency = latency
+
+  def valid_data_version_sync(self):
+    return True
+
+  @gen.coroutine
+  def batch_get_entity(self, table_name, row_keys, column_names):
+    yield gen.sleep(self.latency)
+    raise gen.Return({key: {} for key in row_keys})
+
+  @gen.coroutine
+  def normal_batch(self, mutations, txid):
+    yield gen.sleep(self.latency)
+
+
+def make_entity(project_id, group_index):
+  """ Creates an entity in its own group. """
+  entity = entity_pb.EntityProto()
+  key = entity.mutable_key()
+  key.set_app(project_id)
+  element = key.mutable_path().add_element()
+  element.set_type('Greeting')
+  element.set_name('group{}'.format(group_index))
+  entity.mutable_entity_group().add_element().CopyFrom(element)
+  prop = entity.add_property()
+  prop.set_name('content')
+  prop.set_multiple(False)
+  prop.mutable_value().set_stringvalue('hello world')
+  return entity
+
+
+@gen.coroutine
+def measure(datastore, entities, iterations):
+  """ Returns the average latency in seconds of a put_entities call. """
+  start = time.time()
+  for _ in xrange(iterations):
+    yield datastore.put_entities('guestbook', entities)
+
+  raise gen.Return((time.time() - start) / iterations)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--zk-latency', type=float, default=0.002,
+                      help='Simulated ZooKeeper lock round trip in seconds')
+  parser.add_argument('--db-latency', type=float, default=0.005,
+                      help='Simulated Cassandra round trip in seconds')
+  parser.add_argument('--iterations', type=int, default=5)
+  parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10],
+                      help='Values of MAX_CONCURRENT_GROUP_COMMITS to compare')
+  parser.add_argument('--groups', type=int, nargs='+',
+                      default=[1, 5, 10, 25, 50])
+  args = parser.parse_args()
+
+  @gen.coroutine
+  def acquire(lock):
+    yield gen.sleep(args.zk_latency)
+    lock.is_acquired = True
+    raise gen.Return(True)
+
+  def release(lock):
+    lock.is_acquired = False
+
+  datastore = DatastoreDistributed(
+    StubDatastoreBatch(args.db_latency), StubTransactionManager(),
+    zookeeper=StubZooKeeper())
+  datastore.get_indexes = lambda project_id: []
+
+  with patch.object(EntityLock, '__init__', lambda lock, *args: None), \
+       patch.object(EntityLock, 'acquire', acquire), \
+       patch.object(EntityLock, 'release', release), \
+       patch.object(EntityLock, 'is_acquired', False, create=True):
+    print('{:>8} {:>12} {:>12}'.format('groups', 'concurrency', 'latency ms'))
+    for concurrency in args.concurrency:
+      datastore.MAX_CONCURRENT_GROUP_COMMITS = concurrency
+      for group_count in args.groups:
+        entities = [make_entity('guestbook', index)
+                    for index in xrange(group_count)]
+        latency = IOLoop.current().run_sync(
+          lambda: measure(datastore, entities, args.iterations))
+        print('{:>8} {:>12} {:>12.1f}'.format(
+          group_count, concurrency, latency * 1000))
+
+
+if __name__ == '__main__':
+  main()
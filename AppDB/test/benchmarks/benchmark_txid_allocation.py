@@ -0,0 +1,101 @@
+""" Measures transaction ID throughput with and without leased blocks. """
+import argparse
+import time
+
+from appscale.datastore.zkappscale.transaction_manager import (
+  ProjectTransactionManager)
+
+
+class FakeTransaction(object):
+  """ Collects operations and applies them in one simulated round trip. """
+  def __init__(self, client):
+    self._client = client
+    self._operations = []
+
+  def create(self, path, value=b'', sequence=False):
+    self._operations.append(lambda: self._client.apply_create(path, sequence))
+
+  def delete(self, path):
+    self._operations.append(lambda: self._client.apply_delete(path))
+
+  def commit(self):
+    self._client.round_trip()
+    return [operation() for operation in self._operations]
+
+
+class FakeZooKeeper(object):
+  """ A kazoo client stand-in that charges a fixed latency per request. """
+  def __init__(self, latency):
+    self.latency = latency
+    self.requests = 0
+    self._sequence = 0
+
+  def round_trip(self):
+    self.requests += 1
+    time.sleep(self.latency)
+
+  def apply_create(self, path, sequence):
+    if not sequence:
+      return path
+
+    self._sequence += 1
+    return path + str(self._sequence).zfill(10)
+
+  def apply_delete(self, path):
+    return True
+
+  def create(self, path, value=b'', sequence=False):
+    self.round_trip()
+    return self.apply_create(path, sequence)
+
+  def delete(self, path, recursive=False):
+    self.round_trip()
+
+  def transaction(self):
+    return FakeTransaction(self)
+
+  def ensure_path(self, path):
+    pass
+
+  def DataWatch(self, path, func):
+    pass
+
+  def ChildrenWatch(self, path, func):
+    pass
+
+
+def measure(lease_size, latency, duration):
+  """ Returns txids/sec and ZooKeeper requests per txid for a mode. """
+  zk_client = FakeZooKeeper(latency)
+  tx_manager = ProjectTransactionManager('guestbook', zk_client,
+                                         lease_size=lease_size)
+  count = 0
+  start = time.time()
+  while time.time() - start < duration:
+    txid = tx_manager.reserve_transaction_id()
+    tx_manager.delete_transaction_id(txid)
+    count += 1
+
+  elapsed = time.time() - start
+  return count / elapsed, zk_client.requests / float(count)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--latency', type=float, default=0.001,
+                      help='Simulated ZooKeeper round trip in seconds')
+  parser.add_argument('--duration', type=float, default=2,
+                      help='Seconds to run each mode')
+  parser.add_argument('--lease-sizes', type=int, nargs='+',
+                      default=[0, 10, 20, 50],
+                      help='Lease sizes to compare (0 is one node per txid)')
+  args = parser.parse_args()
+
+  print('{:>10} {:>12} {:>16}'.format('lease', 'txids/sec', 'requests/txid'))
+  for lease_size in args.lease_sizes:
+    rate, requests = measure(lease_size, args.latency, args.duration)
+    print('{:>10} {:>12.0f} {:>16.2f}'.format(lease_size, rate, requests))
+
+
+if __name__ == '__main__':
+  main()
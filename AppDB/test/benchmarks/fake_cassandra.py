@@ -0,0 +1,69 @@
+""" A Cassandra session stand-in that simulates network latency. """
+import collections
+
+from tornado.ioloop import IOLoop
+
+
+class FakeResponseFuture(object):
+  """ Mimics the parts of a driver ResponseFuture used by TornadoCassandra. """
+  has_more_pages = False
+
+  def __init__(self, rows, latency):
+    """ Creates a new FakeResponseFuture.
+
+    Args:
+      rows: A list of result rows.
+      latency: A float specifying the number of seconds to wait before
+        delivering the rows.
+    """
+    self._rows = rows
+    self._latency = latency
+
+  def add_callbacks(self, callback, errback, callback_args=(),
+                    errback_args=()):
+    """ Schedules the callback to run after the simulated latency. """
+    IOLoop.current().call_later(
+      self._latency, callback, self._rows, *callback_args)
+
+  def result(self):
+    """ Returns the rows for this request. """
+    return self._rows
+
+
+class FakeSession(object):
+  """ A session that answers queries with a handler after a fixed delay. """
+  def __init__(self, handler, latency):
+    """ Creates a new FakeSession.
+
+    Args:
+      handler: A function that accepts a query and parameters and returns
+        a list of rows.
+      latency: A float specifying the round trip time in seconds.
+    """
+    self.handler = handler
+    self.latency = latency
+    self.requests = collections.Counter()
+
+  def execute_async(self, query, parameters=None, *args, **kwargs):
+    """ Runs a query against the handler. """
+    self.requests[type(query).__name__] += 1
+    return FakeResponseFuture(self.handler(query, parameters), self.latency)
+
+  def prepare(self, statement):
+    """ Prepared statements are passed through unchanged. """
+    self.requests['prepare'] += 1
+    return statement
+
+
+class FakeCluster(object):
+  """ A cluster that always connects to the same FakeSession. """
+  session = None
+
+  def __init__(self, *args, **kwargs):
+    pass
+
+  def connect(self, keyspace=None):
+    return self.session
+
+  def shutdown(self):
+    pass
@@ -0,0 +1,87 @@
+""" An in-memory stand-in for a kazoo client with simulated latency. """
+import threading
+import time
+
+from kazoo.exceptions import NoNodeError, NotEmptyError
+
+
+class FakeHandler(object):
+  event_object = threading.Event
+  lock_object = threading.Lock
+
+  @staticmethod
+  def sleep_func(seconds):
+    time.sleep(seconds)
+
+
+class FakeZooKeeper(object):
+  """ Keeps nodes in a dictionary and sleeps for each request.
+
+  Watches are never triggered, so locks must not contend in ZooKeeper.
+  Requests can be made from several threads.
+  """
+  def __init__(self, latency=0):
+    self.handler = FakeHandler()
+    self.latency = latency
+    self.requests = 0
+    self.nodes = {}
+    self.sequence = 0
+    self._nodes_lock = threading.Lock()
+
+  def _round_trip(self):
+    self.requests += 1
+    if self.latency:
+      time.sleep(self.latency)
+
+  def _children(self, path):
+    prefix = path + '/'
+    return [node[len(prefix):] for node in self.nodes
+            if node.startswith(prefix) and '/' not in node[len(prefix):]]
+
+  def ensure_path(self, path):
+    self._round_trip()
+    with self._nodes_lock:
+      self.nodes.setdefault(path, '')
+
+  def create(self, path, value='', sequence=False):
+    self._round_trip()
+    with self._nodes_lock:
+      if sequence:
+        self.sequence += 1
+        path += str(self.sequence).zfill(10)
+
+      self.nodes[path] = value
+      return path
+
+  def get_children(self, path):
+    self._round_trip()
+    with self._nodes_lock:
+      if path not in self.nodes:
+        raise NoNodeError()
+
+      return self._children(path)
+
+  def exists(self, path, watch=None):
+    self._round_trip()
+    with self._nodes_lock:
+      return path in self.nodes
+
+  def delete(self, path):
+    self._round_trip()
+    with self._nodes_lock:
+      if path not in self.nodes:
+        raise NoNodeError()
+
+      if self._children(path):
+        raise NotEmptyError()
+
+      del self.nodes[path]
+
+  def retry(self, func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+  def add_listener(self, listener):
+    pass
+
+  def remove_listener(self, listener):
+    pass
@@ -50,6 +50,9 @@ class TestCassandra(testing.AsyncTestCase):
       ('c', 'c1', '7'), ('c', 'c2', '8'), ('c', 'c3', '9'),
     ])
     self.execute_mock.return_value = async_response
+    # Mock prepare method of session
+    self.session_mock.prepare = mock.MagicMock(
+      side_effect=lambda query_str: mock.MagicMock(argument=query_str))
 
     # Call function under test
     keys = ['a', 'b', 'c']
@@ -60,8 +63,8 @@ class TestCassandra(testing.AsyncTestCase):
     query = self.execute_mock.call_args[0][0]
     parameters = self.execute_mock.call_args[1]["parameters"]
     self.assertEqual(
-      query.query_string,
-      'SELECT * FROM "table" WHERE key IN %s and column1 IN %s')
+      query.argument,
+      'SELECT * FROM "table" WHERE key IN ? and column1 IN ?')
     self.assertEqual(parameters, ([b'a', b'b', b'c'], ['c1', 'c2', 'c3']) )
     # And result matches expectation
     self.assertEqual(result, {
@@ -70,6 +73,40 @@ class TestCassandra(testing.AsyncTestCase):
       'c': {'c1': '7', 'c2': '8', 'c3': '9'}
     })
 
+  @testing.gen_test
+  def test_get_concurrent_chunks(self):
+    pending = []
+    max_pending = [0]
+
+    def execute(query, parameters):
+      keys, columns = parameters
+      response = Future()
+      pending.append((response, keys, columns))
+      max_pending[0] = max(max_pending[0], len(pending))
+      return response
+
+    def resolve_pending():
+      while pending:
+        response, keys, columns = pending.pop(0)
+        response.set_result([(str(key), column, 'v')
+                             for key in keys for column in columns])
+      if not batch_future.done():
+        self.io_loop.add_callback(resolve_pending)
+
+    self.execute_mock.side_effect = execute
+    self.db.fetch_concurrency = 3
+
+    keys = ['key{}'.format(index) for index in range(25)]
+    with mock.patch.object(cassandra_interface, 'ENTITY_FETCH_THRESHOLD', 2):
+      batch_future = self.db.batch_get_entity('table', keys, ['c1'])
+      self.io_loop.add_callback(resolve_pending)
+      result = yield batch_future
+
+    # 25 keys in chunks of 2 require 13 requests, at most 3 at a time.
+    self.assertEqual(self.execute_mock.call_count, 13)
+    self.assertEqual(max_pending[0], 3)
+    self.assertEqual(result, {key: {'c1': 'v'} for key in keys})
+
   @testing.gen_test
   def test_put(self):
     # Mock execute function response
@@ -110,6 +147,29 @@ class TestCassandra(testing.AsyncTestCase):
     # And result matches expectation
     self.assertEqual(result, None)
 
+  @testing.gen_test
+  def test_statement_cache(self):
+    async_response = Future()
+    async_response.set_result([])
+    self.execute_mock.return_value = async_response
+    self.session_mock.prepare = mock.MagicMock(
+      side_effect=lambda query_str: mock.MagicMock(argument=query_str))
+
+    yield self.db.batch_get_entity('table', ['a'], ['c1'])
+    yield self.db.batch_get_entity('table', ['b'], ['c1'])
+    yield self.db.range_query('table', ['c1'], 'a', 'b', 5)
+    yield self.db.range_query('table', ['c1'], 'a', 'b', 5,
+                              start_inclusive=False)
+
+    # Each distinct statement shape is only prepared once.
+    self.assertEqual(self.session_mock.prepare.call_count, 3)
+    self.assertEqual(self.db.statement_cache_stats(),
+                     {'hits': 1, 'misses': 3, 'statements': 3})
+
+    self.db.clear_statement_cache_stats()
+    self.assertEqual(self.db.statement_cache_stats(),
+                     {'hits': 0, 'misses': 0, 'statements': 3})
+
   @testing.gen_test
   def test_delete_table(self):
     # Mock cassandra response
@@ -138,6 +198,9 @@ class TestCassandra(testing.AsyncTestCase):
       ('keyC', 'c1', '7'), ('keyC', 'c2', '8')
     ])
     self.execute_mock.return_value = async_response
+    # Mock prepare method of session
+    self.session_mock.prepare = mock.MagicMock(
+      side_effect=lambda query_str: mock.MagicMock(argument=query_str))
 
     # Call function under test
     columns = ['c1', 'c2']
@@ -147,14 +210,15 @@ class TestCassandra(testing.AsyncTestCase):
     query = self.execute_mock.call_args[0][0]
     parameters = self.execute_mock.call_args[1]["parameters"]
     self.assertEqual(
-      query.query_string,
+      query.argument,
       'SELECT * FROM "tableZ" WHERE '
-      'token(key) >= %s AND '
-      'token(key) <= %s AND '
-      'column1 IN %s '
-      'LIMIT 10 '    # 5 * number of columns
+      'token(key) >= ? AND '
+      'token(key) <= ? AND '
+      'column1 IN ? '
+      'LIMIT ? '
       'ALLOW FILTERING')
-    self.assertEqual(parameters, (b'keyA', b'keyC', ['c1', 'c2']) )
+    # The limit is 5 * number of columns
+    self.assertEqual(parameters, (b'keyA', b'keyC', ['c1', 'c2'], 10))
     # And result matches expectation
     self.assertEqual(result, [
       {'keyA': {'c1': '1', 'c2': '2'}},
@@ -162,6 +226,42 @@ class TestCassandra(testing.AsyncTestCase):
       {'keyC': {'c1': '7', 'c2': '8'}}
     ])
 
+  def test_range_query_iter(self):
+    pages = {
+      None: mock.MagicMock(
+        current_rows=[('keyA', 'c1', '1'), ('keyA', 'c2', '2'),
+                      ('keyB', 'c1', '4')],
+        paging_state='page2'),
+      'page2': mock.MagicMock(
+        current_rows=[('keyB', 'c2', '5'), ('keyC', 'c1', '7'),
+                      ('keyC', 'c2', '8')],
+        paging_state='page3'),
+      'page3': mock.MagicMock(
+        current_rows=[('keyD', 'c1', '9'), ('keyD', 'c2', '10')],
+        paging_state=None)
+    }
+    self.session_mock.execute.side_effect = \
+      lambda statement, paging_state: pages[paging_state]
+
+    columns = ['c1', 'c2']
+    results = self.db.range_query_iter('tableZ', columns, 'keyA', 'keyD',
+                                       page_size=2)
+    self.assertEqual(list(results), [
+      {'keyA': {'c1': '1', 'c2': '2'}},
+      {'keyB': {'c1': '4', 'c2': '5'}},
+      {'keyC': {'c1': '7', 'c2': '8'}},
+      {'keyD': {'c1': '9', 'c2': '10'}}
+    ])
+    statement = self.session_mock.prepare.return_value.bind.return_value
+    self.assertEqual(statement.fetch_size, 4)
+
+    # Offsets are skipped and no pages are fetched past the limit.
+    self.session_mock.execute.reset_mock()
+    results = self.db.range_query_iter('tableZ', columns, 'keyA', 'keyD',
+                                       offset=1, limit=2, keys_only=True)
+    self.assertEqual(list(results), ['keyB', 'keyC'])
+    self.assertEqual(self.session_mock.execute.call_count, 2)
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -2,8 +2,11 @@
 # Programmer: Navraj Chohan <nlake44@gmail.com>
 
 import datetime
+import json
 import random
 import sys
+import threading
+import time
 import unittest
 
 from tornado import gen, testing
@@ -15,6 +18,9 @@ from appscale.datastore.datastore_distributed import DatastoreDistributed
 from appscale.datastore.dbconstants import APP_ENTITY_SCHEMA
 from appscale.datastore.dbconstants import JOURNAL_SCHEMA
 from appscale.datastore.dbconstants import TOMBSTONE
+from appscale.datastore.entity_cache import EntityCache
+from appscale.datastore.cassandra_env.cassandra_interface import\
+  LARGE_BATCH_THRESHOLD
 from appscale.datastore.cassandra_env.entity_id_allocator import\
   ScatteredAllocator
 
@@ -31,7 +37,9 @@ from appscale.datastore.utils import (
   get_kind_key
 )
 
+from appscale.datastore.scripts.transaction_groomer import ProjectGroomer
 from appscale.datastore.zkappscale.entity_lock import EntityLock
+from appscale.datastore.zkappscale.entity_lock import zk_group_path
 from appscale.datastore.zkappscale.zktransaction import ZKTransactionException
 from flexmock import flexmock
 
@@ -362,7 +370,8 @@ class TestDatastoreServer(testing.AsyncTestCase):
     db_batch.should_receive('batch_get_entity').and_return(async_result)
     db_batch.should_receive('normal_batch').and_return(ASYNC_NONE)
     transaction_manager = flexmock(
-      create_transaction_id=lambda project, xg: 1,
+      lease_size=0,
+      reserve_transaction_id=lambda project: 1,
       delete_transaction_id=lambda project, txid: None,
       set_groups=lambda project, txid, groups: None)
     dd = DatastoreDistributed(db_batch, transaction_manager,
@@ -408,7 +417,8 @@ class TestDatastoreServer(testing.AsyncTestCase):
     db_batch.should_receive('batch_get_entity').and_return(async_result)
     db_batch.should_receive('normal_batch').and_return(ASYNC_NONE)
     transaction_manager = flexmock(
-      create_transaction_id=lambda project, xg: 1,
+      lease_size=0,
+      reserve_transaction_id=lambda project: 1,
       delete_transaction_id=lambda project, txid: None,
       set_groups=lambda project, txid, groups: None)
     dd = DatastoreDistributed(db_batch, transaction_manager,
@@ -424,6 +434,251 @@ class TestDatastoreServer(testing.AsyncTestCase):
 
     yield dd.put_entities(app_id, entity_list)
 
+  @testing.gen_test
+  def test_put_entities_concurrent_groups(self):
+    app_id = 'test'
+    db_batch = flexmock()
+    db_batch.should_receive('valid_data_version_sync').and_return(True)
+    dd = DatastoreDistributed(db_batch, flexmock(), self.get_zookeeper())
+    dd.index_manager = flexmock(
+      projects={app_id: flexmock(indexes_pb=[])})
+    dd.MAX_CONCURRENT_GROUP_COMMITS = 3
+
+    entity_list = [
+      self.get_new_entity_proto(app_id, 'test_kind', 'name{}'.format(index),
+                                'prop1name', 'prop1val')
+      for index in range(5)]
+
+    in_progress = [0]
+    peak = [0]
+    committed = []
+
+    @gen.coroutine
+    def put_group(app, encoded_group_key, entities, composite_indexes):
+      in_progress[0] += 1
+      peak[0] = max(peak[0], in_progress[0])
+      yield gen.moment
+      in_progress[0] -= 1
+      committed.append(encoded_group_key)
+
+    dd.put_group = put_group
+    yield dd.put_entities(app_id, entity_list)
+    self.assertEqual(peak[0], 3)
+    self.assertEqual(len(committed), 5)
+
+    # Groups are not started after one of them fails.
+    @gen.coroutine
+    def failing_put_group(app, encoded_group_key, entities, composite_indexes):
+      committed.append(encoded_group_key)
+      raise dbconstants.AppScaleDBConnectionError('Unable to commit')
+
+    del committed[:]
+    dd.put_group = failing_put_group
+    dd.MAX_CONCURRENT_GROUP_COMMITS = 1
+    with self.assertRaises(dbconstants.AppScaleDBConnectionError):
+      yield dd.put_entities(app_id, entity_list)
+
+    self.assertEqual(len(committed), 1)
+
+  @testing.gen_test
+  def test_put_group_with_leased_txids(self):
+    app_id = 'test'
+    counter = [0]
+
+    class LeasingManager(object):
+      """ Leases blocks of IDs from a counter shared by all servers. """
+      lease_size = 3
+
+      def __init__(self):
+        self.leased = []
+
+      def create_transaction_id(self, project, xg):
+        counter[0] += 1
+        return counter[0]
+
+      def reserve_transaction_id(self, project):
+        if not self.leased:
+          self.leased = [self.create_transaction_id(project, False)
+                         for _ in range(self.lease_size)]
+        return self.leased.pop(0)
+
+      def set_groups(self, project, txid, groups):
+        pass
+
+      def delete_transaction_id(self, project, txid):
+        pass
+
+    group_versions = {}
+
+    class GroupBatch(object):
+      """ Keeps track of the last transaction ID used for each group. """
+      def valid_data_version_sync(self):
+        return True
+
+      @gen.coroutine
+      def group_versions(self, groups):
+        raise gen.Return({group: group_versions[group] for group in groups
+                          if group in group_versions})
+
+      @gen.coroutine
+      def batch_get_entity(self, table, keys, schema):
+        raise gen.Return({key: {} for key in keys})
+
+      @gen.coroutine
+      def normal_batch(self, batch, txid):
+        for mutation in batch:
+          if mutation['table'] == 'group_updates':
+            group_versions[str(mutation['key'])] = mutation['last_update']
+
+    async_true = gen.Future()
+    async_true.set_result(True)
+    entity_lock = flexmock(EntityLock)
+    entity_lock.should_receive('acquire').and_return(async_true)
+    entity_lock.should_receive('release')
+    entity_lock.should_receive('update_txid')
+
+    servers = []
+    for _ in range(2):
+      dd = DatastoreDistributed(GroupBatch(), LeasingManager(),
+                                self.get_zookeeper())
+      dd.index_manager = flexmock(
+        projects={app_id: flexmock(indexes_pb=[])})
+      servers.append(dd)
+
+    entity = self.get_new_entity_proto(
+      app_id, 'test_kind', 'bob', 'prop1name', 'prop1val')
+    group = entity_pb.Reference()
+    group.set_app(app_id)
+    group.mutable_path().add_element().MergeFrom(
+      entity.key().path().element(0))
+    encoded_group = group.Encode()
+
+    # The first server leases IDs 1-3, and the second leases 4-6.
+    yield servers[0].put_group(app_id, encoded_group, [entity], [])
+    self.assertEqual(group_versions[encoded_group], 1)
+    yield servers[1].put_group(app_id, encoded_group, [entity], [])
+    self.assertEqual(group_versions[encoded_group], 4)
+
+    # The first server's next leased ID is older than the group's last write,
+    # so a new one is used instead.
+    yield servers[0].put_group(app_id, encoded_group, [entity], [])
+    self.assertEqual(group_versions[encoded_group], 7)
+
+  @testing.gen_test
+  def test_groomer_removes_lock_after_txid_swap(self):
+    app_id = 'test'
+
+    class FakeZooKeeper(object):
+      """ Keeps nodes in a dictionary. """
+      handler = flexmock(event_object=threading.Event,
+                         lock_object=threading.Lock, sleep_func=time.sleep)
+
+      def __init__(self):
+        self.nodes = {}
+        self.sequence = 0
+
+      def ensure_path(self, path):
+        self.nodes.setdefault(path, '')
+
+      def create(self, path, value='', sequence=False):
+        if sequence:
+          self.sequence += 1
+          path += str(self.sequence).zfill(10)
+
+        self.nodes[path] = value
+        return path
+
+      def get(self, path):
+        return self.nodes[path], None
+
+      def set(self, path, value):
+        self.nodes[path] = value
+
+      def get_children(self, path):
+        prefix = path + '/'
+        return [node[len(prefix):] for node in self.nodes
+                if node.startswith(prefix) and '/' not in node[len(prefix):]]
+
+      def delete(self, path):
+        del self.nodes[path]
+
+      def retry(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+      def add_listener(self, listener):
+        pass
+
+    zk_client = FakeZooKeeper()
+
+    class FakeTornadoZooKeeper(object):
+      """ Provides the coroutine operations that the groomer uses. """
+      @gen.coroutine
+      def get(self, path):
+        raise gen.Return(zk_client.get(path))
+
+      @gen.coroutine
+      def get_children(self, path):
+        raise gen.Return(zk_client.get_children(path))
+
+      @gen.coroutine
+      def delete(self, path):
+        zk_client.delete(path)
+
+    class LeasingManager(object):
+      """ Hands out a leased ID that is older than the group's last write. """
+      lease_size = 3
+
+      def __init__(self):
+        self.txids = [1, 7]
+
+      def create_transaction_id(self, project, xg):
+        return self.txids.pop()
+
+      def reserve_transaction_id(self, project):
+        return self.txids.pop(0)
+
+      def set_groups(self, project, txid, groups):
+        zk_client.create('/txids/{}/groups'.format(txid),
+                         json.dumps([zk_group_path(group)
+                                     for group in groups]))
+
+      def delete_transaction_id(self, project, txid):
+        del zk_client.nodes['/txids/{}/groups'.format(txid)]
+
+    entity = self.get_new_entity_proto(
+      app_id, 'test_kind', 'bob', 'prop1name', 'x' * LARGE_BATCH_THRESHOLD)
+    group = entity_pb.Reference()
+    group.set_app(app_id)
+    group.mutable_path().add_element().MergeFrom(
+      entity.key().path().element(0))
+    encoded_group = group.Encode()
+
+    db_batch = flexmock()
+    db_batch.should_receive('valid_data_version_sync').and_return(True)
+    db_batch.should_receive('group_versions').\
+      and_return(gen.maybe_future({encoded_group: 5}))
+    db_batch.should_receive('batch_get_entity').replace_with(
+      lambda table, keys, schema: gen.maybe_future({key: {} for key in keys}))
+    db_batch.should_receive('large_batch').\
+      and_raise(dbconstants.AppScaleDBConnectionError('Batch failed'))
+
+    zookeeper = flexmock(handle=zk_client)
+    dd = DatastoreDistributed(db_batch, LeasingManager(), zookeeper)
+    dd.index_manager = flexmock(projects={app_id: flexmock(indexes_pb=[])})
+
+    # The batch fails after it is marked as applied, so the lock is kept for
+    # the groomer to clean up under the replacement ID.
+    with self.assertRaises(dbconstants.AppScaleDBConnectionError):
+      yield dd.put_group(app_id, encoded_group, [entity], [])
+
+    lock_path = zk_group_path(group)
+    self.assertEqual(len(zk_client.get_children(lock_path)), 1)
+
+    groomer = ProjectGroomer.__new__(ProjectGroomer)
+    groomer._tornado_zk = FakeTornadoZooKeeper()
+    yield groomer._remove_locks(7, '/txids/7')
+    self.assertEqual(zk_client.get_children(lock_path), [])
+
   def test_acquire_locks_for_trans(self):
     zk_client = flexmock()
     zk_client.should_receive('add_listener')
@@ -587,6 +842,134 @@ class TestDatastoreServer(testing.AsyncTestCase):
     yield dd.dynamic_get("test", get_req, get_resp)
     self.assertEquals(get_resp.entity_size(), 1)
 
+  @testing.gen_test
+  def test_dynamic_get_cached(self):
+    entity_proto1 = self.get_new_entity_proto(
+      "test", "test_kind", "nancy", "prop1name", "prop2val", ns="blah")
+    row_key = "test\x00blah\x00test_kind:nancy\x01"
+    group = entity_proto1.key().Encode()
+
+    zk_client = flexmock()
+    zk_client.should_receive('add_listener')
+    zookeeper = flexmock(handle=zk_client)
+
+    async_result = gen.Future()
+    async_result.set_result({
+      row_key: {
+        APP_ENTITY_SCHEMA[0]: entity_proto1.Encode(),
+        APP_ENTITY_SCHEMA[1]: 1
+      }
+    })
+    versions = [{group: 1}, {group: 1}, {group: 2}]
+
+    def group_versions(groups):
+      future = gen.Future()
+      future.set_result(versions.pop(0))
+      return future
+
+    db_batch = flexmock()
+    db_batch.should_receive('valid_data_version_sync').and_return(True)
+    db_batch.should_receive('group_versions').replace_with(group_versions)
+    db_batch.should_receive('batch_get_entity').and_return(async_result).\
+      times(2)
+
+    transaction_manager = flexmock()
+    dd = DatastoreDistributed(db_batch, transaction_manager, zookeeper,
+                              entity_cache=EntityCache(10000))
+
+    get_req = datastore_pb.GetRequest()
+    get_req.add_key().MergeFrom(entity_proto1.key())
+
+    # The second get is served from the cache, and the third one is fetched
+    # again since the group was modified.
+    for _ in range(3):
+      get_resp = datastore_pb.GetResponse()
+      yield dd.dynamic_get("test", get_req, get_resp)
+      self.assertEquals(get_resp.entity_size(), 1)
+      self.assertEquals(get_resp.entity(0).entity(), entity_proto1)
+
+    self.assertEqual(dd.entity_cache['test'].stats()['hits'], 1)
+    self.assertEqual(dd.entity_cache['test'].stats()['misses'], 2)
+
+  @testing.gen_test
+  def test_dynamic_get_cached_during_batch(self):
+    old_entity = self.get_new_entity_proto(
+      "test", "test_kind", "nancy", "prop1name", "old", ns="blah")
+    new_entity = self.get_new_entity_proto(
+      "test", "test_kind", "nancy", "prop1name", "new", ns="blah")
+    row_key = "test\x00blah\x00test_kind:nancy\x01"
+    group = old_entity.key().Encode()
+
+    group_versions = {group: 1}
+    rows = {row_key: {APP_ENTITY_SCHEMA[0]: old_entity.Encode(),
+                      APP_ENTITY_SCHEMA[1]: '1'}}
+    fetches = []
+
+    class InterleavedBatch(object):
+      """ Serves the rows of a batch that has only partially been applied. """
+      def valid_data_version_sync(self):
+        return True
+
+      @gen.coroutine
+      def group_versions(self, groups):
+        raise gen.Return({group_key: group_versions[group_key]
+                          for group_key in groups})
+
+      @gen.coroutine
+      def batch_get_entity(self, table, keys, schema):
+        fetches.append(keys)
+        raise gen.Return({key: dict(rows[key]) for key in keys})
+
+      @gen.coroutine
+      def normal_batch(self, batch, txid):
+        for mutation in batch:
+          if mutation['table'] == 'group_updates':
+            group_versions[str(mutation['key'])] = mutation['last_update']
+          elif mutation['table'] == dbconstants.APP_ENTITY_TABLE:
+            rows[mutation['key']] = mutation['values']
+
+    transaction_manager = flexmock(
+      lease_size=0,
+      reserve_transaction_id=lambda project: 3,
+      delete_transaction_id=lambda project, txid: None,
+      set_groups=lambda project, txid, groups: None)
+    dd = DatastoreDistributed(InterleavedBatch(), transaction_manager,
+                              self.get_zookeeper(),
+                              entity_cache=EntityCache(10000))
+    dd.index_manager = flexmock(projects={'test': flexmock(indexes_pb=[])})
+
+    get_req = datastore_pb.GetRequest()
+    get_req.add_key().MergeFrom(old_entity.key())
+
+    # Another server's batch has updated the group's version but not the row.
+    group_versions[group] = 2
+    get_resp = datastore_pb.GetResponse()
+    yield dd.dynamic_get("test", get_req, get_resp)
+    self.assertEquals(get_resp.entity(0).entity(), old_entity)
+
+    # Once the batch finishes, the new row is fetched instead of being served
+    # from the cache.
+    rows[row_key] = {APP_ENTITY_SCHEMA[0]: new_entity.Encode(),
+                     APP_ENTITY_SCHEMA[1]: '2'}
+    get_resp = datastore_pb.GetResponse()
+    yield dd.dynamic_get("test", get_req, get_resp)
+    self.assertEquals(get_resp.entity(0).entity(), new_entity)
+    self.assertEqual(len(fetches), 2)
+
+    # Rows that this server commits are cached once the batch is applied.
+    async_true = gen.Future()
+    async_true.set_result(True)
+    entity_lock = flexmock(EntityLock)
+    entity_lock.should_receive('acquire').and_return(async_true)
+    entity_lock.should_receive('release')
+    yield dd.put_group('test', group, [old_entity], [])
+    del fetches[:]
+
+    get_resp = datastore_pb.GetResponse()
+    yield dd.dynamic_get("test", get_req, get_resp)
+    self.assertEquals(get_resp.entity(0).entity(), old_entity)
+    self.assertEqual(fetches, [])
+
   @testing.gen_test
   def test_ancestor_query(self):
     query = datastore_pb.Query()
@@ -710,7 +1093,8 @@ class TestDatastoreServer(testing.AsyncTestCase):
     db_batch = flexmock()
     db_batch.should_receive('valid_data_version_sync').and_return(True)
     transaction_manager = flexmock(
-      create_transaction_id=lambda project, xg: 1,
+      lease_size=0,
+      reserve_transaction_id=lambda project: 1,
       delete_transaction_id=lambda project, txid: None,
       set_groups=lambda project_id, txid, groups: None)
     dd = DatastoreDistributed(db_batch, transaction_manager,
@@ -942,20 +1326,24 @@ class TestDatastoreServer(testing.AsyncTestCase):
     self.assertEqual(mutations[3]['table'], dbconstants.DSC_PROPERTY_TABLE)
 
     # Updating an entity with one property should delete two entries and add
-    # four more.
+    # three more.
     new_entity = entity_pb.EntityProto()
     new_entity.MergeFrom(entity)
     new_entity.property_list()[0].value().set_stringvalue('updated content')
     mutations = mutations_for_entity(entity, txn, new_entity)
-    self.assertEqual(len(mutations), 6)
+    self.assertEqual(len(mutations), 5)
     self.assertEqual(mutations[0]['table'], dbconstants.ASC_PROPERTY_TABLE)
     self.assertEqual(mutations[0]['operation'], dbconstants.Operations.DELETE)
     self.assertEqual(mutations[1]['table'], dbconstants.DSC_PROPERTY_TABLE)
     self.assertEqual(mutations[1]['operation'], dbconstants.Operations.DELETE)
     self.assertEqual(mutations[2]['table'], dbconstants.APP_ENTITY_TABLE)
-    self.assertEqual(mutations[3]['table'], dbconstants.APP_KIND_TABLE)
-    self.assertEqual(mutations[4]['table'], dbconstants.ASC_PROPERTY_TABLE)
-    self.assertEqual(mutations[5]['table'], dbconstants.DSC_PROPERTY_TABLE)
+    self.assertEqual(mutations[3]['table'], dbconstants.ASC_PROPERTY_TABLE)
+    self.assertEqual(mutations[4]['table'], dbconstants.DSC_PROPERTY_TABLE)
+
+    # Writing the same entity again should only update the entity table.
+    mutations = mutations_for_entity(entity, txn, entity)
+    self.assertEqual(len(mutations), 1)
+    self.assertEqual(mutations[0]['table'], dbconstants.APP_ENTITY_TABLE)
 
     prop = entity.add_property()
     prop.set_name('author')
@@ -970,7 +1358,7 @@ class TestDatastoreServer(testing.AsyncTestCase):
     value.set_stringvalue('author1')
 
     # Updating one property of an entity with two properties and one composite
-    # index should remove three entries and add seven more.
+    # index should remove three entries and add three more.
     composite_index = entity_pb.CompositeIndex()
     composite_index.set_id(123)
     composite_index.set_app_id('guestbook')
@@ -985,7 +1373,7 @@ class TestDatastoreServer(testing.AsyncTestCase):
 
     mutations = mutations_for_entity(entity, txn, new_entity,
                                      (composite_index,))
-    self.assertEqual(len(mutations), 10)
+    self.assertEqual(len(mutations), 7)
     self.assertEqual(mutations[0]['table'], dbconstants.ASC_PROPERTY_TABLE)
     self.assertEqual(mutations[0]['operation'], dbconstants.Operations.DELETE)
     self.assertEqual(mutations[1]['table'], dbconstants.DSC_PROPERTY_TABLE)
@@ -993,12 +1381,9 @@ class TestDatastoreServer(testing.AsyncTestCase):
     self.assertEqual(mutations[2]['table'], dbconstants.COMPOSITE_TABLE)
     self.assertEqual(mutations[2]['operation'], dbconstants.Operations.DELETE)
     self.assertEqual(mutations[3]['table'], dbconstants.APP_ENTITY_TABLE)
-    self.assertEqual(mutations[4]['table'], dbconstants.APP_KIND_TABLE)
-    self.assertEqual(mutations[5]['table'], dbconstants.ASC_PROPERTY_TABLE)
-    self.assertEqual(mutations[6]['table'], dbconstants.ASC_PROPERTY_TABLE)
-    self.assertEqual(mutations[7]['table'], dbconstants.DSC_PROPERTY_TABLE)
-    self.assertEqual(mutations[8]['table'], dbconstants.DSC_PROPERTY_TABLE)
-    self.assertEqual(mutations[9]['table'], dbconstants.COMPOSITE_TABLE)
+    self.assertEqual(mutations[4]['table'], dbconstants.ASC_PROPERTY_TABLE)
+    self.assertEqual(mutations[5]['table'], dbconstants.DSC_PROPERTY_TABLE)
+    self.assertEqual(mutations[6]['table'], dbconstants.COMPOSITE_TABLE)
 
   @testing.gen_test
   def test_apply_txn_changes(self):
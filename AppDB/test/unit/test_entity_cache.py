@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import unittest
+
+from appscale.datastore.entity_cache import ENTRY_OVERHEAD
+from appscale.datastore.entity_cache import EntityCache
+from appscale.datastore.entity_cache import ProjectEntityCache
+
+
+class TestProjectEntityCache(unittest.TestCase):
+  def test_version_mismatch(self):
+    cache = ProjectEntityCache(10000)
+    cache.put('key1', 5, {'entity': 'value'})
+    self.assertEqual(cache.get('key1', 5), {'entity': 'value'})
+
+    # An entry from an older version of the group is dropped.
+    self.assertIsNone(cache.get('key1', 6))
+    self.assertIsNone(cache.get('key1', 5))
+    self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'evictions': 0,
+                                     'entries': 0, 'bytes': 0})
+
+    # Entities that don't exist can be cached too.
+    cache.put('key2', None, {})
+    self.assertEqual(cache.get('key2', None), {})
+
+  def test_eviction(self):
+    entry_size = len('key1') + len('value') + ENTRY_OVERHEAD
+    cache = ProjectEntityCache(entry_size * 2)
+    cache.put('key1', 1, {'entity': 'value'})
+    cache.put('key2', 1, {'entity': 'value'})
+
+    # Reading key1 makes key2 the least recently used entry.
+    cache.get('key1', 1)
+    cache.put('key3', 1, {'entity': 'value'})
+    self.assertIsNone(cache.get('key2', 1))
+    self.assertEqual(cache.get('key1', 1), {'entity': 'value'})
+    self.assertEqual(cache.stats()['evictions'], 1)
+    self.assertEqual(cache.size, entry_size * 2)
+
+    # Entries that exceed the budget are not stored.
+    cache.put('key4', 1, {'entity': 'v' * entry_size * 2})
+    self.assertIsNone(cache.get('key4', 1))
+
+    cache.discard(['key1', 'key3'])
+    self.assertEqual(cache.size, 0)
+
+
+class TestEntityCache(unittest.TestCase):
+  def test_project_budgets(self):
+    cache = EntityCache(1000)
+    cache['project1'].put('key1', 1, {'entity': 'v' * 500})
+    cache['project2'].put('key1', 1, {'entity': 'v' * 500})
+    cache['project2'].put('key2', 1, {'entity': 'v' * 500})
+
+    # Filling one project's budget does not affect another project.
+    self.assertIsNotNone(cache['project1'].get('key1', 1))
+    self.assertIsNone(cache['project2'].get('key1', 1))
+    self.assertEqual(cache.stats()['project1']['evictions'], 0)
+    self.assertEqual(cache.stats()['project2']['evictions'], 1)
+
+    cache.clear_stats()
+    self.assertEqual(cache.stats()['project2']['misses'], 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+import sys
+import threading
+import time
+import unittest
+
+from kazoo.exceptions import NoNodeError, NotEmptyError
+from tornado import gen, testing
+
+from appscale.common.unpackaged import APPSCALE_PYTHON_APPSERVER
+from appscale.datastore.zkappscale.entity_lock import EntityLock
+
+sys.path.append(APPSCALE_PYTHON_APPSERVER)
+from google.appengine.datastore import entity_pb
+
+
+class FakeHandler(object):
+  event_object = threading.Event
+  lock_object = threading.Lock
+
+  @staticmethod
+  def sleep_func(seconds):
+    time.sleep(seconds)
+
+
+class FakeZooKeeper(object):
+  """ Keeps nodes in a dictionary. Watches are triggered by deletions. """
+  def __init__(self):
+    self.handler = FakeHandler()
+    self.nodes = {}
+    self.watches = {}
+    self.sequence = 0
+
+  def ensure_path(self, path):
+    self.nodes.setdefault(path, '')
+
+  def create(self, path, value='', sequence=False):
+    if sequence:
+      self.sequence += 1
+      path += str(self.sequence).zfill(10)
+
+    self.nodes[path] = value
+    return path
+
+  def children(self, path):
+    prefix = path + '/'
+    return [node[len(prefix):] for node in list(self.nodes)
+            if node.startswith(prefix) and '/' not in node[len(prefix):]]
+
+  def get_children(self, path):
+    if path not in self.nodes:
+      raise NoNodeError()
+
+    return self.children(path)
+
+  def exists(self, path, watch=None):
+    if watch is not None:
+      self.watches.setdefault(path, []).append(watch)
+
+    return path in self.nodes
+
+  def delete(self, path):
+    if path not in self.nodes:
+      raise NoNodeError()
+
+    if self.children(path):
+      raise NotEmptyError()
+
+    del self.nodes[path]
+    for watch in self.watches.pop(path, []):
+      watch(None)
+
+  def retry(self, func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+  def add_listener(self, listener):
+    pass
+
+  def remove_listener(self, listener):
+    pass
+
+
+def group_key(name):
+  key = entity_pb.Reference()
+  key.set_app('guestbook')
+  element = key.mutable_path().add_element()
+  element.set_type('Greeting')
+  element.set_name(name)
+  return key
+
+
+class TestEntityLock(testing.AsyncTestCase):
+  def setUp(self):
+    super(TestEntityLock, self).setUp()
+    self.client = FakeZooKeeper()
+
+  @testing.gen_test
+  def test_disjoint_groups(self):
+    lock1 = EntityLock(self.client, [group_key('a')], 1)
+    lock2 = EntityLock(self.client, [group_key('b')], 2)
+
+    # Locks on different groups can be held at the same time.
+    yield lock1.acquire()
+    yield lock2.acquire()
+    self.assertTrue(lock1.is_acquired and lock2.is_acquired)
+
+    lock1.release()
+    lock2.release()
+    self.assertEqual(EntityLock._group_locks, {})
+
+  @testing.gen_test
+  def test_same_group(self):
+    lock1 = EntityLock(self.client, [group_key('a')], 1)
+    lock2 = EntityLock(self.client, [group_key('b'), group_key('a')], 2)
+
+    yield lock1.acquire()
+    acquire_future = lock2.acquire()
+    yield gen.moment
+    self.assertFalse(acquire_future.done())
+
+    # The second lock gets the group once the first one releases it.
+    lock1.release()
+    yield acquire_future
+    self.assertTrue(lock2.is_acquired)
+    self.assertEqual(len(EntityLock._group_locks), 2)
+
+    lock2.release()
+    self.assertEqual(EntityLock._group_locks, {})
+
+  @testing.gen_test
+  def test_held_by_other_process(self):
+    group_path = EntityLock(self.client, [group_key('a')]).paths[0]
+    self.client.ensure_path(group_path)
+    other_node = self.client.create(group_path + '/other__lock__',
+                                    sequence=True)
+
+    # Waiting for a group that another process holds does not block the
+    # IOLoop, so this process can still lock and release other groups.
+    lock1 = EntityLock(self.client, [group_key('a')], 1)
+    acquire_future = lock1.acquire()
+    lock2 = EntityLock(self.client, [group_key('b')], 2)
+    yield lock2.acquire()
+    lock2.release()
+    self.assertFalse(acquire_future.done())
+
+    self.client.delete(other_node)
+    yield acquire_future
+    self.assertTrue(lock1.is_acquired)
+
+    lock1.release()
+    self.assertEqual(EntityLock._group_locks, {})
+
+  @testing.gen_test
+  def test_ensure_release(self):
+    lock = EntityLock(self.client, [group_key('a')], 1)
+    yield lock.acquire()
+
+    # If the ZooKeeper lock is left behind, the tornado lock is still freed.
+    lock.ensure_release_tornado_lock()
+    lock.ensure_release_tornado_lock()
+    self.assertEqual(EntityLock._group_locks, {})
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -107,7 +107,7 @@ class TestGroomer(unittest.TestCase):
     zookeeper = flexmock()
     dsg = groomer.DatastoreGroomer(zookeeper, "cassandra", "localhost:8888")
     dsg = flexmock(dsg)
-    dsg.should_receive("get_entity_batch").and_return([])
+    dsg.should_receive("get_entity_batches").and_return([])
     dsg.should_receive("process_entity")
     dsg.should_receive("update_statistics").and_raise(Exception)
     dsg.should_receive("remove_old_logs").and_return()
@@ -0,0 +1,73 @@
+import unittest
+
+from appscale.datastore.multipart import MultipartError
+from appscale.datastore.multipart import MultipartParser
+
+
+class RecordingDelegate(object):
+  def __init__(self):
+    self.parts = []
+
+  def start_part(self, headers):
+    self.parts.append([headers, ''])
+
+  def part_data(self, data):
+    self.parts[-1][1] += data
+
+  def finish_part(self):
+    self.parts[-1].append(True)
+
+
+BOUNDARY = 'xYzZY'
+
+BODY = '\r\n'.join([
+  'preamble',
+  '--xYzZY',
+  'Content-Disposition: form-data; name="field"',
+  '',
+  'value',
+  '--xYzZY',
+  'Content-Disposition: form-data; name="file"; filename="a.bin"',
+  'Content-Type: application/octet-stream',
+  '',
+  'line1\r\n--xYz not a boundary\r\n\r\nline3',
+  '--xYzZY--',
+  'epilogue'])
+
+
+class TestMultipartParser(unittest.TestCase):
+  def check_parts(self, delegate):
+    self.assertEqual(len(delegate.parts), 2)
+    field_headers, field_value, field_done = delegate.parts[0]
+    self.assertEqual(field_headers['Content-Disposition'],
+                     'form-data; name="field"')
+    self.assertEqual((field_value, field_done), ('value', True))
+
+    file_headers, file_value, file_done = delegate.parts[1]
+    self.assertEqual(file_headers['Content-Type'], 'application/octet-stream')
+    self.assertEqual(file_value, 'line1\r\n--xYz not a boundary\r\n\r\nline3')
+    self.assertTrue(file_done)
+
+  def test_split_feeds(self):
+    for split in range(len(BODY) + 1):
+      delegate = RecordingDelegate()
+      parser = MultipartParser(BOUNDARY, delegate)
+      parser.feed(BODY[:split])
+      parser.feed(BODY[split:])
+      self.assertTrue(parser.done)
+      self.check_parts(delegate)
+
+    delegate = RecordingDelegate()
+    parser = MultipartParser(BOUNDARY, delegate)
+    for byte in BODY:
+      parser.feed(byte)
+    self.check_parts(delegate)
+
+  def test_oversized_headers(self):
+    parser = MultipartParser(BOUNDARY, RecordingDelegate())
+    parser.feed('--xYzZY\r\n')
+    self.assertRaises(MultipartError, parser.feed, 'a' * 100000)
+
+
+if __name__ == "__main__":
+  unittest.main()
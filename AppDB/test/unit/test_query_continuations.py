@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import sys
+import unittest
+
+from appscale.common.unpackaged import APPSCALE_PYTHON_APPSERVER
+from appscale.datastore.query_continuations import QueryContinuations
+from appscale.datastore.query_continuations import QueryPlan
+
+sys.path.append(APPSCALE_PYTHON_APPSERVER)
+from google.appengine.datastore import datastore_pb
+
+
+def make_cursor(start_key):
+  cursor = datastore_pb.CompiledCursor()
+  cursor.add_position().set_start_key(start_key)
+  return cursor
+
+
+def make_query(kind, cursor=None):
+  query = datastore_pb.Query()
+  query.set_app('guestbook')
+  query.set_kind(kind)
+  if cursor is not None:
+    query.mutable_compiled_cursor().CopyFrom(cursor)
+  return query
+
+
+class TestQueryContinuations(unittest.TestCase):
+  def test_resume(self):
+    table = QueryContinuations(10)
+    plan = QueryPlan({}, [], None, None)
+    table.put(make_query('Greeting'), make_cursor('a'), plan)
+
+    # Queries without a cursor are always planned.
+    self.assertIsNone(table.pop(make_query('Greeting')))
+
+    # The AppServer changes the count between batches.
+    query = make_query('Greeting', make_cursor('a'))
+    query.set_count(50)
+    self.assertIs(table.pop(query), plan)
+
+    # A continuation is only used once.
+    self.assertIsNone(table.pop(query))
+
+    table.put(make_query('Greeting'), make_cursor('a'), plan)
+    self.assertIsNone(table.pop(make_query('Greeting', make_cursor('b'))))
+    self.assertIsNone(table.pop(make_query('Author', make_cursor('a'))))
+    self.assertEqual(table.stats(), {'hits': 1, 'misses': 3, 'evictions': 0,
+                                     'entries': 1})
+
+  def test_bounds(self):
+    table = QueryContinuations(2)
+    plan = QueryPlan({}, [], None, None)
+    for start_key in ('a', 'b', 'c'):
+      table.put(make_query('Greeting'), make_cursor(start_key), plan)
+
+    self.assertIsNone(table.pop(make_query('Greeting', make_cursor('a'))))
+    self.assertIs(table.pop(make_query('Greeting', make_cursor('c'))), plan)
+    self.assertEqual(table.stats()['evictions'], 1)
+
+    table = QueryContinuations(2, ttl=-1)
+    table.put(make_query('Greeting'), make_cursor('a'), plan)
+    self.assertIsNone(table.pop(make_query('Greeting', make_cursor('a'))))
+    self.assertEqual(table.stats()['entries'], 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+import bisect
+import sys
+import unittest
+
+from tornado import gen, testing
+
+from appscale.common.unpackaged import APPSCALE_PYTHON_APPSERVER
+from appscale.datastore.range_iterator import RangeExhausted, RangeIterator
+from appscale.datastore.utils import encode_index_pb
+
+sys.path.append(APPSCALE_PYTHON_APPSERVER)
+from google.appengine.datastore import entity_pb
+
+
+def entity_path(entity_id):
+  path = entity_pb.Path()
+  element = path.add_element()
+  element.set_type('Greeting')
+  element.set_id(entity_id)
+  return path
+
+
+class FakeIndex(object):
+  """ Serves range queries from a sorted list of index keys. """
+  def __init__(self, keys):
+    self.keys = sorted(keys)
+    self.requests = []
+
+  @gen.coroutine
+  def range_query(self, table, schema, start, end, limit,
+                  start_inclusive=True):
+    self.requests.append(limit)
+    if start_inclusive:
+      index = bisect.bisect_left(self.keys, start)
+    else:
+      index = bisect.bisect_right(self.keys, start)
+
+    keys = [key for key in self.keys[index:index + limit] if key <= end]
+    raise gen.Return([{key: {'reference': key}} for key in keys])
+
+
+class TestRangeIterator(testing.AsyncTestCase):
+  def new_range(self, entity_ids):
+    value = entity_pb.PropertyValue()
+    value.set_stringvalue('hello')
+    range_ = RangeIterator(None, 'guestbook', '', 'Greeting', 'content',
+                           value)
+    keys = [range_.prefix + str(encode_index_pb(entity_path(entity_id)))
+            for entity_id in entity_ids]
+    range_._db = FakeIndex(keys)
+    return range_
+
+  @testing.gen_test
+  def test_seek_within_chunk(self):
+    range_ = self.new_range(range(1, 1001))
+    range_.chunk_size = 500
+
+    entry = yield range_.async_next()
+    self.assertEqual(entry.path.element(0).id(), 1)
+
+    # Seeking within the cached chunk does not require another fetch.
+    range_.set_cursor(entity_path(400), inclusive=True)
+    entry = yield range_.async_next()
+    self.assertEqual(entry.path.element(0).id(), 400)
+    range_.set_cursor(entity_path(400), inclusive=False)
+    entry = yield range_.async_next()
+    self.assertEqual(entry.path.element(0).id(), 401)
+    self.assertEqual(len(range_._db.requests), 1)
+
+    # Seeking past the chunk fetches from the new position. Since entries
+    # from the previous chunk were used, the next chunk is larger.
+    range_.set_cursor(entity_path(900), inclusive=False)
+    entry = yield range_.async_next()
+    self.assertEqual(entry.path.element(0).id(), 901)
+    self.assertEqual(range_._db.requests, [500, 1000])
+
+    for expected_id in range(902, 1001):
+      entry = yield range_.async_next()
+      self.assertEqual(entry.path.element(0).id(), expected_id)
+
+    with self.assertRaises(RangeExhausted):
+      yield range_.async_next()
+
+  @testing.gen_test
+  def test_chunks_shrink_when_skipped(self):
+    range_ = self.new_range(range(1, 1001))
+    range_.chunk_size = 400
+
+    yield range_.fill()
+    range_.set_cursor(entity_path(500), inclusive=True)
+    entry = yield range_.async_next()
+    self.assertEqual(entry.path.element(0).id(), 500)
+    self.assertEqual(range_._db.requests, [400, 200])
+
+  @testing.gen_test
+  def test_chunks_grow_when_read_in_order(self):
+    range_ = self.new_range(range(1, 1001))
+    range_.chunk_size = range_.MIN_CHUNK_SIZE
+
+    entry_ids = []
+    while True:
+      try:
+        entry = yield range_.async_next()
+      except RangeExhausted:
+        break
+
+      entry_ids.append(entry.path.element(0).id())
+
+    self.assertEqual(entry_ids, range(1, 1001))
+    self.assertEqual(range_._db.requests, [100, 200, 400, 800])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -49,6 +49,46 @@ class TestDatastoreServer(unittest.TestCase):
       call('{}/txids2/tx'.format(project_node), value=ANY, sequence=True)]
     zk_client.create.assert_has_calls(calls)
 
+  def test_reserve_transaction_id(self):
+    project_id = 'guestbook'
+    project_node = '/appscale/apps/{}'.format(project_id)
+
+    zk_client = MagicMock()
+    tx_manager = ProjectTransactionManager(project_id, zk_client,
+                                           lease_size=3)
+
+    # A block of counters is created with one request, skipping txid 0.
+    lease = MagicMock()
+    lease.commit.return_value = [
+      '{}/txids/tx0000000000'.format(project_node),
+      '{}/txids/tx0000000001'.format(project_node),
+      '{}/txids/tx0000000002'.format(project_node)]
+    zk_client.transaction = MagicMock(return_value=lease)
+    self.assertEqual(tx_manager.reserve_transaction_id(), 1)
+    self.assertEqual(tx_manager.reserve_transaction_id(), 2)
+    self.assertEqual(lease.create.call_count, 3)
+    lease.create.assert_called_with('{}/txids/tx'.format(project_node),
+                                    value=ANY, sequence=True)
+    zk_client.create.assert_not_called()
+
+    # Leased IDs that are too old are discarded.
+    lease.commit.return_value = [
+      '{}/txids/tx0000000003'.format(project_node),
+      '{}/txids/tx0000000004'.format(project_node),
+      '{}/txids/tx0000000005'.format(project_node)]
+    tx_manager._lease_txids()
+    tx_manager._leased_txids[0] = (3, 0)
+    tx_manager._delete_counters = MagicMock()
+    self.assertEqual(tx_manager.reserve_transaction_id(), 4)
+    tx_manager._delete_counters.assert_called_with(
+      ['{}/txids/tx0000000003'.format(project_node)])
+
+    # Without a lease size, each ID gets its own request.
+    tx_manager = ProjectTransactionManager(project_id, zk_client)
+    zk_client.create = MagicMock(
+      return_value='{}/txids/tx0000000007'.format(project_node))
+    self.assertEqual(tx_manager.reserve_transaction_id(), 7)
+
   def test_delete_transaction_id(self):
     project_id = 'guestbook'
     project_node = '/appscale/apps/{}'.format(project_id)
@@ -1,7 +1,22 @@
+import struct
+import sys
 import unittest
 
+from appscale.common.unpackaged import APPSCALE_PYTHON_APPSERVER
 from appscale.datastore import utils
 
+sys.path.append(APPSCALE_PYTHON_APPSERVER)
+from google.appengine.datastore import entity_pb
+from google.appengine.datastore import sortable_pb_encoder
+
+
+def generic_encoding(value):
+  """ Encodes a PropertyValue with sortable_pb_encoder. """
+  encoder = sortable_pb_encoder.Encoder()
+  value.Output(encoder)
+  return encoder.buffer().tostring().replace('\x01', '\x01\x02').\
+    replace('\x00', '\x01\x01')
+
 
 class TestUtils(unittest.TestCase):
   def test_decode_path(self):
@@ -30,3 +45,54 @@ class TestUtils(unittest.TestCase):
     self.assertEqual(path.element_size(), 1)
     self.assertEqual(path.element(0).type(), 'Greeting')
     self.assertEqual(path.element(0).name(), 'Test:1')
+
+  def test_encode_index_pb(self):
+    values = []
+    for int_value in (0, 1, -1, 119, 120, -119, -120, 256, -65536, 2 ** 40,
+                      2 ** 63 - 1, -2 ** 63):
+      value = entity_pb.PropertyValue()
+      value.set_int64value(int_value)
+      values.append(value)
+
+    for double_value in (0.0, -0.0, 1.5, -1.5, 1e300, -1e-300,
+                         float('inf'), float('-inf'),
+                         struct.unpack('>d', '\x00\x01' * 4)[0]):
+      value = entity_pb.PropertyValue()
+      value.set_doublevalue(double_value)
+      values.append(value)
+
+    for string_value in ('', 'content', '\x00', '\x01\x02', 'a\x00\x01b'):
+      value = entity_pb.PropertyValue()
+      value.set_stringvalue(string_value)
+      values.append(value)
+
+    for boolean_value in (True, False):
+      value = entity_pb.PropertyValue()
+      value.set_booleanvalue(boolean_value)
+      values.append(value)
+
+    value = entity_pb.PropertyValue()
+    value.mutable_referencevalue().set_app('guestbook')
+    element = value.mutable_referencevalue().add_pathelement()
+    element.set_type('Greeting')
+    element.set_id(5)
+    values.append(value)
+
+    # The fast encoder must match the generic encoder byte for byte.
+    for value in values:
+      self.assertEqual(str(utils.encode_index_pb(value)),
+                       generic_encoding(value))
+
+    path = entity_pb.Path()
+    element = path.add_element()
+    element.set_type('Greeting')
+    element.set_id(5)
+    element = path.add_element()
+    element.set_type('Comment')
+    element.set_name('first')
+    self.assertEqual(str(utils.encode_index_pb(path)),
+                     'Greeting:0000000005\x01Comment:first\x01')
+
+    memo = utils.IndexValueMemo()
+    self.assertEqual(memo.encode(path), str(utils.encode_index_pb(path)))
+    self.assertIs(memo.encode(path), memo.encode(path))
@@ -37,92 +37,143 @@ __all__ = ['DatastoreBlobStorage']
 # The datastore kind used for storing chunks of a blob
 _BLOB_CHUNK_KIND_ = "__BlobChunk__"
 
+# The maximum number of chunks requested with a single datastore get.
+_READ_WINDOW_CHUNKS = 8
+
+
+def _chunk_key(blob_key, chunk_index):
+  """ Creates the datastore key for a chunk of blob data.
+
+  Args:
+    blob_key: A BlobKey used to identify the blob.
+    chunk_index: An integer specifying the chunk's position in the blob.
+  Returns:
+    A datastore.Key for the __BlobChunk__ entity.
+  """
+  return datastore.Key.from_path(
+    _BLOB_CHUNK_KIND_, '__'.join([str(blob_key), str(chunk_index)]),
+    namespace='')
+
 
 class DatastoreBlobReader(BlobReader):
-  """ A reader that fetches from the datastore instead of the blobstore. """
+  """ A reader that fetches from the datastore instead of the blobstore.
+
+  Each fill requests every chunk that overlaps the read with one datastore
+  get. When a read spans several windows, the next window of chunks is
+  requested before the current one is returned.
+  """
+
+  def __init__(self, *args, **kwargs):
+    super(DatastoreBlobReader, self).__init__(*args, **kwargs)
+    # A (first chunk, last chunk, RPC) tuple for a window being prefetched.
+    self._prefetch = None
 
   @staticmethod
   @datastore.NonTransactional
-  def _fetch_data(blob_key, start_index, end_index):
-    """ Retrieves a chunk of blob data from datastore entities.
+  def _fetch_chunks_async(blob_key, first_chunk, last_chunk):
+    """ Requests a range of chunk entities.
 
     Args:
       blob_key: A BlobKey used to identify which blob to fetch data from.
+      first_chunk: An integer specifying the first chunk index.
+      last_chunk: An integer specifying the last chunk index (inclusive).
+    Returns:
+      An asynchronous object that resolves to a list of entities, with None
+      in place of any chunks that do not exist.
+    """
+    return datastore.GetAsync(
+      [_chunk_key(blob_key, chunk_index)
+       for chunk_index in xrange(first_chunk, last_chunk + 1)])
+
+  @staticmethod
+  @datastore.NonTransactional
+  def _assemble(blob_key, first_chunk, chunks, start_index, end_index):
+    """ Extracts a byte range from a list of chunk entities.
+
+    Args:
+      blob_key: A BlobKey used to identify which blob the chunks belong to.
+      first_chunk: An integer specifying the index of the first chunk.
+      chunks: A list of consecutive chunk entities (or None if missing).
       start_index: An integer specifying the start index in bytes of blob data.
       end_index: An integer specifying the end index (inclusive) of blob data.
     Returns:
       A raw bytes string containing the blob data.
     """
-    fetch_size = end_index - start_index + 1
-
-    # Get the block we will start from
-    block_count = int(start_index / MAX_BLOB_FETCH_SIZE)
-
-    # Get the block's bytes we'll copy
-    block_modulo = int(start_index % MAX_BLOB_FETCH_SIZE)
-
-    # This is the last block we'll look at for this request
-    block_count_end = int(end_index / MAX_BLOB_FETCH_SIZE)
-
-    block_key = '__'.join([str(blob_key), str(block_count)])
-    block_key = datastore.Key.from_path(
-      _BLOB_CHUNK_KIND_, block_key, namespace='')
-
-    try:
-      block = datastore.Get(block_key)
-    except datastore_errors.EntityNotFoundError:
+    if chunks[0] is None:
       # If this is the first block, the blob does not exist.
-      if block_count == 0:
+      if first_chunk == 0:
         raise apiproxy_errors.ApplicationError(
            blobstore_service_pb.BlobstoreServiceError.BLOB_NOT_FOUND)
 
       # If the first block exists, the index is just past the last block.
-      first_block_key = datastore.Key.from_path(
-        _BLOB_CHUNK_KIND_, '__'.join([str(blob_key), '0']), namespace='')
       try:
-        datastore.Get(first_block_key)
+        datastore.Get(_chunk_key(blob_key, 0))
       except datastore_errors.EntityNotFoundError:
         raise apiproxy_errors.ApplicationError(
            blobstore_service_pb.BlobstoreServiceError.BLOB_NOT_FOUND)
 
       return ''
 
-    data = block['block'][block_modulo:]
-
-    # Matching boundaries, start and end are within one fetch
-    if block_count_end == block_count:
-      return data[:fetch_size]
-
-    # Must fetch the next block
-    block_key = '__'.join([str(blob_key), str(block_count + 1)])
-    block_key = datastore.Key.from_path(
-      _BLOB_CHUNK_KIND_, block_key, namespace='')
-
-    try:
-      block = datastore.Get(block_key)
-      data += block['block']
-    except datastore_errors.EntityNotFoundError:
-      # If the second block is not found, assume the first block was the final
-      # block.
-      pass
+    data = bytearray()
+    for chunk in chunks:
+      # A missing chunk means the previous one was the final chunk.
+      if chunk is None:
+        break
+      data.extend(chunk['block'])
 
-    return data[:fetch_size]
+    offset = start_index - first_chunk * MAX_BLOB_FETCH_SIZE
+    return memoryview(data)[offset:offset + end_index - start_index + 1].tobytes()
 
   def _BlobReader__fill_buffer(self, size=0):
     """Fills the internal buffer.
 
+    The buffer always extends to the end of a chunk so that the next fill
+    does not fetch the same chunk again.
+
     Args:
-      size: Number of bytes to read. Will be clamped to
-        [self.__buffer_size, MAX_BLOB_FETCH_SIZE].
+      size: Number of bytes to read or a negative number to read until the
+        end of the blob. Will be clamped to
+        [self.__buffer_size, MAX_BLOB_FETCH_SIZE * _READ_WINDOW_CHUNKS].
     """
-    read_size = min(max(size, self._BlobReader__buffer_size),
-                    MAX_BLOB_FETCH_SIZE)
-
-    self._BlobReader__buffer = self._fetch_data(
-      self._BlobReader__blob_key, self._BlobReader__position,
-      self._BlobReader__position + read_size - 1)
+    blob_key = self._BlobReader__blob_key
+    position = self._BlobReader__position
+    window_size = MAX_BLOB_FETCH_SIZE * _READ_WINDOW_CHUNKS
+    if size < 0:
+      read_size = window_size
+    else:
+      read_size = min(max(size, self._BlobReader__buffer_size), window_size)
+
+    first_chunk = position // MAX_BLOB_FETCH_SIZE
+    last_chunk = (position + read_size - 1) // MAX_BLOB_FETCH_SIZE
+    end_index = (last_chunk + 1) * MAX_BLOB_FETCH_SIZE - 1
+
+    prefetch = self._prefetch
+    self._prefetch = None
+    if (prefetch is not None and prefetch[0] == first_chunk and
+        prefetch[1] >= last_chunk):
+      chunks = prefetch[2].get_result()[:last_chunk - first_chunk + 1]
+    else:
+      chunks = self._fetch_chunks_async(
+        blob_key, first_chunk, last_chunk).get_result()
+
+    buffer = self._assemble(blob_key, first_chunk, chunks, position,
+                            end_index)
+    self._BlobReader__buffer = buffer
     self._BlobReader__buffer_position = 0
-    self._BlobReader__eof = len(self._BlobReader__buffer) < read_size
+    self._BlobReader__eof = len(buffer) < end_index - position + 1
+
+    # When the caller needs more than this window, start fetching the next
+    # one while this one is consumed.
+    remaining = size - len(buffer)
+    if (size < 0 or remaining > 0) and not self._BlobReader__eof:
+      if size < 0:
+        next_size = window_size
+      else:
+        next_size = min(remaining, window_size)
+      next_first = last_chunk + 1
+      next_last = (end_index + next_size) // MAX_BLOB_FETCH_SIZE
+      self._prefetch = (next_first, next_last, self._fetch_chunks_async(
+        blob_key, next_first, next_last))
 
 
 class DatastoreBlobStorage(blobstore_stub.BlobStorage):
@@ -0,0 +1,92 @@
+import os
+import sys
+import unittest
+from flexmock import flexmock
+
+sys.path.append("{0}/../../../../..".format(
+  os.path.dirname(os.path.abspath(__file__))))
+from google.appengine.api import datastore
+from google.appengine.api import datastore_errors
+from google.appengine.api.blobstore import datastore_blob_storage
+from google.appengine.runtime import apiproxy_errors
+
+# A small chunk size keeps the fake blobs readable.
+CHUNK_SIZE = 10
+
+
+class FakeRPC(object):
+  def __init__(self, result):
+    self.result = result
+
+  def get_result(self):
+    if isinstance(self.result, Exception):
+      raise self.result
+    return self.result
+
+
+class TestDatastoreBlobReader(unittest.TestCase):
+  def setUp(self):
+    os.environ['APPLICATION_ID'] = 'guestbook'
+    datastore_blob_storage.MAX_BLOB_FETCH_SIZE = CHUNK_SIZE
+    self.chunks = {}
+    self.requests = []
+    flexmock(datastore).should_receive('GetAsync').replace_with(
+      self.get_async)
+
+  def tearDown(self):
+    datastore_blob_storage.MAX_BLOB_FETCH_SIZE = \
+      datastore_blob_storage.blobstore.MAX_BLOB_FETCH_SIZE
+
+  def get_async(self, keys):
+    if not isinstance(keys, list):
+      if keys.name() not in self.chunks:
+        return FakeRPC(datastore_errors.EntityNotFoundError())
+      return FakeRPC({'block': self.chunks[keys.name()]})
+
+    self.requests.append([key.name() for key in keys])
+    return FakeRPC([{'block': self.chunks[key.name()]}
+                    if key.name() in self.chunks else None for key in keys])
+
+  def store(self, blob_key, data):
+    for index in range(0, len(data), CHUNK_SIZE):
+      chunk_name = '{}__{}'.format(blob_key, index // CHUNK_SIZE)
+      self.chunks[chunk_name] = data[index:index + CHUNK_SIZE]
+
+  def test_batched_reads(self):
+    data = ''.join(chr(ord('a') + index % 26) for index in range(205))
+    self.store('blob', data)
+
+    reader = datastore_blob_storage.DatastoreBlobReader('blob', CHUNK_SIZE)
+    reader.seek(5)
+    self.assertEqual(reader.read(20), data[5:25])
+    self.assertEqual(self.requests, [['blob__0', 'blob__1', 'blob__2']])
+
+    # Reads within the fetched chunks are served from the buffer.
+    self.assertEqual(reader.read(5), data[25:30])
+    self.assertEqual(len(self.requests), 1)
+
+    # Long reads fetch whole windows and prefetch the following one.
+    del self.requests[:]
+    self.assertEqual(reader.read(145), data[30:175])
+    self.assertEqual(self.requests, [
+      ['blob__{}'.format(index) for index in range(3, 11)],
+      ['blob__{}'.format(index) for index in range(11, 18)]])
+
+    del self.requests[:]
+    self.assertEqual(reader.read(), data[175:])
+    self.assertEqual(self.requests, [
+      ['blob__{}'.format(index) for index in range(18, 26)]])
+    self.assertEqual(reader.read(100), '')
+
+  def test_missing_blob(self):
+    reader = datastore_blob_storage.DatastoreBlobReader('missing', CHUNK_SIZE)
+    self.assertRaises(apiproxy_errors.ApplicationError, reader.read, 5)
+
+    self.store('blob', 'x' * 15)
+    reader = datastore_blob_storage.DatastoreBlobReader('blob', CHUNK_SIZE)
+    reader.seek(30)
+    self.assertEqual(reader.read(5), '')
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -24,10 +24,13 @@ import logging
 import hashlib
 import memcache
 import os
+import socket
+import struct
 import time
 
 from google.appengine.api import apiproxy_stub
 from google.appengine.api.memcache import memcache_service_pb
+from google.appengine.api.memcache.near_cache import NearCache
 from google.appengine.runtime import apiproxy_errors
 
 MemcacheSetResponse = memcache_service_pb.MemcacheSetResponse
@@ -40,6 +43,182 @@ from google.appengine.api.memcache import TYPE_INT
 from google.appengine.api.memcache import TYPE_LONG
 from google.appengine.api.memcache import MAX_KEY_SIZE
 
+# The first byte of every entry written in the binary format. Pickled entries
+# from earlier versions never start with it.
+ENTRY_VERSION = '\x01'
+
+# The binary entry header: the version byte and the application's flags.
+ENTRY_HEADER = struct.Struct('!cI')
+
+# Maps set policies to the memcached storage commands that implement them.
+STORAGE_COMMANDS = {
+  MemcacheSetRequest.SET: 'set',
+  MemcacheSetRequest.ADD: 'add',
+  MemcacheSetRequest.REPLACE: 'replace',
+  MemcacheSetRequest.CAS: 'cas'
+}
+
+# Maps memcached storage replies to set statuses.
+STORAGE_STATUSES = {
+  'STORED': MemcacheSetResponse.STORED,
+  'NOT_STORED': MemcacheSetResponse.NOT_STORED,
+  'NOT_FOUND': MemcacheSetResponse.NOT_STORED,
+  'EXISTS': MemcacheSetResponse.EXISTS
+}
+
+
+def EncodeEntry(flags, value):
+  """Packs an application value for storage in memcached.
+
+  Args:
+    flags: An integer containing the flags set by the application.
+    value: A string containing the value set by the application.
+  Returns:
+    A string containing the binary entry.
+  """
+  return ENTRY_HEADER.pack(ENTRY_VERSION, flags) + value
+
+
+def DecodeEntry(entry):
+  """Unpacks an entry stored in memcached.
+
+  Args:
+    entry: A string written by EncodeEntry or a pickled list written by
+      earlier versions.
+  Returns:
+    A tuple containing the flags and the value set by the application.
+  """
+  if entry[:1] == ENTRY_VERSION:
+    _, flags = ENTRY_HEADER.unpack_from(entry)
+    return flags, entry[ENTRY_HEADER.size:]
+
+  legacy_entry = cPickle.loads(entry)
+  # Older entries also contain a counter in the middle.
+  return legacy_entry[0], legacy_entry[-1]
+
+
+class PipelinedClient(memcache.Client):
+  """ A memcache client that batches commands for each server.
+
+  The commands for every key in a batch are written to each server at once
+  before any replies are read, so a batch takes one round trip per server
+  instead of one per key. Values are passed through as raw strings.
+  """
+  def _group_by_server(self, keys):
+    """ Finds the server responsible for each key.
+
+    Args:
+      keys: A list of memcache keys.
+    Returns:
+      A dictionary mapping servers to lists of indexes into keys.
+    """
+    batches = {}
+    for index, key in enumerate(keys):
+      server, _ = self._get_server(key)
+      if server is None:
+        continue
+      batches.setdefault(server, []).append(index)
+    return batches
+
+  def _send_batches(self, batches, commands):
+    """ Writes each server's commands in a single call.
+
+    Args:
+      batches: A dictionary mapping servers to lists of command indexes.
+      commands: A list of encoded commands.
+    Returns:
+      A dictionary containing the batches that were sent successfully.
+    """
+    sent = {}
+    for server, indexes in batches.iteritems():
+      try:
+        server.send_cmds(''.join(commands[index] for index in indexes))
+      except socket.error as error:
+        server.mark_dead(error)
+        continue
+      sent[server] = indexes
+    return sent
+
+  def _read_replies(self, batches, count):
+    """ Reads the single-line reply to each command in a batch.
+
+    Args:
+      batches: A dictionary mapping servers to lists of command indexes.
+      count: The total number of commands.
+    Returns:
+      A list of replies ordered by command index.
+    """
+    replies = [None] * count
+    for server, indexes in batches.iteritems():
+      try:
+        for index in indexes:
+          replies[index] = server.readline() or None
+      except socket.error as error:
+        server.mark_dead(error)
+    return replies
+
+  def gets_multi(self, keys):
+    """ Retrieves values along with their CAS identifiers.
+
+    Args:
+      keys: A list of memcache keys.
+    Returns:
+      A dictionary mapping keys that were found to (value, cas_id) tuples.
+    """
+    commands = ['gets {}\r\n'.format(key) for key in keys]
+    batches = self._send_batches(self._group_by_server(keys), commands)
+
+    results = {}
+    for server, indexes in batches.iteritems():
+      try:
+        for _ in indexes:
+          line = server.readline()
+          while line and line != 'END':
+            _, key, _, length, cas_id = line.split()
+            value = server.recv(int(length) + 2)[:-2]
+            results[key] = (value, int(cas_id))
+            line = server.readline()
+      except (ValueError, memcache._Error, socket.error) as error:
+        server.mark_dead(error)
+
+    return results
+
+  def store_multi(self, items):
+    """ Runs a batch of storage commands.
+
+    Args:
+      items: A list of (command, key, value, expiration, cas_id) tuples. The
+        cas_id is only used by the 'cas' command.
+    Returns:
+      A list containing the server's reply to each item or None if the
+      server could not be reached.
+    """
+    commands = []
+    for command, key, value, expiration, cas_id in items:
+      header = [command, key, '0', str(expiration), str(len(value))]
+      if command == 'cas':
+        header.append(str(cas_id))
+      commands.append('{}\r\n{}\r\n'.format(' '.join(header), value))
+
+    batches = self._group_by_server([item[1] for item in items])
+    return self._read_replies(self._send_batches(batches, commands),
+                              len(items))
+
+  def delete_each(self, keys):
+    """ Deletes keys and reports whether each one existed.
+
+    Args:
+      keys: A list of memcache keys.
+    Returns:
+      A list containing the server's reply to each delete or None if the
+      server could not be reached.
+    """
+    commands = ['delete {}\r\n'.format(key) for key in keys]
+    batches = self._group_by_server(keys)
+    return self._read_replies(self._send_batches(batches, commands),
+                              len(keys))
+
+
 class MemcacheService(apiproxy_stub.APIProxyStub):
   """Python only memcache service.
 
@@ -56,17 +235,34 @@ class MemcacheService(apiproxy_stub.APIProxyStub):
   # down).
   UPDATE_WINDOW = 60  # seconds
 
-  def __init__(self, gettime=time.time, service_name='memcache'):
+  # The number of megabytes each instance can use for cached reads.
+  DEFAULT_NEAR_CACHE_SIZE = 16  # megabytes
+
+  # Writes from other instances may go unnoticed for this long.
+  DEFAULT_NEAR_CACHE_LEASE = 2  # seconds
+
+  def __init__(self, gettime=time.time, service_name='memcache',
+               near_cache_namespaces=None,
+               near_cache_size=DEFAULT_NEAR_CACHE_SIZE,
+               near_cache_lease=DEFAULT_NEAR_CACHE_LEASE):
     """Initializer.
 
     Args:
       gettime: time.time()-like function used for testing.
       service_name: Service name expected for all calls.
+      near_cache_namespaces: A comma-separated string of namespaces whose
+        reads are cached in this instance or None to disable the near cache.
+      near_cache_size: A float specifying the near cache size in megabytes.
+      near_cache_lease: A float specifying how many seconds a cached read
+        can be served.
     """
     super(MemcacheService, self).__init__(service_name)
     self._gettime = gettime
     self._memcache = None
+    self._near_cache = None
     self.setupMemcacheClient()
+    self.setupNearCache(near_cache_namespaces, near_cache_size,
+                        near_cache_lease)
 
   def setupMemcacheClient(self):
     """ Sets up the memcache client. """
@@ -79,7 +275,45 @@ class MemcacheService(apiproxy_stub.APIProxyStub):
 
     memcaches = [ip + ":" + self.MEMCACHE_PORT for ip in all_ips if ip != '']
     memcaches.sort()    
-    self._memcache = memcache.Client(memcaches, debug=0)
+    self._memcache = PipelinedClient(memcaches, debug=0)
+
+  def setupNearCache(self, namespaces, size=DEFAULT_NEAR_CACHE_SIZE,
+                     lease=DEFAULT_NEAR_CACHE_LEASE):
+    """ Sets up the in-process cache if the application enabled it.
+
+    Args:
+      namespaces: A comma-separated string of namespaces whose reads are
+        cached. An empty item stands for the default namespace, and '*'
+        caches every namespace. None disables the near cache.
+      size: A float specifying the near cache size in megabytes.
+      lease: A float specifying how many seconds a cached read can be served.
+    """
+    if namespaces is None:
+      self._near_cache = None
+      return
+
+    self._near_cache = NearCache(
+      [namespace.strip() for namespace in namespaces.split(',')],
+      int(size * 1024 * 1024), lease, gettime=self._gettime)
+
+  def _UsesNearCache(self, namespace):
+    """ Checks if reads from a namespace are cached in this instance.
+
+    Args:
+      namespace: A string specifying a namespace.
+    Returns:
+      A boolean indicating whether or not the namespace is cached.
+    """
+    return self._near_cache is not None and self._near_cache.Enabled(namespace)
+
+  def _InvalidateNearCache(self, namespace):
+    """ Drops cached reads for a namespace after this instance writes to it.
+
+    Args:
+      namespace: A string specifying a namespace.
+    """
+    if self._UsesNearCache(namespace):
+      self._near_cache.InvalidateNamespace(namespace)
 
   def _Dynamic_Get(self, request, response):
     """Implementation of gets for memcache.
@@ -88,14 +322,39 @@ class MemcacheService(apiproxy_stub.APIProxyStub):
       request: A MemcacheGetRequest protocol buffer.
       response: A MemcacheGetResponse protocol buffer.
     """
+    namespace = request.name_space()
+    use_near_cache = (not request.for_cas() and
+                      self._UsesNearCache(namespace))
+    if use_near_cache:
+      generation = self._near_cache.Generation(namespace)
+
+    results = []
+    keys = {}
     for key in set(request.key_list()):
-      internal_key = self._GetKey(request.name_space(), key)
-      value = self._memcache.get(internal_key)
-      if value is None:
-        continue
-      flags = 0
-      stored_flags, cas_id, stored_value = cPickle.loads(value)
-      flags |= stored_flags
+      if use_near_cache:
+        cached = self._near_cache.Get(namespace, key)
+        if cached is not None:
+          results.append((key, cached[0], cached[1], 0))
+          continue
+
+      keys[self._GetKey(namespace, key)] = key
+
+    if not keys:
+      entries = {}
+    elif request.for_cas():
+      entries = self._memcache.gets_multi(keys.keys())
+    else:
+      entries = {internal_key: (value, 0) for internal_key, value
+                 in self._memcache.get_multi(keys.keys()).iteritems()}
+
+    for internal_key, (value, cas_id) in entries.iteritems():
+      flags, stored_value = DecodeEntry(value)
+      key = keys[internal_key]
+      if use_near_cache:
+        self._near_cache.Put(namespace, key, flags, stored_value, generation)
+      results.append((key, flags, stored_value, cas_id))
+
+    for key, flags, stored_value, cas_id in results:
       item = response.add_item()
       item.set_key(key)
       item.set_value(stored_value)
@@ -110,43 +369,29 @@ class MemcacheService(apiproxy_stub.APIProxyStub):
       request: A MemcacheSetRequest.
       response: A MemcacheSetResponse.
     """
+    items = []
     for item in request.item_list():
-      key = self._GetKey(request.name_space(), item.key())
       set_policy = item.set_policy()
-      old_entry = self._memcache.get(key)
-      cas_id = 0
-      if old_entry:
-        _, cas_id, _ = cPickle.loads(old_entry)
-      set_status = MemcacheSetResponse.NOT_STORED
-
-      if ((set_policy == MemcacheSetRequest.SET) or
-        (set_policy == MemcacheSetRequest.ADD and old_entry is None) or
-        (set_policy == MemcacheSetRequest.REPLACE and
-        old_entry is not None)):
-
-        if (old_entry is None or set_policy == MemcacheSetRequest.SET):
-          set_status = MemcacheSetResponse.STORED
-
-      elif (set_policy == MemcacheSetRequest.CAS and item.for_cas() and
-        item.has_cas_id()):
-        if old_entry is None:
-          set_status = MemcacheSetResponse.NOT_STORED
-        elif cas_id != item.cas_id():
-          set_status = MemcacheSetResponse.EXISTS
-        else:
-          set_status = MemcacheSetResponse.STORED
-
-      if (set_status == MemcacheSetResponse.STORED
-        or set_policy == MemcacheSetRequest.REPLACE):
-
-        set_value = cPickle.dumps(
-          [item.flags(), cas_id + 1, item.value()])
-        if set_policy == MemcacheSetRequest.REPLACE:
-          self._memcache.replace(key, set_value)
-        else:
-          self._memcache.set(key, set_value, item.expiration_time())
-
-      response.add_set_status(set_status)
+      if (set_policy == MemcacheSetRequest.CAS and
+          not (item.for_cas() and item.has_cas_id())):
+        continue
+
+      key = self._GetKey(request.name_space(), item.key())
+      value = EncodeEntry(item.flags(), item.value())
+      items.append((STORAGE_COMMANDS[set_policy], key, value,
+                    item.expiration_time(), item.cas_id()))
+
+    replies = iter(self._memcache.store_multi(items))
+    for item in request.item_list():
+      if (item.set_policy() == MemcacheSetRequest.CAS and
+          not (item.for_cas() and item.has_cas_id())):
+        response.add_set_status(MemcacheSetResponse.NOT_STORED)
+        continue
+
+      response.add_set_status(
+        STORAGE_STATUSES.get(next(replies), MemcacheSetResponse.ERROR))
+
+    self._InvalidateNearCache(request.name_space())
 
   def _Dynamic_Delete(self, request, response):
     """Implementation of delete in memcache.
@@ -155,17 +400,15 @@ class MemcacheService(apiproxy_stub.APIProxyStub):
       request: A MemcacheDeleteRequest protocol buffer.
       response: A MemcacheDeleteResponse protocol buffer.
     """
-    for item in request.item_list():
-      key = self._GetKey(request.name_space(), item.key())
-      entry = self._memcache.get(key)
-      delete_status = MemcacheDeleteResponse.DELETED
-
-      if entry is None:
-        delete_status = MemcacheDeleteResponse.NOT_FOUND
+    keys = [self._GetKey(request.name_space(), item.key())
+            for item in request.item_list()]
+    for reply in self._memcache.delete_each(keys):
+      if reply == 'DELETED':
+        response.add_delete_status(MemcacheDeleteResponse.DELETED)
       else:
-        self._memcache.delete(key)
+        response.add_delete_status(MemcacheDeleteResponse.NOT_FOUND)
 
-      response.add_delete_status(delete_status)
+    self._InvalidateNearCache(request.name_space())
 
   def _Increment(self, namespace, request):
     """Internal function for incrementing from a MemcacheIncrementRequest.
@@ -181,8 +424,6 @@ class MemcacheService(apiproxy_stub.APIProxyStub):
     if not request.delta():
       return None
 
-    cas_id = 0
-
     key = self._GetKey(namespace, request.key())
     value = self._memcache.get(key)
     if value is None:
@@ -195,7 +436,7 @@ class MemcacheService(apiproxy_stub.APIProxyStub):
 
       stored_value = str(request.initial_value())
     else:
-      flags, cas_id, stored_value = cPickle.loads(value)
+      flags, stored_value = DecodeEntry(value)
 
     if flags == TYPE_INT:
       new_value = int(stored_value)
@@ -207,7 +448,7 @@ class MemcacheService(apiproxy_stub.APIProxyStub):
     elif request.direction() == MemcacheIncrementRequest.DECREMENT:
       new_value = max(new_value-request.delta(), 0)
 
-    new_stored_value = cPickle.dumps([flags, cas_id + 1, str(new_value)])
+    new_stored_value = EncodeEntry(flags, str(new_value))
     try:
       self._memcache.cas(key, new_stored_value)
     except Exception, e:
@@ -224,6 +465,7 @@ class MemcacheService(apiproxy_stub.APIProxyStub):
       response: A MemcacheIncrementResponse protocol buffer.
     """
     new_value = self._Increment(request.name_space(), request)
+    self._InvalidateNearCache(request.name_space())
     if new_value is None:
       raise apiproxy_errors.ApplicationError(
         memcache_service_pb.MemcacheServiceError.UNSPECIFIED_ERROR)
@@ -247,6 +489,8 @@ class MemcacheService(apiproxy_stub.APIProxyStub):
         item.set_increment_status(MemcacheIncrementResponse.OK)
         item.set_new_value(new_value)
 
+    self._InvalidateNearCache(namespace)
+
   def _Dynamic_FlushAll(self, request, response):
     """Implementation of MemcacheService::FlushAll().
 
@@ -255,6 +499,8 @@ class MemcacheService(apiproxy_stub.APIProxyStub):
       response: A MemcacheFlushResponse.
     """
     self._memcache.flush_all()
+    if self._near_cache is not None:
+      self._near_cache.Clear()
 
   def _Dynamic_Stats(self, request, response):
     """Implementation of MemcacheService::Stats().
@@ -287,6 +533,17 @@ class MemcacheService(apiproxy_stub.APIProxyStub):
       items_total += get_stats_value(server_stats, 'curr_items') 
       bytes_total += get_stats_value(server_stats, 'bytes') 
       time_total += get_stats_value(server_stats, 'time', float) 
+
+    # Reads served by this instance's near cache never reach memcached. Its
+    # misses fall through to memcached, which counts them as hits or misses.
+    if self._near_cache is not None:
+      hits_total += self._near_cache.hits
+      byte_hits_total += self._near_cache.byte_hits
+      logging.debug('Memcache near cache: {} hits, {} misses, {} evictions, '
+                    '{} bytes'.format(self._near_cache.hits,
+                                      self._near_cache.misses,
+                                      self._near_cache.evictions,
+                                      self._near_cache.size))
    
     stats.set_hits(hits_total)
     stats.set_misses(misses_total)
@@ -0,0 +1,160 @@
+""" An in-process cache that sits in front of the remote memcached servers.
+
+Entries are only served for a short lease, so values written by other
+instances become visible once the lease expires. Writes made through this
+instance drop every cached entry in the affected namespace.
+"""
+import collections
+import threading
+import time
+
+# The approximate number of bytes an entry takes beyond its key and value.
+ENTRY_OVERHEAD = 100
+
+
+class NearCache(object):
+  """ A memory-capped, least-recently-used cache of memcache values. """
+  def __init__(self, namespaces, max_bytes, lease, gettime=time.time):
+    """ Creates a new NearCache.
+
+    Args:
+      namespaces: A collection of namespaces that can be cached. '*' allows
+        every namespace.
+      max_bytes: An integer specifying the memory budget.
+      lease: A float specifying how many seconds an entry can be served.
+      gettime: time.time()-like function used for testing.
+    """
+    self.namespaces = frozenset(namespaces)
+    self.max_bytes = max_bytes
+    self.lease = lease
+    self.size = 0
+    self.hits = 0
+    self.byte_hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._gettime = gettime
+    self._lock = threading.Lock()
+
+    # Maps (namespace, key) tuples to (expiration, flags, value, size) tuples.
+    self._entries = collections.OrderedDict()
+
+    # Maps namespaces to the keys they have cached.
+    self._namespace_keys = collections.defaultdict(set)
+
+    # Counts invalidations for each namespace and for the whole cache so that
+    # values fetched before a write are not cached after it.
+    self._generations = collections.defaultdict(int)
+    self._flushes = 0
+
+  def Enabled(self, namespace):
+    """ Checks if entries in a namespace can be cached.
+
+    Args:
+      namespace: A string specifying a namespace.
+    Returns:
+      A boolean indicating whether or not the namespace is cached.
+    """
+    return '*' in self.namespaces or namespace in self.namespaces
+
+  def Generation(self, namespace):
+    """ Fetches the invalidation state for a namespace.
+
+    Args:
+      namespace: A string specifying a namespace.
+    Returns:
+      A value that changes whenever the namespace is invalidated.
+    """
+    with self._lock:
+      return self._flushes, self._generations[namespace]
+
+  def Get(self, namespace, key):
+    """ Retrieves a value if its lease has not expired.
+
+    Args:
+      namespace: A string specifying a namespace.
+      key: A string specifying the application's key.
+    Returns:
+      A (flags, value) tuple or None if there is no valid entry.
+    """
+    with self._lock:
+      entry = self._entries.pop((namespace, key), None)
+      if entry is None:
+        self.misses += 1
+        return None
+
+      expiration, flags, value, entry_size = entry
+      if expiration <= self._gettime():
+        self.size -= entry_size
+        self._namespace_keys[namespace].discard(key)
+        self.misses += 1
+        return None
+
+      # Reinserting the entry marks it as the most recently used.
+      self._entries[(namespace, key)] = entry
+      self.hits += 1
+      self.byte_hits += len(value)
+      return flags, value
+
+  def Put(self, namespace, key, flags, value, generation):
+    """ Stores a value fetched from the remote servers.
+
+    Args:
+      namespace: A string specifying a namespace.
+      key: A string specifying the application's key.
+      flags: An integer containing the flags set by the application.
+      value: A string containing the value set by the application.
+      generation: The namespace's generation from before the value was
+        fetched.
+    """
+    entry_size = len(namespace) + len(key) + len(value) + ENTRY_OVERHEAD
+    if entry_size > self.max_bytes:
+      return
+
+    with self._lock:
+      if (self._flushes, self._generations[namespace]) != generation:
+        return
+
+      self._Discard(namespace, key)
+      while self.size + entry_size > self.max_bytes:
+        (evicted_namespace, evicted_key), evicted = self._entries.popitem(
+          last=False)
+        self._namespace_keys[evicted_namespace].discard(evicted_key)
+        self.size -= evicted[3]
+        self.evictions += 1
+
+      expiration = self._gettime() + self.lease
+      self._entries[(namespace, key)] = (expiration, flags, value, entry_size)
+      self._namespace_keys[namespace].add(key)
+      self.size += entry_size
+
+  def InvalidateNamespace(self, namespace):
+    """ Drops every entry in a namespace.
+
+    Args:
+      namespace: A string specifying a namespace.
+    """
+    with self._lock:
+      self._generations[namespace] += 1
+      for key in self._namespace_keys.pop(namespace, ()):
+        entry = self._entries.pop((namespace, key))
+        self.size -= entry[3]
+
+  def Clear(self):
+    """ Drops every entry. """
+    with self._lock:
+      self._flushes += 1
+      self._entries.clear()
+      self._namespace_keys.clear()
+      self.size = 0
+
+  def _Discard(self, namespace, key):
+    """ Removes an entry if it exists. The caller must hold the lock.
+
+    Args:
+      namespace: A string specifying a namespace.
+      key: A string specifying the application's key.
+    """
+    entry = self._entries.pop((namespace, key), None)
+    if entry is not None:
+      self.size -= entry[3]
+      self._namespace_keys[namespace].discard(key)
@@ -0,0 +1,90 @@
+""" Measures multi-key memcache calls against simulated memcached servers.
+
+The "per-key" columns issue one client command per key, which is how the
+service used to handle get_multi, set_multi, and delete_multi (sets and
+deletes also read each key first). The "batched" columns run the same
+requests through MemcacheService.
+"""
+import argparse
+import os
+import sys
+import time
+
+memcache_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(memcache_dir)
+sys.path.append("{0}/../../../../..".format(memcache_dir))
+from google.appengine.api.memcache import memcache_distributed
+from google.appengine.api.memcache import memcache_service_pb
+
+from fake_memcached import use_fake_hosts
+
+
+def per_key(client, keys):
+  """ Sets, gets, and deletes each key with separate commands. """
+  for key in keys:
+    client.get(key)
+    client.set(key, 'value')
+  for key in keys:
+    client.get(key)
+  for key in keys:
+    client.get(key)
+    client.delete(key)
+
+
+def batched(service, keys):
+  """ Sets, gets, and deletes all keys with one request each. """
+  set_request = memcache_service_pb.MemcacheSetRequest()
+  get_request = memcache_service_pb.MemcacheGetRequest()
+  delete_request = memcache_service_pb.MemcacheDeleteRequest()
+  for key in keys:
+    item = set_request.add_item()
+    item.set_key(key)
+    item.set_value('value')
+    item.set_flags(0)
+    get_request.add_key(key)
+    delete_request.add_item().set_key(key)
+
+  service._Dynamic_Set(set_request,
+                       memcache_service_pb.MemcacheSetResponse())
+  service._Dynamic_Get(get_request,
+                       memcache_service_pb.MemcacheGetResponse())
+  service._Dynamic_Delete(delete_request,
+                          memcache_service_pb.MemcacheDeleteResponse())
+
+
+def measure(function, target, hosts, keys):
+  """ Returns the elapsed seconds and round trips for a workload. """
+  for host in hosts:
+    host.round_trips = 0
+  start = time.time()
+  function(target, keys)
+  return time.time() - start, sum(host.round_trips for host in hosts)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--latency', type=float, default=0.0005,
+                      help='Simulated memcached round trip in seconds')
+  parser.add_argument('--servers', type=int, default=3)
+  parser.add_argument('--keys', type=int, nargs='+',
+                      default=[1, 10, 100, 500])
+  args = parser.parse_args()
+
+  os.environ['APPNAME'] = 'guestbook'
+  service = memcache_distributed.MemcacheService()
+  hosts = use_fake_hosts(service._memcache, args.servers, args.latency)
+
+  print('{:>6} {:>12} {:>12} {:>12} {:>12}'.format(
+    'keys', 'per-key ms', 'per-key RTs', 'batched ms', 'batched RTs'))
+  for key_count in args.keys:
+    keys = ['key{}'.format(index) for index in xrange(key_count)]
+    internal_keys = [service._GetKey('', key) for key in keys]
+    old_time, old_trips = measure(per_key, service._memcache, hosts,
+                                  internal_keys)
+    new_time, new_trips = measure(batched, service, hosts, keys)
+    print('{:>6} {:>12.1f} {:>12} {:>12.1f} {:>12}'.format(
+      key_count, old_time * 1000, old_trips, new_time * 1000, new_trips))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,57 @@
+""" Compares the pickled and binary memcache entry formats.
+
+For each payload size, reports how many entries per second each format can
+encode and decode and how many bytes an entry takes in memcached.
+"""
+import argparse
+import cPickle
+import os
+import sys
+import timeit
+
+memcache_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append("{0}/../../../../..".format(memcache_dir))
+from google.appengine.api.memcache import memcache_distributed
+
+
+def pickle_encode(flags, value):
+  return cPickle.dumps([flags, 1, value])
+
+
+def pickle_decode(entry):
+  flags, _, value = cPickle.loads(entry)
+  return flags, value
+
+
+FORMATS = [
+  ('pickle', pickle_encode, pickle_decode),
+  ('binary', memcache_distributed.EncodeEntry,
+   memcache_distributed.DecodeEntry)
+]
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--sizes', type=int, nargs='+',
+                      default=[16, 256, 4096, 65536])
+  parser.add_argument('--number', type=int, default=20000)
+  args = parser.parse_args()
+
+  print('{:>7} {:>8} {:>12} {:>12} {:>9}'.format(
+    'size', 'format', 'encode/s', 'decode/s', 'bytes'))
+  for size in args.sizes:
+    # Include every byte value since protocol 0 pickles escape them.
+    value = ''.join(chr(index % 256) for index in xrange(size))
+    for name, encode, decode in FORMATS:
+      entry = encode(0, value)
+      assert decode(entry) == (0, value)
+      encode_time = timeit.timeit(lambda: encode(0, value),
+                                  number=args.number)
+      decode_time = timeit.timeit(lambda: decode(entry), number=args.number)
+      print('{:>7} {:>8} {:>12.0f} {:>12.0f} {:>9}'.format(
+        size, name, args.number / encode_time, args.number / decode_time,
+        len(entry)))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,142 @@
+""" An in-process stand-in for memcached servers.
+
+FakeHost can replace the python-memcached client's server objects. It speaks
+the memcached text protocol, so every command the client sends is parsed and
+answered as a real server would. Each write to the host counts as a network
+round trip and optionally sleeps to simulate latency.
+"""
+import itertools
+import socket
+import time
+
+
+class FakeHost(object):
+  """ Emulates a memcached server connection. """
+  # Shared across hosts so that CAS identifiers are unique like memcached's.
+  _cas_counter = itertools.count(1)
+
+  def __init__(self, name, latency=0):
+    """ Creates a new FakeHost.
+
+    Args:
+      name: A string identifying the host.
+      latency: A float specifying the seconds each round trip takes.
+    """
+    self.name = name
+    self.address = name
+    self.family = socket.AF_UNIX
+    self.latency = latency
+    self.round_trips = 0
+    self.hits = 0
+    self.misses = 0
+    self.data = {}
+    self.buffer = ''
+    self.weight = 1
+    self.deaduntil = 0
+
+  def __str__(self):
+    return self.name
+
+  def connect(self):
+    return 1
+
+  def mark_dead(self, reason):
+    raise AssertionError('{} marked dead: {}'.format(self.name, reason))
+
+  def close_socket(self):
+    pass
+
+  def send_cmd(self, cmd):
+    self.send_cmds(cmd + '\r\n')
+
+  def send_cmds(self, cmds):
+    self.round_trips += 1
+    if self.latency:
+      time.sleep(self.latency)
+
+    while cmds:
+      line, cmds = cmds.split('\r\n', 1)
+      parts = line.split()
+      if parts[0] in ('set', 'add', 'replace', 'cas'):
+        length = int(parts[4])
+        value, cmds = cmds[:length], cmds[length + 2:]
+        self.buffer += self._store(parts, value) + '\r\n'
+      else:
+        self.buffer += getattr(self, '_' + parts[0])(parts[1:])
+
+  def _store(self, parts, value):
+    command, key, flags = parts[:3]
+    exists = key in self.data
+    if command == 'add' and exists:
+      return 'NOT_STORED'
+    if command == 'replace' and not exists:
+      return 'NOT_STORED'
+    if command == 'cas':
+      if not exists:
+        return 'NOT_FOUND'
+      if self.data[key][2] != int(parts[5]):
+        return 'EXISTS'
+
+    self.data[key] = (int(flags), value, next(self._cas_counter))
+    return 'STORED'
+
+  def _get(self, keys, with_cas=False):
+    reply = ''
+    for key in keys:
+      if key not in self.data:
+        self.misses += 1
+        continue
+      self.hits += 1
+      flags, value, cas_id = self.data[key]
+      header = ['VALUE', key, str(flags), str(len(value))]
+      if with_cas:
+        header.append(str(cas_id))
+      reply += '{}\r\n{}\r\n'.format(' '.join(header), value)
+    return reply + 'END\r\n'
+
+  def _gets(self, keys):
+    return self._get(keys, with_cas=True)
+
+  def _delete(self, args):
+    if self.data.pop(args[0], None) is None:
+      return 'NOT_FOUND\r\n'
+    return 'DELETED\r\n'
+
+  def _stats(self, args):
+    stats = {'get_hits': self.hits, 'get_misses': self.misses,
+             'bytes_read': 0, 'curr_items': len(self.data), 'bytes': 0,
+             'time': int(time.time())}
+    return ''.join('STAT {} {}\r\n'.format(name, value)
+                   for name, value in stats.iteritems()) + 'END\r\n'
+
+  def _flush_all(self, args):
+    self.data.clear()
+    return 'OK\r\n'
+
+  def readline(self, raise_exception=False):
+    line, self.buffer = self.buffer.split('\r\n', 1)
+    return line
+
+  def expect(self, text, raise_exception=False):
+    return self.readline()
+
+  def recv(self, rlen):
+    data, self.buffer = self.buffer[:rlen], self.buffer[rlen:]
+    return data
+
+
+def use_fake_hosts(client, count, latency=0):
+  """ Points a memcache client at a set of fake hosts.
+
+  Args:
+    client: A memcache.Client object.
+    count: An integer specifying how many hosts to create.
+    latency: A float specifying the seconds each round trip takes.
+  Returns:
+    A list of FakeHost objects.
+  """
+  hosts = [FakeHost('host{}'.format(index), latency)
+           for index in range(count)]
+  client.servers = hosts
+  client._init_buckets()
+  return hosts
@@ -0,0 +1,159 @@
+import cPickle
+import os
+import sys
+import unittest
+
+memcache_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(memcache_dir)
+sys.path.append("{0}/../../../../..".format(memcache_dir))
+from google.appengine.api.memcache import memcache_distributed
+from google.appengine.api.memcache import memcache_service_pb
+
+from fake_memcached import use_fake_hosts
+
+MemcacheSetRequest = memcache_service_pb.MemcacheSetRequest
+MemcacheSetResponse = memcache_service_pb.MemcacheSetResponse
+MemcacheDeleteResponse = memcache_service_pb.MemcacheDeleteResponse
+MemcacheService = memcache_distributed.MemcacheService
+
+
+class TestMemcacheService(unittest.TestCase):
+  def setUp(self):
+    os.environ['APPNAME'] = 'guestbook'
+    self.service = memcache_distributed.MemcacheService()
+    self.hosts = use_fake_hosts(self.service._memcache, 3)
+
+  def set_items(self, items, policy=MemcacheSetRequest.SET, namespace=''):
+    request = memcache_service_pb.MemcacheSetRequest()
+    request.set_name_space(namespace)
+    for key, value, cas_id in items:
+      item = request.add_item()
+      item.set_key(key)
+      item.set_value(value)
+      item.set_flags(0)
+      item.set_set_policy(policy)
+      if cas_id is not None:
+        item.set_for_cas(True)
+        item.set_cas_id(cas_id)
+    response = memcache_service_pb.MemcacheSetResponse()
+    self.service._Dynamic_Set(request, response)
+    return response.set_status_list()
+
+  def get_items(self, keys, for_cas=False, namespace=''):
+    request = memcache_service_pb.MemcacheGetRequest()
+    request.set_name_space(namespace)
+    for key in keys:
+      request.add_key(key)
+    request.set_for_cas(for_cas)
+    response = memcache_service_pb.MemcacheGetResponse()
+    self.service._Dynamic_Get(request, response)
+    return {item.key(): item for item in response.item_list()}
+
+  def round_trips(self):
+    return sum(host.round_trips for host in self.hosts)
+
+  def test_multi_key_round_trips(self):
+    keys = ['key{}'.format(index) for index in range(100)]
+    statuses = self.set_items([(key, key.upper(), None) for key in keys])
+    self.assertEqual(statuses, [MemcacheSetResponse.STORED] * 100)
+    self.assertEqual(self.round_trips(), 3)
+
+    items = self.get_items(keys + ['missing'])
+    self.assertEqual(sorted(items), sorted(keys))
+    self.assertEqual(items['key7'].value(), 'KEY7')
+    self.assertEqual(self.round_trips(), 6)
+
+    request = memcache_service_pb.MemcacheDeleteRequest()
+    for key in ['key1', 'missing']:
+      request.add_item().set_key(key)
+    response = memcache_service_pb.MemcacheDeleteResponse()
+    self.service._Dynamic_Delete(request, response)
+    self.assertEqual(response.delete_status_list(),
+                     [MemcacheDeleteResponse.DELETED,
+                      MemcacheDeleteResponse.NOT_FOUND])
+
+  def test_set_policies(self):
+    self.set_items([('a', '1', None)])
+    self.assertEqual(
+      self.set_items([('a', '2', None), ('b', '2', None)],
+                     MemcacheSetRequest.ADD),
+      [MemcacheSetResponse.NOT_STORED, MemcacheSetResponse.STORED])
+    self.assertEqual(
+      self.set_items([('a', '3', None), ('c', '3', None)],
+                     MemcacheSetRequest.REPLACE),
+      [MemcacheSetResponse.STORED, MemcacheSetResponse.NOT_STORED])
+    self.assertEqual(self.get_items(['a'])['a'].value(), '3')
+
+  def test_cas(self):
+    self.set_items([('a', '1', None)])
+    cas_id = self.get_items(['a'], for_cas=True)['a'].cas_id()
+
+    # Another writer invalidates the fetched CAS ID.
+    self.set_items([('a', '2', None)])
+    self.assertEqual(self.set_items([('a', '3', cas_id)],
+                                    MemcacheSetRequest.CAS),
+                     [MemcacheSetResponse.EXISTS])
+
+    cas_id = self.get_items(['a'], for_cas=True)['a'].cas_id()
+    self.assertEqual(
+      self.set_items([('a', '3', cas_id), ('missing', '3', cas_id)],
+                     MemcacheSetRequest.CAS),
+      [MemcacheSetResponse.STORED, MemcacheSetResponse.NOT_STORED])
+    self.assertEqual(self.get_items(['a'])['a'].value(), '3')
+
+  def test_increment(self):
+    request = memcache_service_pb.MemcacheIncrementRequest()
+    request.set_key('counter')
+    request.set_delta(2)
+    request.set_initial_value(5)
+    for expected in (7, 9):
+      response = memcache_service_pb.MemcacheIncrementResponse()
+      self.service._Dynamic_Increment(request, response)
+      self.assertEqual(response.new_value(), expected)
+
+    self.assertEqual(self.get_items(['counter'])['counter'].value(), '9')
+
+  def test_entry_formats(self):
+    entry = memcache_distributed.EncodeEntry(7, 'value')
+    self.assertEqual(len(entry), 10)
+    self.assertEqual(memcache_distributed.DecodeEntry(entry), (7, 'value'))
+    self.assertEqual(memcache_distributed.DecodeEntry(
+      memcache_distributed.EncodeEntry(0, '')), (0, ''))
+
+    # Entries pickled by earlier versions are still readable.
+    internal_key = self.service._GetKey('', 'legacy')
+    self.service._memcache.set(internal_key,
+                               cPickle.dumps([3, 12, '\x01value']))
+    item = self.get_items(['legacy'])['legacy']
+    self.assertEqual((item.flags(), item.value()), (3, '\x01value'))
+
+  def test_near_cache(self):
+    self.service.setupNearCache('hot')
+    self.set_items([('a', '1', None), ('b', '1', None)], namespace='hot')
+    self.set_items([('a', '1', None)])
+
+    self.get_items(['a', 'b'], namespace='hot')
+    self.get_items(['a'])
+    trips = self.round_trips()
+    self.assertEqual(self.get_items(['a', 'b'], namespace='hot')['a'].value(),
+                     '1')
+    self.assertEqual(self.round_trips(), trips)
+
+    # Namespaces that did not opt in and CAS reads always go to memcached.
+    self.get_items(['a'])
+    self.get_items(['a'], for_cas=True, namespace='hot')
+    self.assertEqual(self.round_trips(), trips + 2)
+
+    # Writes from this instance drop the namespace's entries.
+    self.set_items([('b', '2', None)], namespace='hot')
+    self.assertEqual(self.get_items(['b'], namespace='hot')['b'].value(), '2')
+
+    response = memcache_service_pb.MemcacheStatsResponse()
+    self.service._Dynamic_Stats(memcache_service_pb.MemcacheStatsRequest(),
+                                response)
+    self.assertEqual(response.stats().hits(),
+                     sum(host.hits for host in self.hosts) + 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
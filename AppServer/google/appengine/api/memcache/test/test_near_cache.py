@@ -0,0 +1,78 @@
+import os
+import sys
+import unittest
+
+sys.path.append("{0}/../../../../..".format(
+  os.path.dirname(os.path.abspath(__file__))))
+from google.appengine.api.memcache.near_cache import ENTRY_OVERHEAD
+from google.appengine.api.memcache.near_cache import NearCache
+
+
+class FakeClock(object):
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+
+class TestNearCache(unittest.TestCase):
+  def setUp(self):
+    self.clock = FakeClock()
+    self.cache = NearCache(['', 'hot'], 3 * (ENTRY_OVERHEAD + 5), 5,
+                           gettime=self.clock)
+
+  def put(self, namespace, key, value='v'):
+    generation = self.cache.Generation(namespace)
+    self.cache.Put(namespace, key, 0, value, generation)
+
+  def test_enabled(self):
+    self.assertTrue(self.cache.Enabled(''))
+    self.assertTrue(self.cache.Enabled('hot'))
+    self.assertFalse(self.cache.Enabled('cold'))
+    self.assertTrue(NearCache(['*'], 100, 1).Enabled('cold'))
+
+  def test_lease(self):
+    self.put('hot', 'a')
+    self.assertEqual(self.cache.Get('hot', 'a'), (0, 'v'))
+    self.clock.now += 5
+    self.assertIsNone(self.cache.Get('hot', 'a'))
+    self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+    self.assertEqual(self.cache.size, 0)
+
+  def test_lru_eviction(self):
+    self.put('hot', 'a')
+    self.put('hot', 'b')
+    self.put('', 'c')
+    self.cache.Get('hot', 'a')
+    self.put('', 'd')
+    self.assertIsNone(self.cache.Get('hot', 'b'))
+    self.assertEqual(self.cache.Get('hot', 'a'), (0, 'v'))
+    self.assertEqual(self.cache.evictions, 1)
+
+    # Values that can never fit are not cached.
+    self.put('hot', 'e', 'v' * 1000)
+    self.assertIsNone(self.cache.Get('hot', 'e'))
+
+  def test_invalidation(self):
+    self.put('hot', 'a')
+    self.put('', 'a')
+    stale_generation = self.cache.Generation('hot')
+    self.cache.InvalidateNamespace('hot')
+    self.assertIsNone(self.cache.Get('hot', 'a'))
+    self.assertEqual(self.cache.Get('', 'a'), (0, 'v'))
+
+    # Values fetched before an invalidation are not cached.
+    self.cache.Put('hot', 'b', 0, 'v', stale_generation)
+    self.assertIsNone(self.cache.Get('hot', 'b'))
+
+    stale_generation = self.cache.Generation('')
+    self.cache.Clear()
+    self.cache.Put('', 'b', 0, 'v', stale_generation)
+    self.assertIsNone(self.cache.Get('', 'a'))
+    self.assertIsNone(self.cache.Get('', 'b'))
+    self.assertEqual(self.cache.size, 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
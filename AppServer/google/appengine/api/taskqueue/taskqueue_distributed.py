@@ -27,6 +27,8 @@ import os.path
 import random
 import socket
 import string
+import threading
+import time
 
 import taskqueue_service_pb
 
@@ -80,6 +82,112 @@ KEY_LOCATION = "/etc/appscale/certs/mykey.pem"
 TASKQUEUE_PROXY_FILE = "/etc/appscale/load_balancer_ips"
 TASKQUEUE_SERVER_PORT = 17446
 
+# The number of seconds a proxy is skipped after it refuses a connection.
+# This doubles with each consecutive failure up to MAX_EJECTION_TIME.
+BASE_EJECTION_TIME = 2
+
+MAX_EJECTION_TIME = 60
+
+# Socket errors that indicate a proxy is unavailable.
+PROXY_UNAVAILABLE_ERRORS = (errno.ECONNREFUSED, errno.EHOSTUNREACH)
+
+
+class ProxyList(object):
+  """ Keeps track of the TaskQueue proxies and which ones are healthy.
+
+  The proxy file is only read again when its modification time changes.
+  Requests start at a different proxy each time, and proxies that refuse
+  connections are skipped for a while.
+  """
+  def __init__(self, proxy_file, gettime=time.time):
+    """ Creates a new ProxyList.
+
+    Args:
+      proxy_file: A string specifying the location of the proxy list.
+      gettime: time.time()-like function used for testing.
+    """
+    self._proxy_file = proxy_file
+    self._gettime = gettime
+    self._lock = threading.Lock()
+    self._mtime = None
+    self._locations = []
+    self._next_index = 0
+
+    # Maps locations to (consecutive failures, ejected until) tuples.
+    self._failures = {}
+
+  def _Reload(self):
+    """ Reads the proxy file if it has changed. The caller must hold the
+    lock.
+
+    Raises:
+      ApplicationError if the proxy file can't be read.
+    """
+    try:
+      mtime = os.path.getmtime(self._proxy_file)
+      if mtime == self._mtime:
+        return
+
+      with open(self._proxy_file) as tq_file:
+        ips = [ip for ip in tq_file.read().split('\n') if ip]
+    except (IOError, OSError):
+      raise apiproxy_errors.ApplicationError(
+        taskqueue_service_pb.TaskQueueServiceError.INTERNAL_ERROR)
+
+    self._mtime = mtime
+    self._locations = ["{ip}:{port}".format(ip=ip, port=TASKQUEUE_SERVER_PORT)
+                       for ip in ips]
+    self._failures = {location: failures
+                      for location, failures in self._failures.iteritems()
+                      if location in self._locations}
+
+  def Ordered(self):
+    """ Lists the proxies in the order they should be tried.
+
+    Returns:
+      A list of location strings. Ejected proxies are at the end.
+    """
+    with self._lock:
+      self._Reload()
+      if not self._locations:
+        return []
+
+      start = self._next_index % len(self._locations)
+      self._next_index = start + 1
+      rotated = self._locations[start:] + self._locations[:start]
+
+      now = self._gettime()
+      healthy = []
+      ejected = []
+      for location in rotated:
+        if self._failures.get(location, (0, 0))[1] > now:
+          ejected.append(location)
+        else:
+          healthy.append(location)
+
+      return healthy + ejected
+
+  def RecordSuccess(self, location):
+    """ Returns a proxy to the rotation.
+
+    Args:
+      location: A string specifying a proxy location.
+    """
+    with self._lock:
+      self._failures.pop(location, None)
+
+  def RecordFailure(self, location):
+    """ Skips a proxy until its ejection time has passed.
+
+    Args:
+      location: A string specifying a proxy location.
+    """
+    with self._lock:
+      failures = self._failures.get(location, (0, 0))[0] + 1
+      ejection_time = min(BASE_EJECTION_TIME * 2 ** (failures - 1),
+                          MAX_EJECTION_TIME)
+      self._failures[location] = (failures, self._gettime() + ejection_time)
+
 class TaskQueueServiceStub(apiproxy_stub.APIProxyStub):
   """Python only task queue service stub.
 
@@ -102,23 +210,12 @@ class TaskQueueServiceStub(apiproxy_stub.APIProxyStub):
         service_name, max_request_size=MAX_REQUEST_SIZE)
     self.__app_id = app_id
     self.__nginx_host = host
+    self.__proxies = ProxyList(TASKQUEUE_PROXY_FILE)
 
   def _GetTQLocations(self):
-    """ Gets a list of TaskQueue proxies. """
-    if os.path.exists(TASKQUEUE_PROXY_FILE):
-      try:
-        with open(TASKQUEUE_PROXY_FILE) as tq_file:
-          ips = [ip for ip in tq_file.read().split('\n') if ip]
-      except IOError:
-        raise apiproxy_errors.ApplicationError(
-          taskqueue_service_pb.TaskQueueServiceError.INTERNAL_ERROR)
-    else:
-      raise apiproxy_errors.ApplicationError(
-        taskqueue_service_pb.TaskQueueServiceError.INTERNAL_ERROR)
-
-    locations = ["{ip}:{port}".format(ip=ip, port=TASKQUEUE_SERVER_PORT)
-                 for ip in ips]
-    return locations
+    """ Gets a list of TaskQueue proxies in the order they should be tried.
+    """
+    return self.__proxies.Ordered()
 
   def _ChooseTaskName(self):
     """ Creates a task name that the system can use to address
@@ -458,9 +555,13 @@ class TaskQueueServiceStub(apiproxy_stub.APIProxyStub):
           False,
           KEY_LOCATION,
           CERT_LOCATION)
+        self.__proxies.RecordSuccess(tq_location)
         break
       except socket.error as socket_error:
-        if socket_error.errno in (errno.ECONNREFUSED, errno.EHOSTUNREACH):
+        if socket_error.errno in PROXY_UNAVAILABLE_ERRORS:
+          logging.warning('Skipping unavailable TaskQueue proxy: {}'.format(
+            tq_location))
+          self.__proxies.RecordFailure(tq_location)
           api_response = remote_api_pb.Response()
           continue
 
@@ -1,5 +1,6 @@
 import os
 import sys
+import tempfile
 import unittest
 from flexmock import flexmock
 
@@ -144,7 +145,66 @@ class TestTaskqueueDistributed(unittest.TestCase):
     self.assertEquals(response, tqd._AddTransactionalBulkTask(FakeBulkAddRequest(),
       response))
 
-    
+
+
+class TestProxyList(unittest.TestCase):
+  def setUp(self):
+    self.now = 1000.0
+    handle, self.proxy_file = tempfile.mkstemp()
+    os.close(handle)
+    self.write_proxies(['10.0.0.1', '10.0.0.2', '10.0.0.3'], mtime=1)
+    self.proxies = taskqueue_distributed.ProxyList(
+      self.proxy_file, gettime=lambda: self.now)
+
+  def tearDown(self):
+    if os.path.exists(self.proxy_file):
+      os.remove(self.proxy_file)
+
+  def write_proxies(self, ips, mtime):
+    with open(self.proxy_file, 'w') as proxy_file:
+      proxy_file.write('\n'.join(ips) + '\n')
+    os.utime(self.proxy_file, (mtime, mtime))
+
+  def test_round_robin(self):
+    first_choices = [self.proxies.Ordered()[0] for _ in range(4)]
+    self.assertEqual(first_choices, ['10.0.0.1:17446', '10.0.0.2:17446',
+                                     '10.0.0.3:17446', '10.0.0.1:17446'])
+
+  def test_reload(self):
+    self.proxies.Ordered()
+
+    # The file is only read again when its modification time changes.
+    self.write_proxies(['10.0.0.4'], mtime=1)
+    self.assertEqual(len(self.proxies.Ordered()), 3)
+    self.write_proxies(['10.0.0.4'], mtime=2)
+    self.assertEqual(self.proxies.Ordered(), ['10.0.0.4:17446'])
+
+    os.remove(self.proxy_file)
+    self.assertRaises(taskqueue_distributed.apiproxy_errors.ApplicationError,
+                      self.proxies.Ordered)
+
+  def test_circuit_breaker(self):
+    proxy1, proxy2, proxy3 = ['10.0.0.{}:17446'.format(index)
+                              for index in (1, 2, 3)]
+    self.proxies.RecordFailure(proxy1)
+    self.assertEqual(self.proxies.Ordered(), [proxy2, proxy3, proxy1])
+
+    # The proxy is tried again once its ejection time passes.
+    self.now += taskqueue_distributed.BASE_EJECTION_TIME
+    self.proxies.Ordered()
+    self.assertEqual(self.proxies.Ordered(), [proxy3, proxy1, proxy2])
+
+    # Consecutive failures double the ejection time.
+    self.proxies.RecordFailure(proxy1)
+    self.now += taskqueue_distributed.BASE_EJECTION_TIME
+    self.assertEqual(self.proxies.Ordered(), [proxy2, proxy3, proxy1])
+
+    # Successful requests reset the count.
+    self.proxies.RecordSuccess(proxy1)
+    self.proxies.RecordFailure(proxy1)
+    self.now += taskqueue_distributed.BASE_EJECTION_TIME
+    self.assertEqual(self.proxies.Ordered(), [proxy2, proxy3, proxy1])
+
 
 if __name__ == "__main__":
   unittest.main()
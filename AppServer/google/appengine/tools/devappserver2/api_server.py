@@ -310,7 +310,10 @@ def create_api_server(request_info, storage_path, options, app_id, app_root):
       default_gcs_bucket_name=options.default_gcs_bucket_name,
       uaserver_path=options.uaserver_path,
       xmpp_path=options.xmpp_path,
-      xmpp_domain=options.login_server)
+      xmpp_domain=options.login_server,
+      memcache_near_cache_namespaces=options.memcache_near_cache_namespaces,
+      memcache_near_cache_size=options.memcache_near_cache_mb,
+      memcache_near_cache_lease=options.memcache_near_cache_lease)
 
   # The APIServer must bind to localhost because that is what the runtime
   # instances talk to.
@@ -431,7 +434,10 @@ def setup_stubs(
     default_gcs_bucket_name,
     uaserver_path,
     xmpp_path,
-    xmpp_domain):
+    xmpp_domain,
+    memcache_near_cache_namespaces,
+    memcache_near_cache_size,
+    memcache_near_cache_lease):
   """Configures the APIs hosted by this server.
 
   Args:
@@ -489,6 +495,13 @@ def setup_stubs(
     xmpp_path: (AppScale-specific) A str containing the FQDN or IP address of
         the machine that runs ejabberd, where XMPP clients should connect to.
     xmpp_domain: A string specifying the domain portion of the XMPP user.
+    memcache_near_cache_namespaces: (AppScale-specific) A comma-separated str
+        of namespaces whose memcache reads are cached in this server or None
+        to disable the near cache.
+    memcache_near_cache_size: (AppScale-specific) A float specifying the
+        number of megabytes that can be used for cached memcache reads.
+    memcache_near_cache_lease: (AppScale-specific) A float specifying how
+        many seconds a cached memcache read can be served.
   """
 
   identity_stub = app_identity_stub.AppIdentityServiceStub()
@@ -558,7 +571,10 @@ def setup_stubs(
 
   apiproxy_stub_map.apiproxy.RegisterStub(
       'memcache',
-      memcache_distributed.MemcacheService())
+      memcache_distributed.MemcacheService(
+          near_cache_namespaces=memcache_near_cache_namespaces,
+          near_cache_size=memcache_near_cache_size,
+          near_cache_lease=memcache_near_cache_lease))
 
   apiproxy_stub_map.apiproxy.RegisterStub(
       'search',
@@ -686,7 +702,10 @@ def test_setup_stubs(
     default_gcs_bucket_name=None,
     uaserver_path='localhost',
     xmpp_path='localhost',
-    xmpp_domain='localhost'):
+    xmpp_domain='localhost',
+    memcache_near_cache_namespaces=None,
+    memcache_near_cache_size=16,
+    memcache_near_cache_lease=2):
   """Similar to setup_stubs with reasonable test defaults and recallable."""
 
   # Reset the stub map between requests because a stub map only allows a
@@ -723,7 +742,10 @@ def test_setup_stubs(
               default_gcs_bucket_name,
               uaserver_path,
               xmpp_path,
-              xmpp_domain)
+              xmpp_domain,
+              memcache_near_cache_namespaces,
+              memcache_near_cache_size,
+              memcache_near_cache_lease)
 
 
 def cleanup_stubs():
@@ -643,5 +643,16 @@ def create_command_line_parser(configuration=None):
     default=False,
     help='if this application can read data stored by other applications.')
   appscale_group.add_argument('--pidfile', help='create pidfile at location')
+  appscale_group.add_argument(
+    '--memcache_near_cache_namespaces',
+    help='a comma-separated list of namespaces whose memcache reads are '
+    'cached in this server. An empty item stands for the default namespace, '
+    'and "*" caches every namespace.')
+  appscale_group.add_argument(
+    '--memcache_near_cache_mb', type=float, default=16,
+    help='the number of megabytes that can be used for cached memcache reads')
+  appscale_group.add_argument(
+    '--memcache_near_cache_lease', type=float, default=2,
+    help='the number of seconds that a cached memcache read can be served')
 
   return parser
@@ -19,10 +19,14 @@
 
 
 import array
+import errno
 import httplib
 import os
 import re
+import socket
 import struct
+import threading
+import time
 
 __all__ = ['ProtocolMessage', 'Encoder', 'Decoder',
            'ExtendableProtocolMessage',
@@ -33,6 +37,79 @@ __all__ = ['ProtocolMessage', 'Encoder', 'Decoder',
 
 URL_RE = re.compile('^(https?)://([^/]+)(/.*)$')
 
+
+class _ConnectionPool(object):
+  """ AppScale: Keeps idle HTTP connections to API servers for reuse.
+
+  Connections are pooled per server and security settings. A connection is
+  only used by one thread at a time, so the lock only guards the idle lists.
+  """
+
+  # The number of idle connections to keep for each server.
+  MAX_IDLE_PER_SERVER = 10
+
+  # Idle connections older than this many seconds are closed rather than
+  # reused, since the other end may be about to drop them.
+  MAX_IDLE_TIME = 30
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._idle = {}
+
+  @staticmethod
+  def _is_healthy(conn):
+    """ Checks that an idle connection has not been closed by the server.
+
+    An idle socket should have nothing to read. If a peek returns anything,
+    the server has closed it or sent something unexpected.
+    """
+    if conn.sock is None:
+      return False
+    try:
+      conn.sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+    except socket.error as error:
+      return error.errno in (errno.EAGAIN, errno.EWOULDBLOCK)
+    except ValueError:
+      # SSL sockets cannot be peeked, so stale ones are only handled by
+      # retrying when writing a request fails.
+      return True
+    return False
+
+  def get(self, key):
+    """ Takes an idle connection for the given key.
+
+    Returns:
+      An httplib connection or None if there are no healthy idle connections.
+    """
+    now = time.time()
+    while True:
+      with self._lock:
+        idle = self._idle.get(key)
+        if not idle:
+          return None
+        conn, last_used = idle.pop()
+      if now - last_used < self.MAX_IDLE_TIME and self._is_healthy(conn):
+        return conn
+      conn.close()
+
+  def put(self, key, conn):
+    """ Returns a connection that has finished its request to the pool. """
+    with self._lock:
+      idle = self._idle.setdefault(key, [])
+      if len(idle) < self.MAX_IDLE_PER_SERVER:
+        idle.append((conn, time.time()))
+        return
+    conn.close()
+
+
+_CONNECTION_POOL = _ConnectionPool()
+
+# AppScale: Errors writing a request that indicate a reused connection was
+# closed by the server.
+_STALE_CONNECTION_ERRORS = (httplib.CannotSendRequest,)
+_STALE_SOCKET_ERRNOS = (errno.EPIPE, errno.ECONNRESET, errno.ECONNABORTED)
+
+
 class ProtocolMessage:
 
 
@@ -111,14 +188,66 @@ class ProtocolMessage:
                   secure=0, keyfile=None, certfile=None, service_id=None,
                   version_id=None):
     data = self.Encode()
-    if secure:
-      if keyfile and certfile:
-        conn = httplib.HTTPSConnection(server, key_file=keyfile,
-                                       cert_file=certfile)
-      else:
-        conn = httplib.HTTPSConnection(server)
+
+    # AppScale: Reuse a pooled connection when possible. A reused connection
+    # may have been closed by the server since it was last used, so retry
+    # once with a new connection if the request could not be written. Once
+    # the request has been written, the server may have acted on it, so
+    # errors while waiting for the response are not retried.
+    pool_key = (server, secure, keyfile, certfile)
+    conn = _CONNECTION_POOL.get(pool_key)
+    reused = conn is not None
+    while True:
+      if conn is None:
+        if secure:
+          if keyfile and certfile:
+            conn = httplib.HTTPSConnection(server, key_file=keyfile,
+                                           cert_file=certfile)
+          else:
+            conn = httplib.HTTPSConnection(server)
+        else:
+          conn = httplib.HTTPConnection(server)
+      try:
+        self._writeRequest(conn, url, data)
+        break
+      except (socket.error, httplib.HTTPException) as error:
+        conn.close()
+        stale = (isinstance(error, _STALE_CONNECTION_ERRORS) or
+                 (isinstance(error, socket.error) and
+                  error.errno in _STALE_SOCKET_ERRNOS))
+        if not (reused and stale):
+          raise
+        conn = None
+        reused = False
+
+    try:
+      resp = conn.getresponse()
+    except (socket.error, httplib.HTTPException):
+      conn.close()
+      raise
+
+    body = resp.read()
+    if resp.will_close:
+      conn.close()
     else:
-      conn = httplib.HTTPConnection(server)
+      _CONNECTION_POOL.put(pool_key, conn)
+
+    if follow_redirects > 0 and resp.status == 302:
+      m = URL_RE.match(resp.getheader('Location'))
+      if m:
+        protocol, server, url = m.groups()
+        return self.sendCommand(server, url, response,
+                                follow_redirects=follow_redirects - 1,
+                                secure=(protocol == 'https'),
+                                keyfile=keyfile,
+                                certfile=certfile)
+    if resp.status != 200:
+      raise ProtocolBufferReturnError(resp.status)
+    if response is not None:
+      response.ParseFromString(body)
+    return response
+
+  def _writeRequest(self, conn, url, data):
     conn.putrequest("POST", '/')
     conn.putheader("Content-Length", "%d" %len(data))
     # AppScale:
@@ -139,23 +268,6 @@ class ProtocolMessage:
 
     conn.endheaders()
     conn.send(data)
-    resp = conn.getresponse()
-    if follow_redirects > 0 and resp.status == 302:
-      m = URL_RE.match(resp.getheader('Location'))
-      if m:
-        protocol, server, url = m.groups()
-        return self.sendCommand(server, url, response,
-                                follow_redirects=follow_redirects - 1,
-                                secure=(protocol == 'https'),
-                                keyfile=keyfile,
-                                certfile=certfile)
-    if resp.status != 200:
-      conn.close()
-      raise ProtocolBufferReturnError(resp.status)
-    if response is not None:
-      response.ParseFromString(resp.read())
-    conn.close()
-    return response
 
   def sendSecureCommand(self, server, keyfile, certfile, url, response,
                         follow_redirects=1):
@@ -0,0 +1,96 @@
+import errno
+import httplib
+import os
+import socket
+import sys
+import unittest
+
+from flexmock import flexmock
+
+sys.path.append("{0}/../../../..".format(
+  os.path.dirname(os.path.abspath(__file__))))
+from google.appengine.api.memcache import memcache_service_pb
+from google.net.proto import ProtocolBuffer
+
+
+class FakeResponse(object):
+  status = 200
+  will_close = False
+
+  def read(self):
+    return ''
+
+
+class FakeConnection(object):
+  """ Records requests and fails at a chosen step. """
+  def __init__(self, send_error=None, response_error=None):
+    self.send_error = send_error
+    self.response_error = response_error
+    self.sent = []
+    self.closed = False
+
+  def putrequest(self, method, url):
+    pass
+
+  def putheader(self, header, value):
+    pass
+
+  def endheaders(self):
+    pass
+
+  def send(self, data):
+    if self.send_error is not None:
+      raise self.send_error
+
+    self.sent.append(data)
+
+  def getresponse(self):
+    if self.response_error is not None:
+      raise self.response_error
+
+    return FakeResponse()
+
+  def close(self):
+    self.closed = True
+
+
+class TestSendCommand(unittest.TestCase):
+  def setUp(self):
+    self.request = memcache_service_pb.MemcacheIncrementRequest()
+    self.request.set_key('counter')
+
+  def use_connections(self, reused, new_connections):
+    flexmock(ProtocolBuffer._CONNECTION_POOL).should_receive('get').\
+      and_return(reused)
+    flexmock(ProtocolBuffer._CONNECTION_POOL).should_receive('put')
+    flexmock(httplib).should_receive('HTTPConnection').\
+      and_return(*new_connections)
+
+  def test_retry_unsent_request(self):
+    # A reused connection that the server has closed fails while the request
+    # is being written, so the request is sent on a new connection.
+    reused = FakeConnection(send_error=socket.error(errno.EPIPE, 'Broken'))
+    fresh = FakeConnection()
+    self.use_connections(reused, [fresh])
+
+    self.request.sendCommand('localhost:8888', 'guestbook', None)
+    self.assertTrue(reused.closed)
+    self.assertEqual(fresh.sent, [self.request.Encode()])
+
+  def test_no_retry_after_request_is_sent(self):
+    # Once the request has been written, the server may have applied it, so
+    # it is not resent when the response fails.
+    reused = FakeConnection(response_error=httplib.BadStatusLine(''))
+    fresh = FakeConnection()
+    self.use_connections(reused, [fresh])
+
+    with self.assertRaises(httplib.BadStatusLine):
+      self.request.sendCommand('localhost:8888', 'guestbook', None)
+
+    self.assertEqual(reused.sent, [self.request.Encode()])
+    self.assertTrue(reused.closed)
+    self.assertEqual(fresh.sent, [])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -8,6 +8,7 @@ import signal
 import sys
 import time
 
+from concurrent.futures import ThreadPoolExecutor
 from kazoo.client import KazooClient
 from tornado import gen, httpserver, ioloop
 from tornado.web import Application, RequestHandler
@@ -18,7 +19,10 @@ from appscale.common.unpackaged import APPSCALE_PYTHON_APPSERVER
 from appscale.datastore.cassandra_env.cassandra_interface import DatastoreProxy
 
 from appscale.taskqueue import distributed_tq
-from appscale.taskqueue.constants import SHUTTING_DOWN_TIMEOUT
+from appscale.taskqueue.constants import (
+  DEFAULT_PB_METHOD_CONCURRENCY, MAX_BACKGROUND_WORKERS,
+  PB_METHOD_CONCURRENCY, SHUTTING_DOWN_TIMEOUT
+)
 from appscale.taskqueue.rest_api import (
   REST_PREFIX, RESTLease, RESTQueue, RESTTask, RESTTasks, QueueList
 )
@@ -26,6 +30,7 @@ from appscale.taskqueue.statistics import (
   PROTOBUFFER_API, service_stats, stats_lock
 )
 from appscale.taskqueue.utils import logger
+from appscale.taskqueue.worker_pool import WorkerPool
 
 sys.path.append(APPSCALE_PYTHON_APPSERVER)
 from google.appengine.api.taskqueue import taskqueue_service_pb
@@ -36,9 +41,10 @@ class ProtobufferHandler(RequestHandler):
   """ Defines what to do when the webserver receives different types of HTTP
   requests. """
 
-  def initialize(self, queue_handler):
-    """ Provide access to the queue handler. """
+  def initialize(self, queue_handler, worker_pool):
+    """ Provide access to the queue handler and the worker pool. """
     self.queue_handler = queue_handler
+    self.worker_pool = worker_pool
 
   def unknown_request(self, app_id, http_request_data, pb_type):
     """ Function which handles unknown protocol buffers.
@@ -82,7 +88,7 @@ class ProtobufferHandler(RequestHandler):
     module = request.headers['Module']
     app_info = {'app_id': app_id, 'version_id': version, 'module_id': module}
     if pb_type == "Request":
-      method, status = self.remote_request(app_info, http_request_data)
+      method, status = yield self.remote_request(app_info, http_request_data)
       # Fill request stats info
       self.stats_info.pb_method = method
       self.stats_info.pb_status = status
@@ -91,25 +97,29 @@ class ProtobufferHandler(RequestHandler):
       # Fill request stats info
       self.stats_info.pb_status = "NOT_A_PROTOBUFFER_REQUEST"
 
+  @gen.coroutine
   def remote_request(self, app_info, http_request_data):
     """ Receives a remote request to which it should give the correct
     response. The http_request_data holds an encoded protocol buffer of a
     certain type. Each type has a particular response type.
 
+    The handler for the method runs on the worker pool so that slow backend
+    calls do not block other requests.
+
     Args:
       app_info: A dictionary containing the application, module, and version ID
         of the app that is sending this request.
       http_request_data: Encoded protocol buffer.
+    Returns:
+      A tuple containing the method name and the status name.
     """
     apirequest = remote_api_pb.Request()
     apirequest.ParseFromString(http_request_data)
     apiresponse = remote_api_pb.Response()
-    response = None
     errcode = 0
     errdetail = ""
     method = ""
     http_request_data = ""
-    app_id = app_info['app_id']
     if not apirequest.has_method():
       errcode = taskqueue_service_pb.TaskQueueServiceError.INVALID_REQUEST
       errdetail = "Method was not set in request"
@@ -132,6 +142,47 @@ class ProtobufferHandler(RequestHandler):
       request_log += ': {}'.format(apirequest.request_id())
     logger.debug(request_log)
 
+    response, result = yield self.worker_pool.run(
+      method, self.dispatch, method, app_info, http_request_data)
+    if result:
+      response, errcode, errdetail = result
+
+    elapsed_time = round(time.time() - start_time, 3)
+    timing_log = 'Elapsed: {}'.format(elapsed_time)
+    if apirequest.has_request_id():
+      timing_log += ' ({})'.format(apirequest.request_id())
+    logger.debug(timing_log)
+
+    if response is not None:
+      apiresponse.set_response(response)
+
+    # If there was an error add it to the response.
+    if errcode != 0:
+      apperror_pb = apiresponse.mutable_application_error()
+      apperror_pb.set_code(errcode)
+      apperror_pb.set_detail(errdetail)
+
+    self.write(apiresponse.Encode())
+    status = taskqueue_service_pb.TaskQueueServiceError.ErrorCode_Name(errcode)
+    raise gen.Return((method, status))
+
+  def dispatch(self, method, app_info, http_request_data):
+    """ Calls the queue handler function for a method.
+
+    This runs on a worker thread, so it must not use the request handler's
+    output methods.
+
+    Args:
+      method: A string specifying the method name.
+      app_info: A dictionary containing the application, module, and version ID
+        of the app that is sending this request.
+      http_request_data: The encoded request for the method.
+    Returns:
+      A tuple containing a default response and the handler's result. The
+      result is None if the method is not supported.
+    """
+    app_id = app_info['app_id']
+    response = None
     result = None
     if method == "FetchQueueStats":
       result = self.queue_handler.fetch_queue_stats(app_id, http_request_data)
@@ -169,32 +220,16 @@ class ProtobufferHandler(RequestHandler):
       result = self.queue_handler.update_storage_limit(
         app_id, http_request_data)
 
-    if result:
-      response, errcode, errdetail = result
-
-    elapsed_time = round(time.time() - start_time, 3)
-    timing_log = 'Elapsed: {}'.format(elapsed_time)
-    if apirequest.has_request_id():
-      timing_log += ' ({})'.format(apirequest.request_id())
-    logger.debug(timing_log)
-
-    if response is not None:
-      apiresponse.set_response(response)
-
-    # If there was an error add it to the response.
-    if errcode != 0:
-      apperror_pb = apiresponse.mutable_application_error()
-      apperror_pb.set_code(errcode)
-      apperror_pb.set_detail(errdetail)
-
-    self.write(apiresponse.Encode())
-    status = taskqueue_service_pb.TaskQueueServiceError.ErrorCode_Name(errcode)
-    return method, status
+    return response, result
 
 
 class StatsHandler(RequestHandler):
   """ Defines what to do when the webserver receives different types of HTTP
   requests. """
+  def initialize(self, worker_pool):
+    """ Provide access to the worker pool. """
+    self.worker_pool = worker_pool
+
   @gen.coroutine
   def get(self):
     """ Handles get request for the web server. Returns that it is currently
@@ -219,25 +254,30 @@ class StatsHandler(RequestHandler):
     tq_stats = {
       "current_requests": service_stats.current_requests,
       "cumulative_counters": cumulative_counters,
-      "recent_stats": recent_stats
+      "recent_stats": recent_stats,
+      "protobuffer_workers": self.worker_pool.stats()
     }
     self.write(json.dumps(tq_stats))
 
 
-def prepare_taskqueue_application(task_queue):
+def prepare_taskqueue_application(task_queue, thread_pool):
+  rest_options = {'queue_handler': task_queue, 'thread_pool': thread_pool}
+  worker_pool = WorkerPool(thread_pool, DEFAULT_PB_METHOD_CONCURRENCY,
+                           PB_METHOD_CONCURRENCY)
   handlers = [
     # Allows task viewer to retrieve list of queues.
     (REST_PREFIX, QueueList, {'queue_handler': task_queue}),
 
     # Provides compatibility with the v1beta2 REST API.
-    (RESTQueue.PATH, RESTQueue, {'queue_handler': task_queue}),
-    (RESTTasks.PATH, RESTTasks, {'queue_handler': task_queue}),
-    (RESTLease.PATH, RESTLease, {'queue_handler': task_queue}),
-    (RESTTask.PATH, RESTTask, {'queue_handler': task_queue}),
+    (RESTQueue.PATH, RESTQueue, rest_options),
+    (RESTTasks.PATH, RESTTasks, rest_options),
+    (RESTLease.PATH, RESTLease, rest_options),
+    (RESTTask.PATH, RESTTask, rest_options),
     # Responds with service statistic
-    ("/service-stats", StatsHandler),
+    ("/service-stats", StatsHandler, {'worker_pool': worker_pool}),
     # Takes protocol buffers from the AppServers.
-    (r"/.*", ProtobufferHandler, {'queue_handler': task_queue})
+    (r"/.*", ProtobufferHandler,
+     {'queue_handler': task_queue, 'worker_pool': worker_pool})
   ]
 
   return Application(handlers)
@@ -302,7 +342,8 @@ def main():
 
   # Initialize tornado server
   task_queue = distributed_tq.DistributedTaskQueue(db_access, zk_client)
-  tq_application = prepare_taskqueue_application(task_queue)
+  thread_pool = ThreadPoolExecutor(MAX_BACKGROUND_WORKERS)
+  tq_application = prepare_taskqueue_application(task_queue, thread_pool)
   # Automatically decompress incoming requests.
   server = httpserver.HTTPServer(tq_application, decompress_request=True)
   server.listen(args.port)
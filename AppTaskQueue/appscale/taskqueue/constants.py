@@ -75,6 +75,20 @@ SUPPORTED_PUSH_QUEUE_FIELDS = {
 
 SHUTTING_DOWN_TIMEOUT = 10  # Limit time for finishing request
 
+# The maximum number of threads to use for blocking queue operations.
+MAX_BACKGROUND_WORKERS = 20
+
+# The number of protocol buffer requests of one method that can be handled at
+# the same time.
+DEFAULT_PB_METHOD_CONCURRENCY = 10
+
+# Methods that are limited further because each request does a lot of work.
+PB_METHOD_CONCURRENCY = {
+  'FetchQueueStats': 4,
+  'PurgeQueue': 2,
+  'QueryTasks': 4
+}
+
 # Exceptions that the datastore client might raise.
 TRANSIENT_DS_ERRORS = (db.InternalError, db.Timeout, socket.error,
                        apiproxy_errors.ApplicationError)
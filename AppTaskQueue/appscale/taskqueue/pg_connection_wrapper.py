@@ -1,25 +1,76 @@
 """
-Postgres connection wrapper with autoreconnect functionality.
+Postgres connection pool with autoreconnect functionality.
 """
-import functools
+from contextlib import contextmanager
+from threading import BoundedSemaphore, Lock
+
 import psycopg2
-from psycopg2 import errorcodes
 
 from appscale.taskqueue.utils import logger
 
 
 class PostgresConnectionWrapper(object):
+  """ A bounded pool of Postgres connections that are opened when needed.
+
+  Each connection is checked out for a single transaction, so requests for
+  different queues can use the database at the same time.
+  """
+
+  # The default maximum number of open connections.
+  MAX_CONNECTIONS = 5
 
   def __init__(self, *args, **kwargs):
+    self.max_connections = kwargs.pop('max_connections', self.MAX_CONNECTIONS)
     self._args = args
     self._kwargs = kwargs
-    self._connection = None
+    self._idle = []
+    self._idle_lock = Lock()
+    self._slots = BoundedSemaphore(self.max_connections)
+
+  @contextmanager
+  def connection(self):
+    """ Checks out a connection for the duration of a transaction.
+
+    The transaction is committed when the block exits normally and rolled back
+    if it raises an exception. This blocks until a connection is available.
 
-  def get_connection(self):
-    if not self._connection or self._connection.closed:
-      logger.info('Establishing new connection to Postgres server')
-      self._connection = psycopg2.connect(*self._args, **self._kwargs)
-    return self._connection
+    Yields:
+      A psycopg2 connection.
+    """
+    self._slots.acquire()
+    try:
+      pg_connection = self._checkout()
+      try:
+        with pg_connection:
+          yield pg_connection
+      finally:
+        self._checkin(pg_connection)
+    finally:
+      self._slots.release()
 
   def close(self):
-    return self._connection.close()
+    """ Closes all idle connections. """
+    with self._idle_lock:
+      idle, self._idle = self._idle, []
+
+    for pg_connection in idle:
+      pg_connection.close()
+
+  def _checkout(self):
+    """ Takes an open idle connection or establishes a new one. """
+    with self._idle_lock:
+      while self._idle:
+        pg_connection = self._idle.pop()
+        if not pg_connection.closed:
+          return pg_connection
+
+    logger.info('Establishing new connection to Postgres server')
+    return psycopg2.connect(*self._args, **self._kwargs)
+
+  def _checkin(self, pg_connection):
+    """ Returns a connection to the pool unless it has been closed. """
+    if pg_connection.closed:
+      return
+
+    with self._idle_lock:
+      self._idle.append(pg_connection)
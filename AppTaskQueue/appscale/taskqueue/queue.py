@@ -272,7 +272,7 @@ class PostgresPullQueue(Queue):
     Args:
       queue_info: A dictionary containing queue info.
       app: A string containing the application ID.
-      pg_connection_wrapper: A psycopg2 connection wrapper.
+      pg_connection_wrapper: A PostgresConnectionWrapper.
     """
     from psycopg2 import IntegrityError  # Import psycopg2 lazily
     super(PostgresPullQueue, self).__init__(queue_info, app)
@@ -283,8 +283,7 @@ class PostgresPullQueue(Queue):
     # they sometimes get IntegrityError despite 'IF NOT EXISTS'
     @retrying.retry(max_retries=5, retry_on_exception=IntegrityError)
     def ensure_tables_created():
-      pg_connection = self.pg_connection_wrapper.get_connection()
-      with pg_connection:
+      with self.pg_connection_wrapper.connection() as pg_connection:
         with pg_connection.cursor() as pg_cursor:
           pg_cursor.execute(
             'CREATE TABLE IF NOT EXISTS "{table_name}" ('
@@ -341,9 +340,8 @@ class PostgresPullQueue(Queue):
     except AttributeError:
       lease_expires = 'current_timestamp'
 
-    pg_connection = self.pg_connection_wrapper.get_connection()
     try:
-      with pg_connection:
+      with self.pg_connection_wrapper.connection() as pg_connection:
         with pg_connection.cursor() as pg_cursor:
           pg_cursor.execute(
             'INSERT INTO "{table}" ( '
@@ -386,8 +384,7 @@ class PostgresPullQueue(Queue):
     else:
       columns = ['payload', 'task_name', 'time_enqueued',
                  'lease_expires', 'lease_count', 'tag']
-    pg_connection = self.pg_connection_wrapper.get_connection()
-    with pg_connection:
+    with self.pg_connection_wrapper.connection() as pg_connection:
       with pg_connection.cursor() as pg_cursor:
         pg_cursor.execute(
           'SELECT {columns} FROM "{tasks_table}" '
@@ -412,8 +409,7 @@ class PostgresPullQueue(Queue):
     Args:
       task: A Task object.
     """
-    pg_connection = self.pg_connection_wrapper.get_connection()
-    with pg_connection:
+    with self.pg_connection_wrapper.connection() as pg_connection:
       with pg_connection.cursor() as pg_cursor:
         pg_cursor.execute(
           'UPDATE "{tasks_table}" '
@@ -436,8 +432,7 @@ class PostgresPullQueue(Queue):
     Returns:
       A Task object.
     """
-    pg_connection = self.pg_connection_wrapper.get_connection()
-    with pg_connection:
+    with self.pg_connection_wrapper.connection() as pg_connection:
       with pg_connection.cursor() as pg_cursor:
         pg_cursor.execute(
           'UPDATE "{tasks_table}" '
@@ -501,8 +496,7 @@ class PostgresPullQueue(Queue):
     else:
       old_eta_verification = ''
 
-    pg_connection = self.pg_connection_wrapper.get_connection()
-    with pg_connection:
+    with self.pg_connection_wrapper.connection() as pg_connection:
       with pg_connection.cursor() as pg_cursor:
         pg_cursor.execute(
           statement.format(tasks_table=self.tasks_table_name,
@@ -530,8 +524,7 @@ class PostgresPullQueue(Queue):
     """
     columns = ['task_name', 'time_enqueued',
                'lease_expires', 'lease_count', 'tag']
-    pg_connection = self.pg_connection_wrapper.get_connection()
-    with pg_connection:
+    with self.pg_connection_wrapper.connection() as pg_connection:
       with pg_connection.cursor() as pg_cursor:
         pg_cursor.execute(
           'SELECT {columns} FROM "{tasks_table}" '
@@ -592,8 +585,7 @@ class PostgresPullQueue(Queue):
       '"{table}".{col}'.format(table=self.tasks_table_name, col=column)
       for column in columns
     ]
-    pg_connection = self.pg_connection_wrapper.get_connection()
-    with pg_connection:
+    with self.pg_connection_wrapper.connection() as pg_connection:
       with pg_connection.cursor() as pg_cursor:
         pg_cursor.execute(
           'UPDATE "{tasks_table}" '
@@ -633,8 +625,7 @@ class PostgresPullQueue(Queue):
   def purge(self):
     """ Remove all tasks from queue.
     """
-    pg_connection = self.pg_connection_wrapper.get_connection()
-    with pg_connection:
+    with self.pg_connection_wrapper.connection() as pg_connection:
       with pg_connection.cursor() as pg_cursor:
         pg_cursor.execute(
           'TRUNCATE TABLE "{tasks_table}"'
@@ -681,8 +672,7 @@ class PostgresPullQueue(Queue):
     Returns:
       An integer specifying the number of tasks in the queue.
     """
-    pg_connection = self.pg_connection_wrapper.get_connection()
-    with pg_connection:
+    with self.pg_connection_wrapper.connection() as pg_connection:
       with pg_connection.cursor() as pg_cursor:
         pg_cursor.execute(
           'SELECT count(*) FROM "{tasks_table}" WHERE time_deleted IS NULL'
@@ -699,8 +689,7 @@ class PostgresPullQueue(Queue):
       A datetime object specifying the oldest ETA or None if there are no
       tasks.
     """
-    pg_connection = self.pg_connection_wrapper.get_connection()
-    with pg_connection:
+    with self.pg_connection_wrapper.connection() as pg_connection:
       with pg_connection.cursor() as pg_cursor:
         pg_cursor.execute(
           'SELECT min(lease_expires) FROM "{tasks_table}" '
@@ -714,8 +703,7 @@ class PostgresPullQueue(Queue):
   def flush_deleted(self):
     """ Removes all tasks which were deleted more than week ago.
     """
-    pg_connection = self.pg_connection_wrapper.get_connection()
-    with pg_connection:
+    with self.pg_connection_wrapper.connection() as pg_connection:
       with pg_connection.cursor() as pg_cursor:
         pg_cursor.execute(
           'DELETE FROM "{tasks_table}" '
@@ -766,8 +754,7 @@ class PostgresPullQueue(Queue):
     Returns:
       A string containing a tag or None.
     """
-    pg_connection = self.pg_connection_wrapper.get_connection()
-    with pg_connection:
+    with self.pg_connection_wrapper.connection() as pg_connection:
       with pg_connection.cursor() as pg_cursor:
         pg_cursor.execute(
           'SELECT tag FROM "{tasks_table}" '
@@ -1472,34 +1459,14 @@ class PullQueue(Queue):
       raise EmptyQueue('No entries in queue index')
     return tag
 
-  def _increment_count_async(self, task):
-    """ Update retry count for a task.
-
-    Args:
-      task: A Task object.
-    """
-    session = self.db_access.session
-
-    statement = """
-      UPDATE pull_queue_tasks
-      SET retry_count=?
-      WHERE app=? AND queue=? AND id=?
-      IF retry_count=?
-    """
-    if statement not in self.prepared_statements:
-      self.prepared_statements[statement] = session.prepare(statement)
-    update_count = self.prepared_statements[statement]
-
-    old_count = task.retry_count
-    new_count = task.retry_count + 1
-    params = [new_count, self.app, self.name, task.id, old_count]
-    bound_update = update_count.bind(params)
-    bound_update.retry_policy = NO_RETRIES
-    self.db_access.session.execute_async(bound_update)
-
   def _lease_batch(self, indexes, new_eta):
     """ Acquires a lease on tasks in the queue.
 
+    The retry count is incremented by the same conditional update that
+    acquires the lease. Since the payload, enqueue time, and tag do not change
+    after a task is added, they are read along with the current retry count
+    before leasing instead of with a serial read afterwards.
+
     Args:
       indexes: An iterable containing results from the index table.
       new_eta: A datetime object containing the new lease expiration.
@@ -1510,25 +1477,8 @@ class PullQueue(Queue):
     leased = [None for _ in indexes]
     session = self.db_access.session
     op_id = uuid.uuid4()
-
-    lease_statement = """
-      UPDATE pull_queue_tasks
-      SET lease_expires = ?, op_id = ?
-      WHERE app = ? AND queue = ? AND id = ?
-      IF lease_expires < ?
-    """
-    if self.task_retry_limit != 0:
-      lease_statement += 'AND retry_count < {}'.format(self.task_retry_limit)
-    lease_task = session.prepare(lease_statement)
-    lease_task.retry_policy = NO_RETRIES
     current_time = datetime.datetime.utcnow()
 
-    update_futures = []
-    for index in indexes:
-      params = (new_eta, op_id, self.app, self.name, index.id, current_time)
-      update_futures.append(session.execute_async(lease_task, params))
-
-    # Check which lease operations succeeded.
     statement = """
       SELECT payload, enqueued, retry_count, tag, op_id
       FROM pull_queue_tasks
@@ -1538,51 +1488,99 @@ class PullQueue(Queue):
       self.prepared_statements[statement] = session.prepare(statement)
     select = self.prepared_statements[statement]
 
-    futures = {}
-    for result_num, update_future in enumerate(update_futures):
+    read_futures = [
+      session.execute_async(select, [self.app, self.name, index.id])
+      for index in indexes]
+
+    task_rows = {}
+    lease_futures = {}
+    for result_num, read_future in enumerate(read_futures):
+      index = indexes[result_num]
       try:
-        result = update_future.result()
-        success = True
-      except DriverException:
-        result = None
-        success = False
-
-      if success and not result.was_applied:
-        # The lease operation failed, so keep this index as None.
+        task_row = read_future.result()[0]
+      except IndexError:
+        # The index does not refer to an existing task.
         continue
+      except TRANSIENT_CASSANDRA_ERRORS:
+        raise TransientError('Unable to read task {}'.format(index.id))
 
-      index = indexes[result_num]
-      bound_select = select.bind([self.app, self.name, index.id])
+      task_rows[result_num] = task_row
+      future = self._lease_task_async(index.id, task_row.retry_count, new_eta,
+                                      op_id, current_time)
+      if future is not None:
+        lease_futures[result_num] = (future, task_row.retry_count)
+
+    # Check which lease operations succeeded. A lease can be retried once if
+    # the task was available but its retry count changed after it was read.
+    old_counts = {}
+    timed_out = []
+    retry_allowed = True
+    while lease_futures:
+      retry_futures = {}
+      for result_num, (future, retry_count) in lease_futures.iteritems():
+        try:
+          result = future.result()
+        except DriverException:
+          timed_out.append(result_num)
+          continue
+
+        if result.was_applied:
+          old_counts[result_num] = retry_count
+          continue
+
+        # A failed conditional update returns the current values of the
+        # columns in its condition. If the task has been deleted, it only
+        # returns the applied column.
+        current = result[0]
+        current_expiration = getattr(current, 'lease_expires', None)
+        if (not retry_allowed or current_expiration is None or
+            current_expiration >= current_time or
+            current.retry_count == retry_count):
+          continue
+
+        future = self._lease_task_async(
+          indexes[result_num].id, current.retry_count, new_eta, op_id,
+          current_time)
+        if future is not None:
+          retry_futures[result_num] = (future, current.retry_count)
+
+      lease_futures = retry_futures
+      retry_allowed = False
+
+    # If a lease timed out, the operation ID shows whether it was applied.
+    serial_futures = {}
+    for result_num in timed_out:
+      bound_select = select.bind([self.app, self.name, indexes[result_num].id])
       bound_select.consistency_level = ConsistencyLevel.SERIAL
-      future = session.execute_async(bound_select)
-      futures[result_num] = (future, not success)
+      serial_futures[result_num] = session.execute_async(bound_select)
 
-    index_update_futures = []
-    for result_num, (future, lease_timed_out) in futures.iteritems():
-      index = indexes[result_num]
+    for result_num, future in serial_futures.iteritems():
       try:
         read_result = future.result()[0]
       except (TRANSIENT_CASSANDRA_ERRORS, IndexError):
-        raise TransientError('Unable to read task {}'.format(index.id))
+        raise TransientError(
+          'Unable to read task {}'.format(indexes[result_num].id))
 
-      # If the operation IDs do not match, the lease was not successful.
-      if lease_timed_out and read_result.op_id != op_id:
-        continue
+      if read_result.op_id == op_id:
+        old_counts[result_num] = read_result.retry_count - 1
 
+    index_update_futures = []
+    for result_num, retry_count in old_counts.iteritems():
+      index = indexes[result_num]
+      task_row = task_rows[result_num]
       task_info = {
         'queueName': self.name,
         'id': index.id,
-        'payloadBase64': read_result.payload,
-        'enqueueTimestamp': read_result.enqueued,
+        'payloadBase64': task_row.payload,
+        'enqueueTimestamp': task_row.enqueued,
         'leaseTimestamp': new_eta,
-        'retry_count': read_result.retry_count
+        'retry_count': retry_count
       }
-      if read_result.tag:
-        task_info['tag'] = read_result.tag
+      if task_row.tag:
+        task_info['tag'] = task_row.tag
       task = Task(task_info)
       leased[result_num] = task
 
-      self._increment_count_async(task)
       index_update_futures.append(self._update_index_async(index, task))
       self._update_stats()
 
@@ -1592,6 +1590,40 @@ class PullQueue(Queue):
 
     return leased
 
+  def _lease_task_async(self, task_id, retry_count, new_eta, op_id,
+                        current_time):
+    """ Tries to lease a task and increment its retry count.
+
+    Args:
+      task_id: A string specifying the task ID.
+      retry_count: An integer specifying the task's current retry count.
+      new_eta: A datetime object containing the new lease expiration.
+      op_id: A uuid identifying this lease operation.
+      current_time: A datetime object that the current lease must precede.
+    Returns:
+      A cassandra-driver future or None if the task has reached its retry
+      limit.
+    """
+    if self.task_retry_limit != 0 and retry_count >= self.task_retry_limit:
+      return None
+
+    session = self.db_access.session
+    statement = """
+      UPDATE pull_queue_tasks
+      SET lease_expires = ?, op_id = ?, retry_count = ?
+      WHERE app = ? AND queue = ? AND id = ?
+      IF lease_expires < ? AND retry_count = ?
+    """
+    if statement not in self.prepared_statements:
+      self.prepared_statements[statement] = session.prepare(statement)
+    lease_task = self.prepared_statements[statement]
+
+    params = [new_eta, op_id, retry_count + 1, self.app, self.name, task_id,
+              current_time, retry_count]
+    bound_lease = lease_task.bind(params)
+    bound_lease.retry_policy = NO_RETRIES
+    return session.execute_async(bound_lease)
+
   def _update_index_async(self, old_index, task):
     """ Updates the index table after leasing a task.
 
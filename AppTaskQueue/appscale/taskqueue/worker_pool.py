@@ -0,0 +1,107 @@
+""" Runs blocking request handlers outside of the IOLoop. """
+import threading
+
+from collections import defaultdict
+
+from tornado import gen, locks
+
+
+class WorkerPool(object):
+  """ Limits how many requests of each method can use a thread pool.
+
+  A request first waits until fewer than its method's limit are in progress.
+  It is then queued on the thread pool until a thread is available.
+  """
+  def __init__(self, thread_pool, default_limit, method_limits=None):
+    """ Creates a new WorkerPool.
+
+    Args:
+      thread_pool: A ThreadPoolExecutor.
+      default_limit: An integer specifying how many requests of a method can
+        be in progress at once.
+      method_limits: A dictionary mapping method names to limits that differ
+        from the default.
+    """
+    self._thread_pool = thread_pool
+    self._default_limit = default_limit
+    self._method_limits = method_limits or {}
+    self._semaphores = {}
+
+    # Counters for requests that are waiting for their method's limit, that
+    # are waiting for a thread, and that are running. Threads update the last
+    # two, so they are guarded by a lock.
+    self._waiting = defaultdict(int)
+    self._queued = defaultdict(int)
+    self._running = defaultdict(int)
+    self._counter_lock = threading.Lock()
+
+  @gen.coroutine
+  def run(self, method, function, *args, **kwargs):
+    """ Runs a function on the thread pool.
+
+    Args:
+      method: A string specifying the request method.
+      function: The function to run.
+      args: Positional arguments for the function.
+      kwargs: Keyword arguments for the function.
+    Returns:
+      The function's return value.
+    """
+    semaphore = self._semaphore(method)
+    self._waiting[method] += 1
+    try:
+      yield semaphore.acquire()
+    finally:
+      self._waiting[method] -= 1
+
+    with self._counter_lock:
+      self._queued[method] += 1
+
+    def run_in_thread():
+      with self._counter_lock:
+        self._queued[method] -= 1
+        self._running[method] += 1
+
+      try:
+        return function(*args, **kwargs)
+      finally:
+        with self._counter_lock:
+          self._running[method] -= 1
+
+    try:
+      result = yield self._thread_pool.submit(run_in_thread)
+    finally:
+      semaphore.release()
+
+    raise gen.Return(result)
+
+  def stats(self):
+    """ Reports how many requests are waiting and running.
+
+    Returns:
+      A dictionary containing totals and a breakdown by method.
+    """
+    with self._counter_lock:
+      queued = dict(self._queued)
+      running = dict(self._running)
+
+    waiting = dict(self._waiting)
+    by_method = {
+      method: {'waiting': waiting.get(method, 0),
+               'queued': queued.get(method, 0),
+               'running': running.get(method, 0)}
+      for method in set(waiting) | set(queued) | set(running)}
+    return {'waiting': sum(waiting.values()),
+            'queued': sum(queued.values()),
+            'running': sum(running.values()),
+            'by_method': by_method}
+
+  def _semaphore(self, method):
+    """ Fetches the semaphore that limits a method. """
+    try:
+      return self._semaphores[method]
+    except KeyError:
+      limit = self._method_limits.get(method, self._default_limit)
+      semaphore = locks.Semaphore(limit)
+      self._semaphores[method] = semaphore
+      return semaphore
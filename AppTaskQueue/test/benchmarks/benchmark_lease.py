@@ -0,0 +1,297 @@
+""" Measures pull queue lease throughput against a scripted Cassandra session.
+
+The session stub answers each statement from an in-memory table after a
+simulated delay. Regular reads and writes take one round trip, serial reads
+take two, and lightweight transactions take four. The "legacy" columns use
+the previous lease procedure, which prepared the lease statement on every
+call, read each leased task with a serial read, and incremented the retry
+count with a second lightweight transaction. The "current" columns use
+PullQueue._lease_batch.
+"""
+import argparse
+import collections
+import datetime
+import time
+import uuid
+
+from cassandra import DriverException
+from cassandra.query import ConsistencyLevel
+
+from appscale.taskqueue import queue as queue_module
+from appscale.taskqueue.queue import PullQueue
+from appscale.taskqueue.task import Task
+
+IndexRow = collections.namedtuple('IndexRow', ['id', 'eta', 'tag'])
+TaskRow = collections.namedtuple(
+  'TaskRow', ['payload', 'enqueued', 'retry_count', 'tag', 'op_id'])
+LeaseRow = collections.namedtuple(
+  'LeaseRow', ['applied', 'lease_expires', 'retry_count'])
+
+
+class FakeFuture(object):
+  """ A response that becomes available after a simulated delay. """
+  def __init__(self, delay, value):
+    self.ready_at = time.time() + delay
+    self.value = value
+
+  def result(self):
+    remaining = self.ready_at - time.time()
+    if remaining > 0:
+      time.sleep(remaining)
+
+    if isinstance(self.value, Exception):
+      raise self.value
+
+    return self.value
+
+
+class FakeResult(list):
+  """ A list of rows that resembles a cassandra-driver ResultSet. """
+  @property
+  def was_applied(self):
+    return self[0].applied
+
+
+class FakeStatement(object):
+  def __init__(self, query_string, params=None):
+    self.query_string = query_string
+    self.params = params
+    self.retry_policy = None
+    self.consistency_level = None
+
+  def bind(self, params):
+    return FakeStatement(self.query_string, params)
+
+
+class FakeBatch(object):
+  def __init__(self, retry_policy=None):
+    self.retry_policy = retry_policy
+    self.statements = []
+
+  def add(self, statement, params):
+    self.statements.append(statement.bind(params))
+
+
+class ScriptedSession(object):
+  """ Answers pull queue statements from a dictionary of tasks. """
+  def __init__(self, round_trip, timeout_every=0):
+    self.round_trip = round_trip
+    self.timeout_every = timeout_every
+    self.tasks = {}
+    self.counts = collections.Counter()
+
+  def prepare(self, query_string):
+    self.counts['prepare'] += 1
+    time.sleep(self.round_trip)
+    return FakeStatement(query_string)
+
+  def execute_async(self, statement, params=None):
+    if isinstance(statement, FakeBatch):
+      self.counts['batch'] += 1
+      return FakeFuture(self.round_trip * 2, FakeResult())
+
+    if params is None:
+      params = statement.params
+
+    query = ' '.join(statement.query_string.split())
+    if query.startswith('SELECT'):
+      if statement.consistency_level == ConsistencyLevel.SERIAL:
+        self.counts['serial read'] += 1
+        delay = self.round_trip * 2
+      else:
+        self.counts['read'] += 1
+        delay = self.round_trip
+
+      task = self.tasks.get(params[-1])
+      rows = FakeResult()
+      if task is not None:
+        rows.append(TaskRow(task['payload'], task['enqueued'],
+                            task['retry_count'], task['tag'], task['op_id']))
+      return FakeFuture(delay, rows)
+
+    if query.startswith('INSERT INTO pull_queue_leases'):
+      self.counts['stats'] += 1
+      return FakeFuture(self.round_trip, FakeResult())
+
+    self.counts['lwt'] += 1
+    if 'SET lease_expires' in query:
+      value = self._lease(query, params)
+    else:
+      value = self._increment(params)
+
+    return FakeFuture(self.round_trip * 4, value)
+
+  def _lease(self, query, params):
+    if 'retry_count = ?' in query:
+      new_eta, op_id, new_count, _, _, task_id, now, old_count = params
+    else:
+      new_eta, op_id, _, _, task_id, now = params
+      new_count = old_count = None
+
+    task = self.tasks[task_id]
+    if (self.timeout_every and
+        self.counts['lwt'] % self.timeout_every == 0):
+      # Simulate a lease that was applied but timed out.
+      exception = DriverException('Operation timed out')
+    else:
+      exception = None
+
+    applied = task['lease_expires'] < now
+    if old_count is not None:
+      applied = applied and task['retry_count'] == old_count
+
+    if applied:
+      task['lease_expires'] = new_eta
+      task['op_id'] = op_id
+      if new_count is not None:
+        task['retry_count'] = new_count
+
+    if exception is not None:
+      return exception
+
+    return FakeResult(
+      [LeaseRow(applied, task['lease_expires'], task['retry_count'])])
+
+  def _increment(self, params):
+    new_count, _, _, task_id, old_count = params
+    task = self.tasks[task_id]
+    applied = task['retry_count'] == old_count
+    if applied:
+      task['retry_count'] = new_count
+
+    return FakeResult([LeaseRow(applied, None, task['retry_count'])])
+
+
+class LegacyPullQueue(PullQueue):
+  """ A PullQueue that leases tasks the way it used to. """
+  def _lease_batch(self, indexes, new_eta):
+    leased = [None for _ in indexes]
+    session = self.db_access.session
+    op_id = uuid.uuid4()
+
+    lease_statement = """
+      UPDATE pull_queue_tasks
+      SET lease_expires = ?, op_id = ?
+      WHERE app = ? AND queue = ? AND id = ?
+      IF lease_expires < ?
+    """
+    lease_task = session.prepare(lease_statement)
+    current_time = datetime.datetime.utcnow()
+
+    update_futures = []
+    for index in indexes:
+      params = (new_eta, op_id, self.app, self.name, index.id, current_time)
+      update_futures.append(session.execute_async(lease_task, params))
+
+    statement = """
+      SELECT payload, enqueued, retry_count, tag, op_id
+      FROM pull_queue_tasks
+      WHERE app=? AND queue=? AND id=?
+    """
+    if statement not in self.prepared_statements:
+      self.prepared_statements[statement] = session.prepare(statement)
+    select = self.prepared_statements[statement]
+
+    futures = {}
+    for result_num, update_future in enumerate(update_futures):
+      try:
+        result = update_future.result()
+        success = True
+      except DriverException:
+        success = False
+
+      if success and not result.was_applied:
+        continue
+
+      bound_select = select.bind([self.app, self.name, indexes[result_num].id])
+      bound_select.consistency_level = ConsistencyLevel.SERIAL
+      futures[result_num] = (session.execute_async(bound_select), not success)
+
+    index_update_futures = []
+    for result_num, (future, lease_timed_out) in futures.iteritems():
+      index = indexes[result_num]
+      read_result = future.result()[0]
+      if lease_timed_out and read_result.op_id != op_id:
+        continue
+
+      task = Task({'queueName': self.name, 'id': index.id,
+                   'payloadBase64': read_result.payload,
+                   'enqueueTimestamp': read_result.enqueued,
+                   'leaseTimestamp': new_eta,
+                   'retry_count': read_result.retry_count})
+      leased[result_num] = task
+
+      bound_update = FakeStatement('UPDATE pull_queue_tasks SET retry_count=?')
+      session.execute_async(bound_update.bind(
+        [task.retry_count + 1, self.app, self.name, task.id,
+         task.retry_count]))
+      index_update_futures.append(self._update_index_async(index, task))
+      self._update_stats()
+
+    for index_update in index_update_futures:
+      index_update.result()
+
+    return leased
+
+
+def fill_queue(session, task_count):
+  """ Adds available tasks to the session and returns their index rows. """
+  session.tasks.clear()
+  enqueued = datetime.datetime.utcnow() - datetime.timedelta(minutes=1)
+  indexes = []
+  for task_num in xrange(task_count):
+    task_id = 'task{}'.format(task_num)
+    session.tasks[task_id] = {'payload': 'cGF5bG9hZA==', 'enqueued': enqueued,
+                              'lease_expires': enqueued, 'retry_count': 0,
+                              'tag': '', 'op_id': None}
+    indexes.append(IndexRow(task_id, enqueued, ''))
+
+  return indexes
+
+
+def measure(queue_class, session, batch_size, batches):
+  """ Returns the tasks leased per second and Paxos round trips per task. """
+  queue = queue_class({'name': 'pull-queue', 'mode': 'pull'}, 'guestbook',
+                      collections.namedtuple('DBAccess', ['session'])(session))
+  leased = 0
+  duration = 0
+  session.counts.clear()
+  for _ in xrange(batches):
+    indexes = fill_queue(session, batch_size)
+    new_eta = datetime.datetime.utcnow() + datetime.timedelta(seconds=60)
+    start = time.time()
+    tasks = queue._lease_batch(indexes, new_eta)
+    duration += time.time() - start
+    leased += len([task for task in tasks if task is not None])
+
+  paxos_trips = session.counts['lwt'] * 4 + session.counts['serial read'] * 2
+  return leased / duration, float(paxos_trips) / leased
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--round-trip', type=float, default=0.002,
+                      help='Seconds for one simulated round trip')
+  parser.add_argument('--batch-sizes', type=int, nargs='+',
+                      default=[1, 10, 100])
+  parser.add_argument('--batches', type=int, default=10)
+  parser.add_argument('--timeout-every', type=int, default=0,
+                      help='Time out every nth lightweight transaction')
+  args = parser.parse_args()
+
+  queue_module.BatchStatement = FakeBatch
+  session = ScriptedSession(args.round_trip, args.timeout_every)
+
+  print('{:>6} {:>14} {:>14} {:>14} {:>14}'.format(
+    'batch', 'legacy t/s', 'current t/s', 'legacy paxos', 'current paxos'))
+  for batch_size in args.batch_sizes:
+    legacy_rate, legacy_rounds = measure(
+      LegacyPullQueue, session, batch_size, args.batches)
+    current_rate, current_rounds = measure(
+      PullQueue, session, batch_size, args.batches)
+    print('{:>6} {:>14.1f} {:>14.1f} {:>14.2f} {:>14.2f}'.format(
+      batch_size, legacy_rate, current_rate, legacy_rounds, current_rounds))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,80 @@
+""" Measures Postgres pull queue requests per second at several concurrency
+levels.
+
+Each client thread repeatedly adds a task to one of several queues, leases a
+task from that queue, and deletes the leased task. The "single" column limits
+the pool to one connection, which matches how every queue of a project used
+to share one connection. The "pooled" column uses the configured pool size.
+This requires a local Postgres server that accepts the given DSN.
+"""
+import argparse
+import base64
+import time
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+
+from appscale.taskqueue.pg_connection_wrapper import PostgresConnectionWrapper
+from appscale.taskqueue.queue import PostgresPullQueue
+from appscale.taskqueue.task import Task
+
+
+def run_client(queue, cycles):
+  """ Adds, leases, and deletes tasks in a queue. """
+  for _ in xrange(cycles):
+    task = Task({'id': 'task-{}'.format(uuid.uuid4().hex),
+                 'payloadBase64': base64.urlsafe_b64encode('payload')})
+    queue.add_task(task)
+    for leased_task in queue.lease_tasks(1, 60):
+      queue.delete_task(leased_task)
+
+
+def measure(dsn, max_connections, queue_count, concurrency, cycles):
+  """ Returns the number of queue requests handled per second. """
+  wrapper = PostgresConnectionWrapper(dsn=dsn,
+                                      max_connections=max_connections)
+  queues = [PostgresPullQueue({'name': 'benchmark-{}'.format(index),
+                               'mode': 'pull'}, 'benchmark', wrapper)
+            for index in xrange(queue_count)]
+  for queue in queues:
+    queue.purge()
+
+  executor = ThreadPoolExecutor(concurrency)
+  start = time.time()
+  futures = [executor.submit(run_client, queues[index % queue_count], cycles)
+             for index in xrange(concurrency)]
+  for future in futures:
+    future.result()
+
+  duration = time.time() - start
+  executor.shutdown()
+  wrapper.close()
+
+  # Each cycle makes three requests.
+  return concurrency * cycles * 3 / duration
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--dsn', default='dbname=appscale-benchmark',
+                      help='The Postgres DSN to connect to')
+  parser.add_argument('--pool-size', type=int,
+                      default=PostgresConnectionWrapper.MAX_CONNECTIONS)
+  parser.add_argument('--queues', type=int, default=4)
+  parser.add_argument('--concurrency', type=int, nargs='+',
+                      default=[1, 2, 5, 10, 20])
+  parser.add_argument('--cycles', type=int, default=100,
+                      help='Add, lease, and delete cycles for each client')
+  args = parser.parse_args()
+
+  print('{:>12} {:>12} {:>12}'.format('concurrency', 'single r/s',
+                                      'pooled r/s'))
+  for concurrency in args.concurrency:
+    single = measure(args.dsn, 1, args.queues, concurrency, args.cycles)
+    pooled = measure(args.dsn, args.pool_size, args.queues, concurrency,
+                     args.cycles)
+    print('{:>12} {:>12.1f} {:>12.1f}'.format(concurrency, single, pooled))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+import threading
+import unittest
+
+from mock import MagicMock, patch
+
+from appscale.taskqueue import pg_connection_wrapper
+from appscale.taskqueue.pg_connection_wrapper import PostgresConnectionWrapper
+
+
+class TestPostgresConnectionWrapper(unittest.TestCase):
+  """
+  A set of test cases for the Postgres connection pool.
+  """
+  def setUp(self):
+    self._connect_patcher = patch.object(
+      pg_connection_wrapper.psycopg2, 'connect',
+      side_effect=lambda *args, **kwargs: MagicMock(closed=0))
+    self.connect_mock = self._connect_patcher.start()
+
+  def tearDown(self):
+    self._connect_patcher.stop()
+
+  def test_reuses_connections(self):
+    wrapper = PostgresConnectionWrapper(dsn='test', max_connections=2)
+    with wrapper.connection() as first:
+      with wrapper.connection() as second:
+        self.assertIsNot(first, second)
+
+    with wrapper.connection() as third:
+      self.assertIn(third, (first, second))
+
+    self.assertEqual(self.connect_mock.call_count, 2)
+    self.connect_mock.assert_called_with(dsn='test')
+
+  def test_replaces_closed_connections(self):
+    wrapper = PostgresConnectionWrapper(dsn='test')
+    with wrapper.connection() as first:
+      first.closed = 2
+
+    with wrapper.connection() as second:
+      self.assertIsNot(second, first)
+
+  def test_limits_connections(self):
+    wrapper = PostgresConnectionWrapper(dsn='test', max_connections=1)
+    checked_out = threading.Event()
+
+    def use_connection():
+      with wrapper.connection():
+        checked_out.set()
+
+    with wrapper.connection():
+      thread = threading.Thread(target=use_connection)
+      thread.start()
+      self.assertFalse(checked_out.wait(0.1))
+
+    thread.join(5)
+    self.assertTrue(checked_out.is_set())
+    self.assertEqual(self.connect_mock.call_count, 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+import collections
+import datetime
+import unittest
+
+from mock import MagicMock, patch
+
+from appscale.taskqueue.queue import PullQueue
+
+IndexRow = collections.namedtuple('IndexRow', ['id', 'eta', 'tag'])
+TaskRow = collections.namedtuple(
+  'TaskRow', ['payload', 'enqueued', 'retry_count', 'tag', 'op_id'])
+LeaseRow = collections.namedtuple(
+  'LeaseRow', ['applied', 'lease_expires', 'retry_count'])
+DeletedRow = collections.namedtuple('DeletedRow', ['applied'])
+
+
+class ScriptedResult(list):
+  """ A list of rows that resembles a cassandra-driver ResultSet. """
+  @property
+  def was_applied(self):
+    return self[0].applied
+
+
+class ScriptedStatement(object):
+  def __init__(self, query_string, params=None):
+    self.query_string = query_string
+    self.params = params
+
+  def bind(self, params):
+    return ScriptedStatement(self.query_string, params)
+
+
+class ScriptedSession(object):
+  """ Answers task reads and leases with scripted rows for each task. """
+  def __init__(self, task_rows, lease_rows):
+    self.task_rows = task_rows
+    self.lease_rows = lease_rows
+    self.leases = []
+
+  def prepare(self, query_string):
+    return ScriptedStatement(query_string)
+
+  def execute_async(self, statement, params=None):
+    if params is None:
+      params = statement.params
+
+    future = MagicMock()
+    if statement.query_string.strip().startswith('SELECT'):
+      future.result.return_value = ScriptedResult([self.task_rows[params[-1]]])
+    else:
+      task_id = params[5]
+      self.leases.append(task_id)
+      future.result.return_value = ScriptedResult(
+        [self.lease_rows[task_id].pop(0)])
+
+    return future
+
+
+class TestPullQueue(unittest.TestCase):
+  """
+  A set of test cases for leasing pull queue tasks.
+  """
+  def test_lease_batch(self):
+    now = datetime.datetime.utcnow()
+    enqueued = now - datetime.timedelta(minutes=1)
+    new_eta = now + datetime.timedelta(minutes=1)
+    task_rows = {task_id: TaskRow('cGF5bG9hZA==', enqueued, 0, '', None)
+                 for task_id in ('available', 'deleted', 'leased', 'retried')}
+
+    # A task that was deleted after it was read only returns the applied
+    # column, and a task that someone else leased is not retried. A task
+    # whose retry count changed while it was available is retried once.
+    lease_rows = {'available': [LeaseRow(True, enqueued, 0)],
+                  'deleted': [DeletedRow(False)],
+                  'leased': [LeaseRow(False, new_eta, 1)],
+                  'retried': [LeaseRow(False, enqueued, 2),
+                              LeaseRow(True, enqueued, 2)]}
+    session = ScriptedSession(task_rows, lease_rows)
+    queue = PullQueue({'name': 'pull-queue', 'mode': 'pull'}, 'guestbook',
+                      MagicMock(session=session))
+    indexes = [IndexRow(task_id, enqueued, '')
+               for task_id in ('available', 'deleted', 'leased', 'retried')]
+
+    with patch.object(queue, '_update_index_async'), \
+         patch.object(queue, '_update_stats'):
+      leased = queue._lease_batch(indexes, new_eta)
+
+    self.assertEqual(leased[0].id, 'available')
+    self.assertEqual(leased[0].retry_count, 0)
+    self.assertEqual(leased[1:3], [None, None])
+    self.assertEqual(leased[3].id, 'retried')
+    self.assertEqual(leased[3].retry_count, 2)
+    self.assertEqual(sorted(session.leases),
+                     ['available', 'deleted', 'leased', 'retried', 'retried'])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -4,6 +4,7 @@ import json
 
 from appscale.common.service_stats import stats_manager
 from mock import mock, patch
+from tornado import gen
 from tornado.testing import AsyncHTTPTestCase
 
 from appscale.common.unpackaged import APPSCALE_PYTHON_APPSERVER
@@ -23,7 +24,7 @@ class TestServiceStatistics(AsyncHTTPTestCase):
     # We mock functionality which uses distributed taskqueue so can omit it
     distributed_taskqueue = None
     return appscale_taskqueue.prepare_taskqueue_application(
-      task_queue=distributed_taskqueue
+      task_queue=distributed_taskqueue, thread_pool=None
     )
 
   def setUp(self):
@@ -55,6 +56,9 @@ class TestServiceStatistics(AsyncHTTPTestCase):
       appscale_taskqueue.ProtobufferHandler, 'remote_request'
     )
     self.pb_remote_request_mock = remote_request_patcher.start()
+    # The handler yields the result of remote_request.
+    self.pb_remote_request_mock.side_effect = (
+      lambda *args: gen.maybe_future(self.pb_remote_request_mock.return_value))
     self.patchers.append(remote_request_patcher)
 
     time_patcher = patch.object(stats_manager.time, 'time')
@@ -142,6 +146,12 @@ class TestServiceStatistics(AsyncHTTPTestCase):
     # Verify other fields
     self.assertEqual(stats, {
       'current_requests': 0,
+      'protobuffer_workers': {
+        'waiting': 0,
+        'queued': 0,
+        'running': 0,
+        'by_method': {}
+      },
       'cumulative_counters': {
         'all': 15,
         'failed': 5,
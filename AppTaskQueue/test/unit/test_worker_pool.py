@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+import threading
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+
+from appscale.taskqueue.worker_pool import WorkerPool
+
+
+class TestWorkerPool(AsyncTestCase):
+  """
+  A set of test cases for running request handlers on worker threads.
+  """
+  def setUp(self):
+    super(TestWorkerPool, self).setUp()
+    self.thread_pool = ThreadPoolExecutor(4)
+
+  def tearDown(self):
+    self.thread_pool.shutdown()
+    super(TestWorkerPool, self).tearDown()
+
+  @gen_test
+  def test_run(self):
+    worker_pool = WorkerPool(self.thread_pool, 2)
+    caller = threading.current_thread()
+    result = yield worker_pool.run(
+      'Add', lambda value: (value, threading.current_thread()), 'task')
+    self.assertEqual(result[0], 'task')
+    self.assertIsNot(result[1], caller)
+
+    with self.assertRaises(ValueError):
+      yield worker_pool.run('Add', int, 'invalid')
+
+    self.assertEqual(worker_pool.stats(), {
+      'waiting': 0, 'queued': 0, 'running': 0,
+      'by_method': {'Add': {'waiting': 0, 'queued': 0, 'running': 0}}})
+
+  @gen_test
+  def test_method_limits(self):
+    worker_pool = WorkerPool(self.thread_pool, 2, {'PurgeQueue': 1})
+    release = threading.Event()
+    purges = [worker_pool.run('PurgeQueue', release.wait, 5)
+              for _ in range(2)]
+    adds = [worker_pool.run('Add', release.wait, 5) for _ in range(3)]
+
+    # Wait for the worker threads to pick up the permitted requests.
+    for _ in range(50):
+      stats = worker_pool.stats()
+      if stats['running'] == 3:
+        break
+      yield gen.sleep(0.01)
+
+    self.assertEqual(stats['by_method']['PurgeQueue'],
+                     {'waiting': 1, 'queued': 0, 'running': 1})
+    self.assertEqual(stats['by_method']['Add'],
+                     {'waiting': 1, 'queued': 0, 'running': 2})
+
+    release.set()
+    yield purges + adds
+    self.assertEqual(worker_pool.stats()['waiting'], 0)
+    self.assertEqual(worker_pool.stats()['running'], 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
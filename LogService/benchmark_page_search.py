@@ -0,0 +1,55 @@
+#!/usr/bin/python
+""" Times time-windowed searches across many rolled log files. """
+import argparse
+import shutil
+import tempfile
+import time
+
+from benchmark_search import FakeTransport, build_record
+from logserver import AppLogFile, AppRegistry, Protocol
+import logging_capnp
+
+def build_logs(path, files, records_per_file):
+  index = 0
+  for log_file_id in xrange(1, files + 1):
+    alf = AppLogFile(path, 'guestbook', log_file_id, AppLogFile.MODE_WRITE)
+    for _ in xrange(records_per_file):
+      alf.write(build_record(index))
+      index += 1
+    alf.close()
+  return AppRegistry(path, 'guestbook', factory=None), index
+
+def search(registry, startTime, endTime):
+  query = logging_capnp.Query.new_message()
+  query.versionIds = ['v1']
+  query.startTime = startTime
+  query.endTime = endTime
+  query.count = 100
+  protocol = Protocol()
+  protocol.app_registry = registry
+  protocol.transport = FakeTransport()
+  start = time.time()
+  protocol.processActionQuerySearch(query)
+  return time.time() - start
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--files', type=int, default=200)
+  parser.add_argument('--records', type=int, default=5000,
+                      help='Records per file')
+  args = parser.parse_args()
+
+  path = tempfile.mkdtemp()
+  try:
+    registry, count = build_logs(path, args.files, args.records)
+    # build_record gives record i a startTime of i * 1000.
+    for fraction in (0.99, 0.5, 0.01):
+      endTime = int(count * fraction) * 1000
+      elapsed = search(registry, endTime - 100 * 1000, endTime)
+      print 'window ending at %d%% of %d records: %.1f ms' % (
+        fraction * 100, count, elapsed * 1000)
+  finally:
+    shutil.rmtree(path)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+""" Times a search over a large synthetic log and reports peak memory. """
+import argparse
+import capnp  # pylint: disable=unused-import
+import logging_capnp
+import resource
+import shutil
+import struct
+import tempfile
+import time
+
+from logserver import AppRegistry, Protocol
+
+def build_record(index):
+  record = logging_capnp.RequestLog.new_message()
+  record.appId = 'guestbook'
+  record.versionId = 'v1.1'
+  record.requestId = struct.pack('Q', index).rjust(10, '\0')
+  record.startTime = index * 1000
+  record.endTime = index * 1000 + 500
+  record.method = 'GET'
+  record.resource = '/guestbook/%d' % index
+  record.status = 200
+  appLog = record.init('appLogs', 1)[0]
+  appLog.time = index * 1000
+  appLog.level = 1
+  appLog.message = 'x' * 400
+  return record.to_bytes()
+
+def build_log(path, size):
+  registry = AppRegistry(path, 'guestbook', factory=None)
+  index = 0
+  while registry._writer._handle.tell() < size:
+    registry._writer.write(build_record(index))
+    index += 1
+  registry._writer._handle.flush()
+  return registry, index
+
+class FakeTransport(object):
+  def __init__(self):
+    self.written = 0
+
+  def write(self, data):
+    self.written += len(data)
+
+def search(registry, minimumLogLevel):
+  query = logging_capnp.Query.new_message()
+  query.versionIds = ['v1']
+  query.minimumLogLevel = minimumLogLevel
+  query.count = 100
+  protocol = Protocol()
+  protocol.app_registry = registry
+  protocol.transport = FakeTransport()
+  start = time.time()
+  protocol.processActionQuerySearch(query)
+  return time.time() - start, protocol.transport.written
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--size', type=int, default=1024,
+                      help='Size of the synthetic log in MiB')
+  args = parser.parse_args()
+
+  path = tempfile.mkdtemp()
+  try:
+    start = time.time()
+    registry, count = build_log(path, args.size * 1024 * 1024)
+    print 'Wrote %d records in %.1fs' % (count, time.time() - start)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # A level that no record has forces a scan until the search times out.
+    for label, level in (('matching', 1), ('non-matching', 5)):
+      elapsed, written = search(registry, level)
+      peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+      print '%s query: %.2fs, %d bytes sent, peak RSS growth %d KiB' % (
+        label, elapsed, written, peak - baseline)
+  finally:
+    shutil.rmtree(path)
+
+if __name__ == '__main__':
+  main()
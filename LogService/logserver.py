@@ -1,6 +1,7 @@
 
 import capnp  # pylint: disable=unused-import
 import logging_capnp
+import mmap
 import os
 import re
 import struct
@@ -14,8 +15,11 @@ MAX_LOG_FILE_SIZE = 1024 * 1024 * 1024
 
 _I_SIZE = struct.calcsize('I')
 _qI_SIZE = struct.calcsize('qI')
+_TIME_BOUNDS_FORMAT = 'qqqq'
 _PAGE_SIZE = 1000
 _ONE_BINARY = struct.pack('I', 1)
+_REQUEST_ID_SIZE = 10
+_RIDX_ENTRY_SIZE = _REQUEST_ID_SIZE + _I_SIZE
 
 def readLogRecord(handle, parse=False):
   buf = handle.read(_I_SIZE)
@@ -31,6 +35,35 @@ def calculateOffset(log_file_id, position):
 def parseOffset(offset):
   return struct.unpack('HI', offset)
 
+def buildSortedIndex(requestIdIndexFilename, sortedIndexFilename):
+  # The sorted index holds the same entries as the request ID index, ordered
+  # by request ID. The sort is stable, so the first entry for a request ID is
+  # still the first one that was written.
+  with open(requestIdIndexFilename, 'rb') as fh:
+    buf = fh.read()
+  entries = [buf[i:i+_RIDX_ENTRY_SIZE]
+             for i in xrange(0, len(buf) - _RIDX_ENTRY_SIZE + 1, _RIDX_ENTRY_SIZE)]
+  entries.sort(key=lambda entry: entry[:_REQUEST_ID_SIZE])
+  temporaryFilename = '%s.tmp' % sortedIndexFilename
+  with open(temporaryFilename, 'wb') as fh:
+    fh.write(''.join(entries))
+  os.rename(temporaryFilename, sortedIndexFilename)
+
+def findInSortedIndex(index, count, requestId):
+  lo, hi = 0, count
+  while lo < hi:
+    mid = (lo + hi) // 2
+    start = mid * _RIDX_ENTRY_SIZE
+    if index[start:start+_REQUEST_ID_SIZE] < requestId:
+      lo = mid + 1
+    else:
+      hi = mid
+  start = lo * _RIDX_ENTRY_SIZE
+  if lo == count or index[start:start+_REQUEST_ID_SIZE] != requestId:
+    return None
+  position, = struct.unpack_from('I', index, start + _REQUEST_ID_SIZE)
+  return position
+
 class AppLogFile(object):
   MODE_SEARCH = 1
   MODE_WRITE = 2
@@ -41,25 +74,50 @@ class AppLogFile(object):
     self._filename = os.path.join(root_path, 'logservice_%s.%s.log' % (app_id, log_file_id))
     self._requestIdIndexFilename = '%s.ridx' % self._filename
     self._pageIndexFilename = '%s.pidx' % self._filename
+    self._sortedIndexFilename = '%s.sidx' % self._filename
+    self._timeBoundsFilename = '%s.tidx' % self._filename
+    # The smallest and largest startTime and endTime in the file, if known.
+    self._timeBounds = None
     if mode == AppLogFile.MODE_WRITE:
       self._handle = open(self._filename, 'ab')
       self._pageIndexHandle = open(self._pageIndexFilename, 'ab')
       self._requestIdIndexHandle = open(self._requestIdIndexFilename, 'ab')
+      # The writer's request IDs are looked up in memory until it rolls over.
+      self._requestIdPositions = dict()
     else:
       self._handle = open(self._filename, 'rb')
       self._pageIndexHandle = open(self._pageIndexFilename, 'rb')
       self._requestIdIndexHandle = open(self._requestIdIndexFilename, 'rb')
+      # Files from before sorted indexes existed get one the first time they
+      # are opened for searching.
+      if not os.path.exists(self._sortedIndexFilename):
+        buildSortedIndex(self._requestIdIndexFilename, self._sortedIndexFilename)
+      self._sortedIndexHandle = open(self._sortedIndexFilename, 'rb')
+      # Files that were not closed cleanly have no time bounds, and are always
+      # searched.
+      if os.path.exists(self._timeBoundsFilename):
+        with open(self._timeBoundsFilename, 'rb') as fh:
+          self._timeBounds = list(struct.unpack(_TIME_BOUNDS_FORMAT, fh.read()))
     self._indexSize = self._requestIdIndexHandle.tell() / 14
 
   def close(self):
+    if self.mode == AppLogFile.MODE_WRITE and self._timeBounds:
+      with open(self._timeBoundsFilename, 'wb') as fh:
+        fh.write(struct.pack(_TIME_BOUNDS_FORMAT, *self._timeBounds))
     self._handle.close()
     self._pageIndexHandle.close()
     self._requestIdIndexHandle.close()
+    if self.mode == AppLogFile.MODE_SEARCH:
+      self._sortedIndexHandle.close()
 
   def delete(self):
     os.unlink(self._filename)
     os.unlink(self._requestIdIndexFilename)
     os.unlink(self._pageIndexFilename)
+    if os.path.exists(self._sortedIndexFilename):
+      os.unlink(self._sortedIndexFilename)
+    if os.path.exists(self._timeBoundsFilename):
+      os.unlink(self._timeBoundsFilename)
 
   def write(self, buf):
     if self.mode != AppLogFile.MODE_WRITE:
@@ -73,51 +131,66 @@ class AppLogFile(object):
     # Index the new logline
     if requestLog.requestId:
       self._requestIdIndexHandle.write('%s%s' % (requestLog.requestId, struct.pack('I', position)))
+      self._requestIdPositions.setdefault(requestLog.requestId, position)
     if self._indexSize % _PAGE_SIZE == 0:
       self._pageIndexHandle.write(struct.pack('qI', requestLog.endTime, position))
       self._pageIndexHandle.flush()
       self._handle.flush()
       self._requestIdIndexHandle.flush()
     self._indexSize += 1
+    startTime, endTime = requestLog.startTime, requestLog.endTime
+    if self._timeBounds is None:
+      self._timeBounds = [startTime, startTime, endTime, endTime]
+    else:
+      bounds = self._timeBounds
+      bounds[0], bounds[1] = min(bounds[0], startTime), max(bounds[1], startTime)
+      bounds[2], bounds[3] = min(bounds[2], endTime), max(bounds[3], endTime)
     return position, requestLog
 
+  def overlaps(self, startTime, endTime):
+    # Whether the file can hold records that a search with these bounds would
+    # include. Zero means a bound is not set.
+    if self._timeBounds is None:
+      return True
+    minStartTime, maxStartTime, minEndTime, maxEndTime = self._timeBounds
+    if startTime and maxStartTime < startTime:
+      return False
+    if endTime and minEndTime > endTime:
+      return False
+    return True
+
   def get(self, requestIds):
     if self.mode == AppLogFile.MODE_WRITE:
-      self._requestIdIndexHandle.flush()
       self._handle.flush()
-      index_handle = open(self._requestIdIndexFilename, 'rb')
       handle = open(self._filename, 'rb')
+      lookup = self._requestIdPositions.get
+      index = None
     else:
-      index_handle = self._requestIdIndexHandle
       handle = self._handle
+      count = os.fstat(self._sortedIndexHandle.fileno()).st_size / _RIDX_ENTRY_SIZE
+      if not count:
+        return
+      index = mmap.mmap(self._sortedIndexHandle.fileno(), 0, access=mmap.ACCESS_READ)
+      lookup = lambda requestId: findInSortedIndex(index, count, requestId)
     try:
-      index_handle.seek(0)
-      while True:
-        buf = index_handle.read(14000)
-        if not buf:
-          break
-        i = 0
-        while True:
-          key = buf[i:i+10]
-          if not key:
-            break
-          if key in requestIds:
-            requestIds.remove(key)
-            position, = struct.unpack('I', buf[i+10:i+14])
-            handle.seek(position)
-            record = readLogRecord(handle, False)
-            yield key, record
-            if not requestIds:
-              break
-          i += 14
-          if not requestIds:
-            break
+      for key in list(requestIds):
+        position = lookup(key)
+        if position is None:
+          continue
+        requestIds.remove(key)
+        handle.seek(position)
+        record = readLogRecord(handle, False)
+        yield key, record
     finally:
       if self.mode == AppLogFile.MODE_WRITE:
         handle.close()
-        index_handle.close()
+      else:
+        index.close()
 
-  def iterpages(self):
+  def iterpages(self, endTime=0, position=None):
+    # Yields (endTime, position, end position) for each page, newest first,
+    # starting from the last page that begins at or before the given endTime
+    # and position. The end position of the newest page is -1.
     if self.mode == AppLogFile.MODE_WRITE:
       self._pageIndexHandle.flush()
       with open(self._pageIndexFilename, 'rb') as fh:
@@ -125,34 +198,64 @@ class AppLogFile(object):
     else:
       self._pageIndexHandle.seek(0)
       pages = self._pageIndexHandle.read()
-    for pos in xrange(len(pages)-_qI_SIZE, -1, -_qI_SIZE):
-      yield struct.unpack('qI', pages[pos:pos+_qI_SIZE])
-
-  def iterrecords(self, start_position, end_position):
+    count = len(pages) / _qI_SIZE
+    # Pages are written in order, so both their end times and positions
+    # ascend.
+    lo, hi = 0, count
+    while lo < hi:
+      mid = (lo + hi) // 2
+      pageEndTime, pagePosition = struct.unpack_from('qI', pages, mid * _qI_SIZE)
+      if ((endTime and pageEndTime > endTime) or
+          (position is not None and pagePosition > position)):
+        hi = mid
+      else:
+        lo = mid + 1
+    if lo == count:
+      nextPosition = -1
+    else:
+      _, nextPosition = struct.unpack_from('qI', pages, lo * _qI_SIZE)
+    for index in xrange(lo - 1, -1, -1):
+      pageEndTime, pagePosition = struct.unpack_from('qI', pages, index * _qI_SIZE)
+      yield pageEndTime, pagePosition, nextPosition
+      nextPosition = pagePosition
+
+  def iterbuffers(self, start_position, end_position):
+    # Yields the position and undecoded bytes of each record in the span. The
+    # span is memory mapped rather than read, so only the records that are
+    # yielded get copied no matter how large the span is.
     if self.mode == AppLogFile.MODE_WRITE:
       self._handle.flush()
       handle = open(self._filename, 'rb')
     else:
       handle = self._handle
     try:
-      handle.seek(start_position)
-      if end_position != -1:
-        buf = handle.read(end_position - start_position)
-      else:
-        buf = handle.read()
+      size = os.fstat(handle.fileno()).st_size
+      if end_position == -1 or end_position > size:
+        end_position = size
+      if start_position >= end_position:
+        return
+      # Mappings must start on an allocation boundary.
+      map_start = start_position - start_position % mmap.ALLOCATIONGRANULARITY
+      view = mmap.mmap(handle.fileno(), end_position - map_start,
+                       access=mmap.ACCESS_READ, offset=map_start)
+      try:
+        pos = start_position - map_start
+        end = end_position - map_start
+        while pos + _I_SIZE <= end:
+          length, = struct.unpack_from('I', view, pos)
+          if pos + _I_SIZE + length > end:
+            break
+          yield map_start + pos, view[pos+_I_SIZE:pos+_I_SIZE+length]
+          pos += _I_SIZE + length
+      finally:
+        view.close()
     finally:
       if self.mode == AppLogFile.MODE_WRITE:
         handle.close()
-    pos = 0
-    while pos < len(buf):
-      buf2 = buf[pos:pos+_I_SIZE]
-      pos += _I_SIZE
-      if not buf2:
-        break
-      length, = struct.unpack('I', buf2)
-      buf2 = buf[pos:pos+length]
-      pos += length
-      yield buf2, logging_capnp.RequestLog.from_bytes(buf2)
+
+  def iterrecords(self, start_position, end_position):
+    for _, buf in self.iterbuffers(start_position, end_position):
+      yield buf, logging_capnp.RequestLog.from_bytes(buf)
 
 class AppRegistry(object):
 
@@ -204,10 +307,21 @@ class AppRegistry(object):
       for requestId, record in alf.get(lookupRequestIds):
         yield requestId, record
 
-  def iterpages(self):
-    for alf in self.iter():
-      for endTime, position in alf.iterpages():
-         yield endTime, position, alf
+  def iterpages(self, startTime=0, endTime=0, offset=None):
+    if offset:
+      offsetLogFileId, offsetPosition = parseOffset(offset)
+    # Walk from the newest file to the oldest, skipping files that cannot
+    # hold matching records.
+    for alf in [self._writer] + self._log_files[::-1]:
+      if offset and alf.log_file_id > offsetLogFileId:
+        continue
+      if not alf.overlaps(startTime, endTime):
+        continue
+      position = None
+      if offset and alf.log_file_id == offsetLogFileId:
+        position = offsetPosition
+      for pageEndTime, pagePosition, endPosition in alf.iterpages(endTime, position):
+        yield pageEndTime, pagePosition, endPosition, alf
 
   def registerFollower(self, protocol, query):
     self._followers[protocol] = query
@@ -294,26 +408,17 @@ class Protocol(protocol.Protocol):
       query_log_file_id, query_position = parseOffset(query.offset)
     oldestRecord = None
     start = time.time()
-    previousALF = None
-    previousPosition = -1
-    for endTime, position, alf in self.app_registry.iterpages():
-      if query.endTime and query.endTime < endTime:
-        continue
-      if query.offset:
-        if alf.log_file_id > query_log_file_id:
-          continue
-        if alf.log_file_id == query_log_file_id and position > query_position:
-          continue
-      end_position = previousPosition if alf == previousALF else -1
-      for buf, record in alf.iterrecords(position, end_position):
+    pages = self.app_registry.iterpages(query.startTime, query.endTime, query.offset)
+    for endTime, position, end_position, alf in pages:
+      for record_position, buf in alf.iterbuffers(position, end_position):
+        # Records are stored at the position their offset refers to, so the
+        # offset can be checked before decoding.
+        if (query.offset and alf.log_file_id == query_log_file_id and
+            record_position >= query_position):
+          break
+        record = logging_capnp.RequestLog.from_bytes(buf)
         if not oldestRecord or oldestRecord.startTime > record.startTime:
           oldestRecord = record
-        if query.endTime and query.endTime < endTime:
-          break
-        if query.offset:
-          log_file_id, position = parseOffset(record.offset)
-          if log_file_id == query_log_file_id and position >= query_position:
-            break
         if query.minimumLogLevel:
           include = False
           for appLog in record.appLogs:
@@ -327,7 +432,7 @@ class Protocol(protocol.Protocol):
         if query.startTime and query.startTime > record.startTime:
           continue
         results.append((buf, record))
-      if query.startTime and oldestRecord.endTime < query.startTime:
+      if query.startTime and oldestRecord and oldestRecord.endTime < query.startTime:
         break
       if len(results) >= query.count:
         break
@@ -335,8 +440,6 @@ class Protocol(protocol.Protocol):
         break
       if time.time() - start > 25:
         break
-      previousALF = alf
-      previousPosition = position
     results.sort(key=lambda entry: entry[1].endTime, reverse=query.reverse)
     self.sendQueryResult([b for b, _ in results])
 